@@ -13,31 +13,129 @@
 
 # import libraries
 import ftplib
-import decimal
 import os, sys
 import pandas as pd
 import numpy as np
 import datetime as dt
 from dateutil import relativedelta
 import zipfile
-import shutil
 import fnmatch as fn
 import calendar
 import time
-from tabulate import tabulate
+import resource
+import multiprocessing
+import multiprocessing.pool
+import io
+import zlib
+import struct
 from glob import glob
 
+# append only run log shared with the model run scripts, and the stage instrumentation they both use
+from PyANUClimate_log import ANUClimateLog, ANUClimateRunHistory, metricsFor, instrumented, stageOutput, prepColumns, stageColumns
+# opt in stage profiling (ANUCLIMATE_PROFILE or --profile)
+from PyANUClimate_profile import profileHooks
+
+
+def fileWorker(args):
+    '''
+    Process pool worker for compileLoop - calls an ANUClimateAuto file method on one bomdat file
+    (module level function as bound methods can't be pickled by multiprocessing in python 2)
+
+    args:
+    * args - tuple of (ANUClimateAuto instance, method name, fname, tuple of method args)
+
+    returns:
+    result of the method call
+    '''
+    anc,method,fname,methodArgs = args
+    return getattr(anc,method)(fname,*methodArgs);
+
+
+# open ZipFile objects, keyed by (process id, zip path) so forked pool workers never share a file handle
+zipCache = {}
+
+def zipMember(zipName,member):
+    '''
+    Opens a member of a BoM zip archive for reading without extracting it to disk
+
+    args:
+    * zipName - str path of the zip archive
+    * member - str name of the archive member
+
+    returns:
+    file like object of the member
+    '''
+    key = (os.getpid(),zipName)
+    if key not in zipCache:
+        zipCache[key] = zipfile.ZipFile(zipName,'r')
+    return zipCache[key].open(member);
+
+
+# .dat writer thread pools, keyed by (process id, threads) and reused across reformat calls (a pool costs more to
+# start than a small .dat file takes to write), kept out of ANUClimateAuto so instances still pickle for mapFiles
+writerPools = {}
+
+def writerPool(numWriters):
+    '''
+    Thread pool for writing .dat files, started on first use in each process
+
+    args:
+    * numWriters - int number of threads
+
+    returns:
+    multiprocessing.pool.ThreadPool
+    '''
+    key = (os.getpid(),numWriters)
+    if key not in writerPools:
+        writerPools[key] = multiprocessing.pool.ThreadPool(numWriters)
+    return writerPools[key];
+
+
 class ANUClimateAuto(object):
     def __init__(self):
 
-        self.hostName = 'ftp.bom.gov.au'
+        # BoM ftp site (ANUCLIMATE_FTP_HOST/ANUCLIMATE_FTP_PORT point downloadFTP at another server, eg a local test server)
+        self.hostName = os.environ.get('ANUCLIMATE_FTP_HOST','ftp.bom.gov.au')
+        self.ftpPort = int(os.environ.get('ANUCLIMATE_FTP_PORT',21))
+        # download attempts, secs to wait before the first retry (doubles each retry) and socket timeout in secs
+        self.ftpRetries = 5
+        self.ftpBackoff = 60
+        self.ftpTimeout = 120
+        # secs after the first attempt that retries may start in, so a failing download gives up well inside the 30 mins
+        # between this job (14:35) and the transfer (15:05)
+        self.ftpRetryTime = 600
         self.hostPath = '/anon2/home/ncc/srds/Scheduled_Jobs/DS082_ANU/'
         self.destPath = '/srv/ANUClimate_auto/download/'
         self.zipPath = '/srv/ANUClimate_auto/unzip/'
         self.logPath = '/srv/ANUClimate_auto/log/'
         self.backupPath = '/srv/ANUClimate_auto/backup/'
         self.nodata = '-99.9'
+        # rows per block written by to_fwf
+        self.fwfBlock = 10000
+        # threads writing a reformat function's .dat files concurrently (1 = serial)
+        self.numWriters = int(os.environ.get('ANUCLIMATE_WRITERS',4))
+        # .dat files written by the last writeFiles call (the artefacts checkpointed for a reformat stage)
+        self.written = []
+        # running instrumented stages (innermost last) and the last one to finish, see PyANUClimate_log.instrumented
+        self.stages = []
+        self.stage = None
+        # script label of the node_exporter metrics file (see metrics), and the unix time BoM published the archive
+        # downloadFTP last fetched (ftp MDTM, None if not known)
+        self.metricsScript = 'prep'
+        self.publishTime = None
+        # station and date fields are kept as small ints in the compiled df, zero padded strings are only rendered in the .dat files
+        self.keyTypes = {'Station_ID':np.int32,'Year':np.int16,'Month':np.int8,'Day':np.int8}
         self.state = 0
+        # number of processes used by compileLoop to open bomdat files (1 = serial)
+        self.numWorkers = int(os.environ.get('ANUCLIMATE_WORKERS',1))
+        # extract the BoM zip to zipPath as before (1) or read station files straight from the archive (0, no unzip folder)
+        self.extractZip = int(os.environ.get('ANUCLIMATE_UNZIP',1))
+        # observed values (Prec_mm, Evap_mm, Tmax_C, Tmin_C) in the compiled df - float64, or float32 with ANUCLIMATE_LEAN=1
+        self.valueType = np.float32 if int(os.environ.get('ANUCLIMATE_LEAN',0)) else np.float64
+        # use the per archive date index so alpha compileLoop only reads the target day's rows
+        self.useIndex = True
+        # reuse the cleaned rows (and date index entries) of station files unchanged since they were last compiled
+        self.useCache = True
         self.baseDir = '/srv/ANUClimate_auto/processed/fenner'
         # varDict = df col name:[var name for file[0],alpha daily files location[1],beta month of days files location[2], stable month of days files location[3],beta monthly files location[4], stable monthly files location[5]]
         self.varDict = {'Prec_mm':['rain',self.baseDir+'/rain_day_v2_0/alpha/dat/bomdat/',self.baseDir+'/rain_day_v2_0/beta/dat/bomdat/',self.baseDir+'/rain_day_v2_0/stable/dat/bomdat/',self.baseDir+'/rain_mth_v2_0/beta/dat/bomdat/',self.baseDir+'/rain_mth_v2_0/stable/dat/bomdat/'],
@@ -67,18 +165,172 @@ class ANUClimateAuto(object):
     def to_fwf(self,df, fname, type):
         '''
         Function to call from within reformat functions to output fixed width file format .dat files for ANUClimate.
+        Writes the layout tabulate(df, tablefmt="plain") used to (index then columns, two spaces apart, int and float
+        columns right aligned, text left aligned) with one printf row format over the preformatted columns, streamed
+        to the file a block of rows at a time
         args:
         * df - pandas dataframe
         * fname - output filename
-        * type - str of output file type (one of 'normal','pw' or 'fd')
+        * type - str of output file type (one of 'normal' or 'pw')
         '''
-        if type == 'normal':
-            content = tabulate(df, tablefmt="plain",floatfmt=".1f")
-        elif type == 'pw':
-            content = tabulate(df, tablefmt="plain",floatfmt=".3f")
-        open(fname, "w").write(content)
-        
-    
+        floatfmt = {'normal':'.1f','pw':'.3f'}[type]
+        specs = []
+        cols = []
+        # columns as tabulate saw them, ints in an all numeric df are numpy scalars it formats as floats
+        vals = df.values
+        if vals.dtype.kind in 'iub':
+            vals = vals.astype(np.float64)
+        for values in [df.index.values]+[vals[:,i] for i in range(vals.shape[1])]:
+            spec,col = self.fwfColumn(values,floatfmt)
+            specs.append(spec)
+            cols.append(col)
+        rowFmt = '  '.join(specs)
+        # rows end without padding (only possible when the last column isn't a right aligned float)
+        strip = not specs[-1].endswith(floatfmt)
+        with open(fname,'w') as fOut:
+            for i in range(0,df.index.size,self.fwfBlock):
+                rows = zip(*[col[i:i+self.fwfBlock] for col in cols])
+                if strip:
+                    block = '\n'.join([(rowFmt % row).rstrip() for row in rows])
+                else:
+                    block = '\n'.join([rowFmt % row for row in rows])
+                fOut.write(block if i == 0 else '\n'+block)
+
+
+    def fwfColumn(self,values,floatfmt):
+        '''
+        Function to call from within to_fwf to type and preformat one column the way tabulate does: int if every
+        value is an int (or a str int() accepts, kept as is), float if every value is a number (or a str float()
+        accepts, formatted with floatfmt), otherwise text
+
+        args:
+        * values - np array of the column's values
+        * floatfmt - str format spec for float columns (eg '.1f')
+
+        returns:
+        * spec - str printf spec for the column, padded to the width of its widest value
+        * col - list of the column's values to apply spec to
+        '''
+        if values.size == 0:
+            return '%s',[];
+        if values.dtype.kind in 'iu':
+            colType = 'int'
+        elif values.dtype.kind == 'f':
+            colType = 'float'
+        else:
+            colType = self.fwfType(values)
+        # missing values are written blank
+        if colType in ('none','bool','text'):
+            col = ['' if x is None else str(x).strip() for x in values]
+            return '%-'+str(max([len(x) for x in col]))+'s',col;
+        if colType == 'int':
+            col = ['' if x is None else str(x) for x in values]
+            return '%'+str(max([len(x) for x in col]))+'s',col;
+        data = np.array([np.nan if x is None else x for x in values],dtype=object).astype(np.float64) if values.dtype.kind == 'O' else values.astype(np.float64)
+        if np.isfinite(data).all() and np.abs(data).max() < 1e50:
+            width = max(len(format(data.max(),floatfmt)),len(format(data.min(),floatfmt)))
+            return '%'+str(width)+floatfmt,data.tolist();
+        # nan/inf/blank (and %f's 1e50 switch to %g) go through format, padded to line up with the decimal points
+        pad = ' '*(int(floatfmt[1:-1])+1) if np.isfinite(data).any() else ''
+        col = [format(x,floatfmt) if np.isfinite(x) else ('' if y is None else format(x,floatfmt))+pad for x,y in zip(data.tolist(),values)]
+        return '%'+str(max([len(x) for x in col]))+'s',col;
+
+
+    def fwfType(self,values):
+        '''
+        Function to call from within fwfColumn - type of an object column as tabulate infers it, the most general
+        of its values' types (none < bool < int < float < text)
+
+        args:
+        * values - np object array of the column's values
+
+        returns:
+        * str 'none', 'bool', 'int', 'float' or 'text'
+        '''
+        ranks = ['none','bool','int','float','text']
+        rank = 0
+        strs = []
+        for x in set(map(type,values)):
+            if x is bool:
+                rank = max(rank,1)
+            elif x in (int,long):
+                rank = max(rank,2)
+            elif issubclass(x,basestring):
+                strs.append(x)
+            elif x is not type(None):
+                # numpy scalars and other numbers count as floats
+                rank = max(rank,3)
+        if strs:
+            strVals = [x for x in values if isinstance(x,basestring) and x not in ('True','False')]
+            if len(strVals) < len([x for x in values if isinstance(x,basestring)]):
+                rank = max(rank,1)
+            try:
+                [int(x) for x in strVals]
+                rank = max(rank,2)
+            except (ValueError,TypeError):
+                rank = 3
+        if rank >= 3:
+            try:
+                data = np.array([np.nan if x is None else x for x in values],dtype=object).astype(np.float64)
+            except (ValueError,TypeError):
+                return 'text';
+            # str nan/inf only count as numbers spelt nan, inf or -inf
+            for x in values[~np.isfinite(data)]:
+                if isinstance(x,basestring) and x.lower() not in ('inf','-inf','nan'):
+                    return 'text';
+        return ranks[rank];
+
+
+    def writeFiles(self,jobs):
+        '''
+        Writes the .dat files queued by a reformat function - to_fwf for each job over a bounded thread pool of
+        self.numWriters threads, so formatting one file overlaps the disk writes of the others
+
+        args:
+        * jobs - list of (df, fname, type) to_fwf args
+
+        returns:
+        * writeTimes - list of (fname, secs to format and write) in jobs order
+        '''
+        self.written = []
+        if self.numWriters <= 1 or len(jobs) <= 1:
+            writeTimes = [self.writeFile(job) for job in jobs]
+        else:
+            writeTimes = writerPool(self.numWriters).map(self.writeFile,jobs,chunksize=1)
+        self.written = [x[0] for x in writeTimes]
+        stageOutput(self,rowsOut=sum(x[0].index.size for x in jobs),files=self.written,fileRows=dict((x[1],x[0].index.size) for x in jobs))
+        return writeTimes;
+
+
+    def writeFile(self,job):
+        '''
+        Function to call from within writeFiles - to_fwf for one job, timed
+
+        args:
+        * job - (df, fname, type) to_fwf args
+
+        returns:
+        * fname, secs to format and write
+        '''
+        start = time.time()
+        self.to_fwf(*job)
+        return job[1],time.time() - start;
+
+
+    def writeComment(self,comment,writeTimes):
+        '''
+        Adds per file write times to a reformat function's log comment
+
+        args:
+        * comment - str comment
+        * writeTimes - list of (fname, secs) from writeFiles
+
+        returns:
+        * str comment with ' - write secs: <file> <secs>, ...' appended (comment as is if nothing was written)
+        '''
+        if len(writeTimes) == 0:
+            return comment;
+        return comment+' - write secs: '+', '.join([os.path.basename(x)+' '+str(round(secs,4)) for x,secs in writeTimes]);
 
 
     # date string finder
@@ -175,9 +427,15 @@ class ANUClimateAuto(object):
         return outStr,timing,self.state,comment;
         
         
+    @instrumented
     def downloadFTP(self,fHandle):
         '''
-        Connects to BoM ftp site, makes dirs, downloads file and unzips it, writing a list of unzipped files in the backup dir
+        Connects to BoM ftp site, makes dirs, downloads file and unzips it (if self.extractZip), writing a list of zipped files in the backup dir
+
+        The zip is downloaded to a .part file and a dropped connection resumes from its current size (ftp REST), with up
+        to self.ftpRetries attempts, waiting self.ftpBackoff secs (doubling) between them. No retry starts (or waits) past
+        self.ftpRetryTime secs from the first attempt. The zip is only moved into place once zipCheck passes, and station
+        files are indexed by scanZip as they arrive (if self.useIndex). Failed attempts are listed in the comment
 
         args:
         * fHandle - str used from ANUClimateGetDateString func
@@ -187,55 +445,111 @@ class ANUClimateAuto(object):
         '''
         start = time.time()
         try:
-            # establish ftp connection and move to correct folder
-            ftp = ftplib.FTP(self.hostName)
-            ftp.login()
-            ftp.cwd(self.hostPath)
             # find correct file on ftp server and create vars for folder names
             fName = 'DS082_'+fHandle+'.zip'
             dirName = self.destPath+fHandle
             zipName = self.zipPath+fHandle
             listName = self.backupPath+fHandle
+            partName = dirName+'/'+fName+'.part'
             # make folders
             try:
                 os.makedirs(dirName)
             except:
                 pass
-            try:
-                os.makedirs(zipName)
-            except:
-                pass
+            if self.extractZip:
+                try:
+                    os.makedirs(zipName)
+                except:
+                    pass
             try:
                 os.makedirs(listName)
             except:
                 pass
-            # create zip file and download
-            zFile = open(dirName+'/'+fName,'wb')
-            remoteSize = ftp.size(fName)
-            ftp.retrbinary('RETR '+fName,zFile.write)
-            zFile.close()
-            localInfo = os.stat(dirName+'/'+fName)
-            if str(localInfo.st_size)!=str(remoteSize):
+            # download (resuming any partial file), indexing members on a background thread as they complete
+            newScan = lambda: {'offset':0,'size':0,'need':30,'stream':self.useIndex,'jobs':[]}
+            scan = newScan()
+            pool = multiprocessing.pool.ThreadPool(1) if self.useIndex else None
+            ok = False
+            # why each failed attempt failed, for the logged comment
+            failures = []
+            attempts = 0
+            for attempt in range(self.ftpRetries):
+                if attempt != 0:
+                    # back off, but not past the retry time limit
+                    wait = min(self.ftpBackoff*2**(attempt-1),start+self.ftpRetryTime-time.time())
+                    if wait < 0:
+                        failures.append('retry time limit of '+str(self.ftpRetryTime)+' secs reached')
+                        break
+                    time.sleep(wait)
+                attempts += 1
+                ftp = None
+                try:
+                    ftp = self.ftpConnect()
+                    remoteSize = ftp.size(fName)
+                    try:
+                        self.publishTime = calendar.timegm(time.strptime(ftp.sendcmd('MDTM '+fName)[4:18],'%Y%m%d%H%M%S'))
+                    except (ftplib.all_errors+(ValueError,)):
+                        self.publishTime = None
+                    localSize = os.path.getsize(partName) if os.path.isfile(partName) else 0
+                    if localSize > remoteSize:
+                        # partial file isn't from this archive, start again
+                        os.remove(partName)
+                        scan = newScan()
+                        localSize = 0
+                    scan['size'] = localSize
+                    if localSize < remoteSize:
+                        zFile = open(partName,'ab')
+                        def write(block):
+                            zFile.write(block)
+                            scan['size'] += len(block)
+                            if scan['stream'] and scan['size'] >= scan['need']:
+                                zFile.flush()
+                                self.scanZip(partName,scan,pool)
+                        try:
+                            ftp.retrbinary('RETR '+fName,write,rest=localSize if localSize != 0 else None)
+                        finally:
+                            zFile.close()
+                    ftp.quit()
+                except ftplib.all_errors as e:
+                    failures.append('attempt '+str(attempt+1)+' '+type(e).__name__+' '+str(e))
+                    continue
+                finally:
+                    # a failed attempt leaves the control connection open (quit is skipped)
+                    if ftp is not None:
+                        ftp.close()
+                ok,check = self.zipCheck(fHandle,partName,remoteSize,scan)
+                if ok:
+                    break
+                # corrupt download, start again from scratch
+                failures.append('attempt '+str(attempt+1)+' rejected, '+check)
+                os.remove(partName)
+                scan = newScan()
+            if pool is not None:
+                pool.close()
+                pool.join()
+            if not ok:
                 self.state = 1
-                comment = 'Size check failed'
-            else:
-                pass
+                timing = time.time() - start
+                return timing,self.state,'FTP failed after '+str(attempts)+' attempts: '+'; '.join(failures);
+            os.rename(partName,dirName+'/'+fName)
+            stageOutput(self,files=[dirName+'/'+fName])
             # move to download folder and extract to unzip folder
             os.chdir(dirName)
-            try:
-                zipFile = zipfile.ZipFile(dirName+'/'+fName,'r')
+            zipFile = zipfile.ZipFile(dirName+'/'+fName,'r')
+            # otherwise compileLoop reads the station files directly from the zip
+            if self.extractZip:
                 zipFile.extractall(zipName)
-            except Exception as e:
-                self.state = 1
-                comment = 'Unzip failed '+str(e)
             # make a list of all downloaded files
             f = open(listName+'/'+fHandle+'.txt','w')
             for fname in zipFile.namelist():
                 f.write(fname+',\n')
             f.close()
+            zipFile.close()
             # set state
             self.state = 0
             comment = 'FTP success for '+str(fHandle)
+            if len(failures) != 0:
+                comment += ' on attempt '+str(attempts)+' ('+'; '.join(failures)+')'
         except Exception as e:
             comment = str(e)
             self.state = 1
@@ -244,6 +558,133 @@ class ANUClimateAuto(object):
         return timing,self.state,comment;
 
 
+    def ftpConnect(self):
+        '''
+        Opens an anonymous, binary mode ftp connection to hostName:ftpPort in hostPath
+
+        returns:
+        ftplib.FTP connection
+        '''
+        ftp = ftplib.FTP()
+        try:
+            ftp.connect(self.hostName,self.ftpPort,self.ftpTimeout)
+            ftp.login()
+            ftp.cwd(self.hostPath)
+            # SIZE is refused in ascii mode by some servers
+            ftp.voidcmd('TYPE I')
+        except:
+            ftp.close()
+            raise
+        return ftp;
+
+
+    def scanZip(self,partName,scan,pool):
+        '''
+        Reads the zip local file headers in a partly downloaded archive and queues each member whose data has fully
+        arrived on pool for indexMember. Stops streaming (leaving the index to loadIndex) for archives written with
+        data descriptors or zip64 sizes, as those don't give member sizes up front
+
+        args:
+        * partName - str path of the partial download
+        * scan - dict of scan state (offset of next header, bytes on disk, bytes needed to go on, stream flag, queued jobs)
+        * pool - ThreadPool to run indexMember on
+
+        returns:
+        nothing
+        '''
+        f = open(partName,'rb')
+        while scan['stream'] and scan['size'] >= scan['offset']+30:
+            f.seek(scan['offset'])
+            # signature, version, flags, method, time, date, crc, compressed size, size, name length, extra length
+            head = struct.unpack('<IHHHHHIIIHH',f.read(30))
+            if head[0] != 0x04034b50 or head[2] & 0x08 or head[7] == 0xffffffff:
+                # central directory reached (all members queued) or sizes not in the header
+                scan['stream'] = False
+                break
+            dataStart = scan['offset']+30+head[9]+head[10]
+            if scan['size'] < dataStart+head[7]:
+                scan['need'] = dataStart+head[7]
+                break
+            member = f.read(head[9])
+            if not isinstance(member,str):
+                member = member.decode('utf-8' if head[2] & 0x800 else 'cp437')
+            scan['jobs'].append(pool.apply_async(self.indexMember,(partName,member,dataStart,head[7],head[3],head[6])))
+            scan['offset'] = dataStart+head[7]
+            scan['need'] = scan['offset']+30
+        f.close()
+
+
+    def indexMember(self,partName,member,offset,csize,method,crc):
+        '''
+        Decompresses one member of a partly downloaded zip, checks its CRC and indexes it with indexData
+
+        args:
+        * partName - str path of the partial download
+        * member - str member name
+        * offset - int byte offset of the member data
+        * csize - int compressed size
+        * method - int zip compression method (0 stored, 8 deflated)
+        * crc - int CRC-32 from the local header
+
+        returns:
+        * tuple of (member, crc, index list) - index list is [] for non station files, None if the member failed
+        '''
+        try:
+            f = open(partName,'rb')
+            f.seek(offset)
+            data = f.read(csize)
+            f.close()
+            if method == 8:
+                data = zlib.decompress(data,-15)
+            elif method != 0:
+                return member,crc,None;
+            if zlib.crc32(data) & 0xffffffff != crc:
+                return member,crc,None;
+        except Exception:
+            return member,crc,None;
+        if not fn.fnmatch(os.path.basename(member),'DC02D_Data_*'):
+            return member,crc,[];
+        return member,crc,self.indexData(member,data);
+
+
+    def zipCheck(self,fHandle,partName,remoteSize,scan):
+        '''
+        Integrity check of a downloaded BoM zip - the size must match the server and every member must pass its CRC check
+        (done as members streamed in if scanZip got them all, otherwise with ZipFile.testzip). Saves the streamed date index
+
+        args:
+        * fHandle - str of BoM file identifier
+        * partName - str path of the downloaded file
+        * remoteSize - int size of the file on the ftp server
+        * scan - dict of scan state from downloadFTP
+
+        returns:
+        * bool of check passed and str comment
+        '''
+        if os.path.getsize(partName) != remoteSize:
+            return False,'Size check failed';
+        try:
+            zipFile = zipfile.ZipFile(partName,'r')
+        except Exception as e:
+            return False,'Zip check failed: '+str(e);
+        try:
+            results = [x.get() for x in scan['jobs']]
+            if dict((x[0],x[1]) for x in results if x[2] is not None) == dict((x.filename,x.CRC) for x in zipFile.infolist()):
+                # every member streamed and passed its CRC, so save the index built during the download
+                prefix = self.zipPath+fHandle+'/' if self.extractZip else ''
+                rows = [[prefix+member]+row[1:]+[crc] for member,crc,indexList in results for row in indexList]
+                self.saveIndex(fHandle,pd.DataFrame(rows,columns=['fname','date','offset','nbytes','rows','crc']))
+            else:
+                bad = zipFile.testzip()
+                if bad is not None:
+                    return False,'CRC check failed for '+str(bad);
+        except Exception as e:
+            return False,'Zip check failed: '+str(e);
+        finally:
+            zipFile.close()
+        return True,'Integrity check passed';
+
+
     def daysInMth(self,yrIn,mthIn):
         '''
         Function to check for number of days in month
@@ -275,13 +716,71 @@ class ANUClimateAuto(object):
     
         return daysInMth;
 
+
+    def peakRss(self):
+        '''
+        Peak resident memory of the run so far - the larger of this process and its largest finished child (compileLoop workers)
+
+        returns:
+        * float of peak rss in MB (ru_maxrss is in KB on linux)
+        '''
+        return round(max(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss)/1024.,1);
+
     ####################################################################################
     # FILE OPEN
     ####################################################################################
 
+    def cleanStr(self,col):
+        '''
+        Vectorized column cleaner - replaces white space only cells with np.nan and strips extra whitespace
+        from the remaining strings (numeric columns are returned unchanged)
+
+        args:
+        * col - pandas series of a raw BoM column
+
+        returns:
+        * col - cleaned series (all nan object columns are returned as float)
+        '''
+        if col.dtype != object:
+            return col
+        col = col.str.strip()
+        col = col.where(col.str.len() > 0)
+        return col.infer_objects();
+
+
+    def cleanNum(self,col):
+        '''
+        Vectorized numeric parser for BoM data fields - blank cells become np.nan, everything else float
+
+        args:
+        * col - pandas series of a raw BoM data column
+
+        returns:
+        * col - float64 series
+        '''
+        return pd.to_numeric(self.cleanStr(col)).astype(np.float64);
+
+
+    def qualityCheck(self,col,okQual):
+        '''
+        Vectorized quality flag check - flags are compared once per category rather than once per cell
+
+        args:
+        * col - pandas series of BoM quality flags (categorical or object)
+        * okQual - list of accepted quality flags
+
+        returns:
+        * boolean series, True where the stripped flag is in okQual
+        '''
+        if pd.api.types.is_categorical_dtype(col):
+            cats = col.cat.categories
+            return col.isin(cats[cats.astype(str).str.strip().isin(okQual)]);
+        return col.astype(str).str.strip().isin(okQual);
+
+
     # df compiler
     # testing dropping comparison to see why some rows are dropped from final df
-    def fileOpen(self,fname,dtStr,dStream):
+    def fileOpen(self,fname,dtStr,dStream,zipName=None):
         '''
         Daily operations function for use with cron job to store daily bomdat input files
 
@@ -292,9 +791,58 @@ class ANUClimateAuto(object):
 
         Args:
         fname - a string representing the path/filename to open and process
+        dtStr - str of date to subset (None cleans every row of the file, for the cleaned rows cache)
+        dStream - str of datastream (None with dtStr None)
+        zipName - (optional) str path of the BoM zip, if given fname is read as a member of the archive
+        '''
+        return self.fileClean(self.fileRead(fname,zipName),dtStr,dStream);
+
+
+    def fileOpenAll(self,fname,dateList,zipName=None):
+        '''
+        Single pass version of fileOpen for end of month runs - reads the BoM file once and subsets it for each datastream
+
+        args:
+        * fname - a string representing the path/filename to open and process
+        * dateList - list of [alpha,beta,stable] date strings from getDateString('all')
+        * zipName - (optional) str path of the BoM zip, if given fname is read as a member of the archive
+
+        returns:
+        * list of [alpha,beta,stable] dfs, as returned by fileOpen for each datastream
+        '''
+        return self.fileOpenRange(fname,zip(dateList,['alpha','beta','stable']),zipName);
+
+
+    def fileOpenRange(self,fname,dateStreams,zipName=None):
+        '''
+        Multi date version of fileOpen - reads the BoM file once and subsets it for each (date, datastream) pair
+
+        args:
+        * fname - a string representing the path/filename to open and process
+        * dateStreams - list of (dtStr, dStream) tuples
+        * zipName - (optional) str path of the BoM zip, if given fname is read as a member of the archive
+
+        returns:
+        * list of dfs in dateStreams order, as returned by fileOpen for each pair
+        '''
+        dfIn = self.fileRead(fname,zipName)
+        return [self.fileClean(dfIn,dtStr,dStream) for dtStr,dStream in dateStreams];
+
+
+    def fileRead(self,fname,zipName=None):
         '''
+        Reads a BoM DC02D file and cleans the station and date fields used to subset it in fileClean
+
+        args:
+        * fname - a string representing the path/filename to open
+        * zipName - (optional) str path of the BoM zip, if given fname is read as a member of the archive
 
+        returns:
+        * dfIn - df of all rows in the file
+        '''
         # set col parameters and import unzipped test file
+        # only the fields behind the varDict variables and the derived Temp_avg_C, Vapp_avg_hPa, SVap_avg_hPa and Vpd_avg_hPa
+        # are read, the 9am/3pm air, dew point, wet bulb and relative humidity fields never reached an output file
         usecols = ['Station Number',
                'Year',
                'Month',
@@ -312,22 +860,6 @@ class ANUClimateAuto(object):
                'Minimum temperature in 24 hours before 9am (local time) in Degrees C',
                'Quality of minimum temperature in 24 hours before 9am (local time)',
                'Days of accumulation of minimum temperature',
-               'Air temperature observation at 09 hours Local Time in Degrees C',
-               'Quality of air temperature observation at 09 hours Local Time',
-               'Air temperature observation at 15 hours Local Time in Degrees C',
-               'Quality of air temperature observation at 15 hours Local Time',
-               'Dew point temperature observation at 09 hours Local Time in Degrees C',
-               'Quality of dew point temperature observation at 09 hours Local Time',
-               'Dew point temperature observation at 15 hours Local Time in Degrees C',
-               'Quality of dew point temperature observation at 15 hours Local Time',
-               'Wet bulb temperature observation at 09 hours Local Time in Degrees C',
-               'Quality of wet bulb temperature observation at 09 hours Local Time',
-               'Wet bulb temperature observation at 15 hours Local Time in Degrees C',
-               'Quality of wet bulb temperature observation at 15 hours Local Time',
-               'Relative humidity for observation at 09 hours Local Time in percentage %',
-               'Quality of relative humidity for observation at 09 hours Local Time',
-               'Relative humidity for observation at 15 hours Local Time in percentage %',
-               'Quality of relative humidity for observation at 15 hours Local Time',
                'Vapour pressure at 09 hours Local Time in hPa',
                'Quality of vapour pressure at 09 hours Local Time',
                'Vapour pressure at 15 hours Local Time in hPa',
@@ -355,22 +887,6 @@ class ANUClimateAuto(object):
                    'Tmin_C', # Tmin = Min Temperature
                    'Tmin_Quality',
                    'Tmin_Accumulated_Days',
-                   'Temp_9am_C', # Temp = Air Temperature
-                   'Temp_9am_Quality',
-                   'Temp_3pm_C',
-                   'Temp_3pm_Quality',
-                   'DewP_9am_C', # DewP = Dew Point temperature
-                   'DewP_9am_Quality',
-                   'DewP_3pm_C',
-                   'DewP_3pm_Quality',
-                   'WetB_9am_C', # WetB = Wet Bulb temperature
-                   'WetB_9am_Quality',
-                   'WetB_3pm_C',
-                   'WetB_3pm_Quality',
-                   'RelH_9am_%', # RelH = Relative Humidity
-                   'RelH_9am_Quality',
-                   'RelH_3pm_%',
-                   'RelH_3pm_Quality',
                    'Vapp_9am_hPa', # Vapp = Vapour Pressure
                    'Vapp_9am_Quality',
                    'Vapp_3pm_hPa',
@@ -380,193 +896,178 @@ class ANUClimateAuto(object):
                    'SVap_3pm_hPa',
                    'SVap_3pm_Quality']
 
+        # quality flag columns are read as categoricals so whitespace cleaning only touches each distinct flag once
+        flagCols = [x for x in usecols if x.startswith('Quality')]
         nodata = '-99.9'
-        dfIn = pd.read_table(fname,sep=',',usecols=usecols)
+        if zipName:
+            fname = zipMember(zipName,fname)
+        dfIn = pd.read_table(fname,sep=',',usecols=usecols,dtype=dict.fromkeys(flagCols,'category'))
         dfIn.columns = headers
-        dfIn.Station_ID = [str(x).zfill(6) for x in dfIn.Station_ID]
 
-        # from http://stackoverflow.com/questions/13445241/replacing-blank-values-white-space-with-nan-in-pandas
-        dfIn = dfIn.applymap(lambda x: np.nan if isinstance(x, basestring) and x.isspace() else x)
+        # strip white space from station and date fields and fix types
+        for col,colType in self.keyTypes.items():
+            dfIn[col] = pd.to_numeric(self.cleanStr(dfIn[col])).astype(colType)
+        return dfIn;
 
-        # strip extra whitespace
-        dfIn = dfIn.applymap(lambda x: x.strip() if isinstance(x, basestring) else x)
-        
-        # fix type on year & month
-        dfIn.Day = [str(x).zfill(2) for x in dfIn.Day]
-        dfIn.Month = [str(x).zfill(2) for x in dfIn.Month]
-        dfIn.Year = [str(x) for x in dfIn.Year]
-        
+
+    def fileOpenIndexed(self,entryList,dtStr,dStream,zipName=None):
+        '''
+        Indexed version of fileOpen for the alpha datastream - only the header and the rows for dtStr are read from
+        each file, and the rows from all files in entryList are parsed and cleaned as one df
+
+        args:
+        * entryList - list of (fname, header bytes, row offset, row bytes) tuples from the loadIndex df
+        * dtStr - str of date to subset ('YYYY_MM_DD')
+        * dStream - str of datastream (normally 'alpha')
+        * zipName - (optional) str path of the BoM zip, if given fnames are read as members of the archive
+
+        returns:
+        * df - cleaned df indexed by primary_key, as per fileOpen
+        '''
+        # rows grouped by header line, in case any files have a different column layout
+        rowDict = {}
+        hdrList = []
+        for fname,hdrBytes,offset,nbytes in entryList:
+            if zipName:
+                # zip members can't seek, but decompression stops at the end of the target rows
+                data = zipMember(zipName,fname).read(offset+nbytes)
+                header,rows = data[:hdrBytes],data[offset:]
+            else:
+                f = open(fname,'rb')
+                header = f.read(hdrBytes)
+                f.seek(offset)
+                rows = f.read(nbytes)
+                f.close()
+            if not rows.endswith(b'\n'):
+                rows += b'\n'
+            if header not in rowDict:
+                rowDict[header] = []
+                hdrList.append(header)
+            rowDict[header].append(rows)
+        frames = [self.fileClean(self.fileRead(io.BytesIO(header+b''.join(rowDict[header]))),dtStr,dStream) for header in hdrList]
+        return pd.concat(frames);
+
+
+    def indexFile(self,fname,zipName=None):
+        '''
+        Scans a bomdat file (without parsing it) and records where the rows for each date are
+
+        args:
+        * fname - a string representing the path/filename (or zip member) to scan
+        * zipName - (optional) str path of the BoM zip, if given fname is read as a member of the archive
+
+        returns:
+        * list of [fname, date, offset, nbytes, rows] - one for the header line (date 'header')
+        and one per 'YYYY_MM_DD' date, offsets in bytes from the start of the file
+        '''
+        if zipName:
+            data = zipMember(zipName,fname).read()
+        else:
+            f = open(fname,'rb')
+            data = f.read()
+            f.close()
+        return self.indexData(fname,data);
+
+
+    def indexData(self,fname,data):
+        '''
+        indexFile on the contents of a bomdat file already in memory (eg a zip member streamed by downloadFTP)
+
+        args:
+        * fname - str name recorded in the index
+        * data - bytes of the whole file
+
+        returns:
+        * list of [fname, date, offset, nbytes, rows], see indexFile
+        '''
+        lines = data.splitlines(True)
+        if len(lines) == 0:
+            return [];
+        header = [x.strip() for x in lines[0].split(',')]
+        iYr,iMt,iDy = header.index('Year'),header.index('Month'),header.index('Day')
+        dateDict = {}
+        offset = len(lines[0])
+        for line in lines[1:]:
+            row = line.split(',',iDy+1)
+            if len(row) > iDy+1:
+                date = row[iYr].strip()+'_'+row[iMt].strip().zfill(2)+'_'+row[iDy].strip().zfill(2)
+                # rows are date ordered, if not the span covers the gap and fileClean drops the other dates
+                if date in dateDict:
+                    dateDict[date] = [dateDict[date][0],offset+len(line),dateDict[date][2]+1]
+                else:
+                    dateDict[date] = [offset,offset+len(line),1]
+            offset += len(line)
+        indexList = [[fname,'header',0,len(lines[0]),1]]
+        indexList += [[fname,date,x[0],x[1]-x[0],x[2]] for date,x in sorted(dateDict.items())]
+        return indexList;
+
+
+    def fileClean(self,dfIn,dtStr=None,dStream=None):
+        '''
+        Applies the quality flag and accumulated day checks to a df from fileRead, subset to the datastream date (only
+        that date's rows are cleaned, then fileSubset fills out the month) or every row if dtStr is None
+
+        args:
+        * dfIn - df from fileRead (not modified)
+        * dtStr - (optional) str of date to subset ('YYYY_MM_DD' for alpha, 'YYYY_MM' for beta and stable)
+        * dStream - (optional) str of datastream ('alpha','beta' or 'stable')
+
+        returns:
+        * df - cleaned df indexed by primary_key
+        '''
         # only propagate df for dStream and date
-        if dStream == 'alpha':
-            df = dfIn.loc[(dfIn.Year==dtStr.split('_')[0])&(dfIn.Month==dtStr.split('_')[1])&(dfIn.Day==dtStr.split('_')[-1])]
+        if dtStr is not None:
+            dtList = [int(x) for x in dtStr.split('_')]
+            keep = (dfIn.Year==dtList[0])&(dfIn.Month==dtList[1])
+            if dStream == 'alpha':
+                keep &= dfIn.Day==dtList[-1]
+            df = dfIn.loc[keep].copy()
         else:
-            df = dfIn.loc[(dfIn.Year==dtStr.split('_')[0])&(dfIn.Month==dtStr.split('_')[1])]
-            if df.Day.min()!='01' and df.index.size!=0:
-                station = df.Station_ID.iloc[0]
-                dayList = range(1,int(df.Day.min()))
-                dayList = [str(x).zfill(2) for x in dayList]
-                a = {'Station_ID':[station]*len(dayList),
-                      'Year':[dtStr.split('_')[0]]*len(dayList),
-                      'Month':[dtStr.split('_')[1]]*len(dayList),
-                      'Day':dayList,
-                     'Prec_mm':[np.nan]*len(dayList),
-                     'Prec_Days_of_Rain_within_Accumulation':[np.nan]*len(dayList),
-                     'Prec_Quality':[np.nan]*len(dayList),
-                     'Prec_Accumulated_Days':[np.nan]*len(dayList),
-                     'Evap_mm':[np.nan]*len(dayList),
-                     'Evap_Quality':[np.nan]*len(dayList),
-                     'Evap_Accumulated_Days':[np.nan]*len(dayList),
-                     'Tmax_C':[np.nan]*len(dayList),
-                     'Tmax_Quality':[np.nan]*len(dayList),
-                     'Tmax_Accumulated_Days':[np.nan]*len(dayList),
-                     'Tmin_C':[np.nan]*len(dayList),
-                     'Tmin_Quality':[np.nan]*len(dayList),
-                     'Tmin_Accumulated_Days':[np.nan]*len(dayList),
-                     'Temp_9am_C':[np.nan]*len(dayList),
-                     'Temp_9am_Quality':[np.nan]*len(dayList),
-                     'Temp_3pm_C':[np.nan]*len(dayList),
-                     'Temp_3pm_Quality':[np.nan]*len(dayList),
-                     'DewP_9am_C':[np.nan]*len(dayList),
-                     'DewP_9am_Quality':[np.nan]*len(dayList),
-                     'DewP_3pm_C':[np.nan]*len(dayList),
-                     'DewP_3pm_Quality':[np.nan]*len(dayList),
-                     'WetB_9am_C':[np.nan]*len(dayList),
-                     'WetB_9am_Quality':[np.nan]*len(dayList),
-                     'WetB_3pm_C':[np.nan]*len(dayList),
-                     'WetB_3pm_Quality':[np.nan]*len(dayList),
-                     'RelH_9am_%':[np.nan]*len(dayList),
-                     'RelH_9am_Quality':[np.nan]*len(dayList),
-                     'RelH_3pm_%':[np.nan]*len(dayList),
-                     'RelH_3pm_Quality':[np.nan]*len(dayList),
-                     'Vapp_9am_hPa':[np.nan]*len(dayList),
-                     'Vapp_9am_Quality':[np.nan]*len(dayList),
-                     'Vapp_3pm_hPa':[np.nan]*len(dayList),
-                     'Vapp_3pm_Quality':[np.nan]*len(dayList),
-                     'SVap_9am_hPa':[np.nan]*len(dayList),
-                     'SVap_9am_Quality':[np.nan]*len(dayList),
-                     'SVap_3pm_hPa':[np.nan]*len(dayList),
-                     'SVap_3pm_Quality':[np.nan]*len(dayList)}
-
-                newdf = pd.DataFrame.from_dict(a)
-                df = df.append(newdf)
+            df = dfIn.copy()
         
-        del dfIn
         #print 'second index size: '+str(df.index.size)
-        # fix Quality
-        # convert fields to str for removal comparison operation
-        df.Prec_Quality = [str(x) for x in df.Prec_Quality]
-        df.Evap_Quality = [str(x) for x in df.Evap_Quality]
-        df.Tmax_Quality = [str(x) for x in df.Tmax_Quality]
-        df.Tmin_Quality = [str(x) for x in df.Tmin_Quality]
-        df.Temp_9am_Quality = [str(x) for x in df.Temp_9am_Quality]
-        df.Temp_3pm_Quality = [str(x) for x in df.Temp_3pm_Quality]
-        df.DewP_9am_Quality = [str(x) for x in df.DewP_9am_Quality]
-        df.DewP_3pm_Quality = [str(x) for x in df.DewP_3pm_Quality]
-        df.WetB_9am_Quality = [str(x) for x in df.WetB_9am_Quality]
-        df.WetB_3pm_Quality = [str(x) for x in df.WetB_3pm_Quality]
-        df.RelH_9am_Quality = [str(x) for x in df.RelH_9am_Quality]
-        df.RelH_3pm_Quality = [str(x) for x in df.RelH_3pm_Quality]
-        df.Vapp_9am_Quality = [str(x) for x in df.Vapp_9am_Quality]
-        df.Vapp_3pm_Quality = [str(x) for x in df.Vapp_3pm_Quality]
-        df.SVap_9am_Quality = [str(x) for x in df.SVap_9am_Quality]
-        df.SVap_3pm_Quality = [str(x) for x in df.SVap_3pm_Quality]
-
-        # fix data fields (testing Assign rather than loop)
-        df.Prec_mm = [str(x) for x in df.Prec_mm]
-        df.Evap_mm = [str(x) for x in df.Evap_mm]
-        df.Tmax_C = [str(x) for x in df.Tmax_C]
-        df.Tmin_C = [str(x) for x in df.Tmin_C]
-        df.Vapp_9am_hPa = [str(x) for x in df.Vapp_9am_hPa]
-        df.Vapp_3pm_hPa = [str(x) for x in df.Vapp_3pm_hPa]
-        df.SVap_9am_hPa = [str(x) for x in df.SVap_9am_hPa]
-        df.SVap_3pm_hPa = [str(x) for x in df.SVap_3pm_hPa]
-        
-        
-        # fix data fields (testing Assign rather than loop)
-        df.Prec_mm = [np.nan if len(x.strip())==0 or x!=x or x == 'nan' else float(x) for x in df.Prec_mm]
-        df.Evap_mm = [np.nan if len(x.strip())==0 or x!=x or x == 'nan' else float(x) for x in df.Evap_mm]
-        df.Tmax_C = [np.nan if len(x.strip())==0 or x!=x or x == 'nan' else float(x) for x in df.Tmax_C]
-        df.Tmin_C = [np.nan if len(x.strip())==0 or x!=x or x == 'nan' else float(x) for x in df.Tmin_C]
-        df.Vapp_9am_hPa = [np.nan if len(x.strip())==0 or x!=x or x == 'nan' else float(x) for x in df.Vapp_9am_hPa]
-        df.Vapp_3pm_hPa = [np.nan if len(x.strip())==0 or x!=x or x == 'nan' else float(x) for x in df.Vapp_3pm_hPa]
-        df.SVap_9am_hPa = [np.nan if len(x.strip())==0 or x!=x or x == 'nan' else float(x) for x in df.SVap_9am_hPa]
-        df.SVap_3pm_hPa = [np.nan if len(x.strip())==0 or x!=x or x == 'nan' else float(x) for x in df.SVap_3pm_hPa]
-        
-        
-        # convert string nan to N for empty Quality flag cells
-        df.loc[(df.Prec_mm.notnull()) & (df.Prec_Quality.isnull()), 'Prec_Quality'] = 'N'
-        df.loc[(df.Evap_mm.notnull()) & (df.Evap_Quality.isnull()), 'Evap_Quality'] = 'N'
-        df.loc[(df.Tmax_C.notnull()) & (df.Tmax_Quality.isnull()), 'Tmax_Quality'] = 'N'
-        df.loc[(df.Tmin_C.notnull()) & (df.Tmin_Quality.isnull()), 'Tmin_Quality'] = 'N'
-        df.loc[(df.Temp_9am_C.notnull()) & (df.Temp_9am_Quality.isnull()), 'Temp_9am_Quality'] = 'N'
-        df.loc[(df.Temp_3pm_C.notnull()) & (df.Temp_3pm_Quality.isnull()), 'Temp_3pm_Quality'] = 'N'
-        df.loc[(df.DewP_9am_C.notnull()) & (df.DewP_9am_Quality.isnull()), 'DewP_9am_Quality'] = 'N'
-        df.loc[(df.DewP_3pm_C.notnull()) & (df.DewP_3pm_Quality.isnull()), 'DewP_3pm_Quality'] = 'N'
-        df.loc[(df.WetB_9am_C.notnull()) & (df.WetB_9am_Quality.isnull()), 'WetB_9am_Quality'] = 'N'
-        df.loc[(df.WetB_3pm_C.notnull()) & (df.WetB_3pm_Quality.isnull()), 'WetB_3pm_Quality'] = 'N'
-        df.loc[(df['RelH_9am_%'].notnull()) & (df.RelH_9am_Quality.isnull()), 'RelH_9am_Quality'] = 'N'
-        df.loc[(df['RelH_3pm_%'].notnull()) & (df.RelH_3pm_Quality.isnull()), 'RelH_3pm_Quality'] = 'N'
-        df.loc[(df.Vapp_3pm_hPa.notnull()) & (df.Vapp_9am_Quality.isnull()), 'Vapp_9am_Quality'] = 'N'
-        df.loc[(df.Vapp_3pm_hPa.notnull()) & (df.Vapp_3pm_Quality.isnull()), 'Vapp_3pm_Quality'] = 'N'
-        df.loc[(df.SVap_3pm_hPa.notnull()) & (df.SVap_9am_Quality.isnull()), 'SVap_9am_Quality'] = 'N'
-        df.loc[(df.SVap_3pm_hPa.notnull()) & (df.SVap_3pm_Quality.isnull()), 'SVap_3pm_Quality'] = 'N'
-        
-        
-        # discrepancy with station 14955 Prec_accumm_day = 1 tho prec_mm empty
-        df.Prec_Accumulated_Days = df.Prec_Accumulated_Days.apply(lambda x: np.nan if isinstance(x, basestring) and x.isspace() else x)
-        
-        # fix Accum days
-        # convert field to str for removal comparison operation
-        df.Prec_Accumulated_Days = [str(x) for x in df.Prec_Accumulated_Days]
-        df.Evap_Accumulated_Days = [str(x) for x in df.Evap_Accumulated_Days]
-        df.Tmax_Accumulated_Days = [str(x) for x in df.Tmax_Accumulated_Days]
-        df.Tmin_Accumulated_Days = [str(x) for x in df.Tmin_Accumulated_Days]
-        
-        # make all accum flags numeric
-        df.Prec_Accumulated_Days = [0 if x!=x or x == 'nan' else int(float(x)) for x in df.Prec_Accumulated_Days]
-        df.Evap_Accumulated_Days = [0 if x!=x or x == 'nan' else int(float(x)) for x in df.Evap_Accumulated_Days]
-        df.Tmax_Accumulated_Days = [0 if x!=x or x == 'nan' else int(float(x)) for x in df.Tmax_Accumulated_Days]
-        df.Tmin_Accumulated_Days = [0 if x!=x or x == 'nan' else int(float(x)) for x in df.Tmin_Accumulated_Days]
+        # fix data fields, blank cells become nan and the rest are parsed as float
+        for col in ['Prec_mm','Prec_Days_of_Rain_within_Accumulation','Evap_mm','Tmax_C','Tmin_C','Vapp_9am_hPa','Vapp_3pm_hPa','SVap_9am_hPa','SVap_3pm_hPa']:
+            df[col] = self.cleanNum(df[col])
+
+        # make all accum flags numeric (blank = 0), kept as float for empty frames so compileLoop concat dtypes are unchanged
+        accumType = np.int64 if df.index.size != 0 else np.float64
+        for col in ['Prec_Accumulated_Days','Evap_Accumulated_Days','Tmax_Accumulated_Days','Tmin_Accumulated_Days']:
+            df[col] = pd.to_numeric(self.cleanStr(df[col])).fillna(0).astype(accumType)
 
-        
         # convert nan to 1 for zero Accumulated days if var is not null
-        df.loc[(df.Prec_mm.notnull()) & (df.Prec_Accumulated_Days==0),'Prec_Accumulated_Days'] = 1
-        df.loc[(df.Evap_mm.notnull()) & (df.Evap_Accumulated_Days==0),'Evap_Accumulated_Days'] = 1
+        df.Prec_Accumulated_Days = df.Prec_Accumulated_Days.mask((df.Prec_mm.notnull()) & (df.Prec_Accumulated_Days==0),1)
+        df.Evap_Accumulated_Days = df.Evap_Accumulated_Days.mask((df.Evap_mm.notnull()) & (df.Evap_Accumulated_Days==0),1)
         
         # mark rows with empty prec_mm but accum flag = 1 as accum flag = 0
-        df.loc[(df.Prec_mm.isnull()) & (df.Prec_Accumulated_Days==1),'Prec_Accumulated_Days'] = 0
+        df.Prec_Accumulated_Days = df.Prec_Accumulated_Days.mask((df.Prec_mm.isnull()) & (df.Prec_Accumulated_Days==1),0)
         
         # mark temp accum days flag > 1 as np.nan
         #df.loc[df.Tmax_Accumulated_Days>1,'Tmax_C']=np.nan
         #df.loc[df.Tmin_Accumulated_Days>1,'Tmin_C']=np.nan
         
-        # find rows with quality NOT == ('Y','N') or Accumulated_days>1 replace
+        # find rows with quality NOT == ('Y','N') and replace with nan
+        # N.B. blank quality flags are not in okQual so their values are dropped too
         okQual = ['Y','N']
-
-        # quality rows
-        df.loc[~df.Prec_Quality.isin(okQual),'Prec_mm']=np.nan
-        df.loc[~df.Evap_Quality.isin(okQual),'Evap_mm']=np.nan
-        df.loc[~df.Tmax_Quality.isin(okQual),'Tmax_C']=np.nan
-        df.loc[~df.Tmin_Quality.isin(okQual),'Tmin_C']=np.nan
-        df.loc[~df.Temp_9am_Quality.isin(okQual),'Temp_9am_C']=np.nan
-        df.loc[~df.Temp_3pm_Quality.isin(okQual),'Temp_3pm_C']=np.nan
-        df.loc[~df.DewP_9am_Quality.isin(okQual),'DewP_9am_C']=np.nan
-        df.loc[~df.DewP_3pm_Quality.isin(okQual),'DewP_3pm_C']=np.nan
-        df.loc[~df.WetB_9am_Quality.isin(okQual),'WetB_9am_C']=np.nan
-        df.loc[~df.WetB_3pm_Quality.isin(okQual),'WetB_3pm_C']=np.nan
-        df.loc[~df.RelH_9am_Quality.isin(okQual),'RelH_9am_%']=np.nan
-        df.loc[~df.RelH_3pm_Quality.isin(okQual),'RelH_3pm_%']=np.nan
-        df.loc[~df.Vapp_9am_Quality.isin(okQual),'Vapp_9am_hPa']=np.nan
-        df.loc[~df.Vapp_3pm_Quality.isin(okQual),'Vapp_3pm_hPa']=np.nan
-        df.loc[~df.SVap_9am_Quality.isin(okQual),'SVap_9am_hPa']=np.nan
-        df.loc[~df.SVap_3pm_Quality.isin(okQual),'SVap_3pm_hPa']=np.nan
+        qualDict = {'Prec_Quality':'Prec_mm',
+                    'Evap_Quality':'Evap_mm',
+                    'Tmax_Quality':'Tmax_C',
+                    'Tmin_Quality':'Tmin_C',
+                    'Vapp_9am_Quality':'Vapp_9am_hPa',
+                    'Vapp_3pm_Quality':'Vapp_3pm_hPa',
+                    'SVap_9am_Quality':'SVap_9am_hPa',
+                    'SVap_3pm_Quality':'SVap_3pm_hPa'}
+        for qual,var in qualDict.items():
+            df[var] = df[var].where(self.qualityCheck(df[qual],okQual))
 
 
         # add cols for Tavg, Vavg, Year_Month (for output files) and index (for cross ref)
         df = df.assign(Temp_avg_C=(df.Tmax_C+df.Tmin_C)/2.,Vapp_avg_hPa=(df.Vapp_9am_hPa+df.Vapp_3pm_hPa)/2.,SVap_avg_hPa=(df.SVap_9am_hPa+df.SVap_3pm_hPa)/2.)
         df = df.assign(Vpd_avg_hPa=df.SVap_avg_hPa-df.Vapp_avg_hPa)
-        df['Year_Month'] = df[['Year','Month']].apply(lambda x: '_'.join(x),axis=1)
-        df['primary_key'] = df[['Station_ID','Year','Month','Day']].apply(lambda x: '_'.join(x),axis=1)
+        # int encoded as YYYYMM and SSSSSSYYYYMMDD, which sort the same as the legacy 'YYYY_MM' and 'SSSSSS_YYYY_MM_DD' strings
+        dateKey = df.Year.astype(np.int32)*10000+df.Month.astype(np.int32)*100+df.Day
+        df['Year_Month'] = dateKey//100
+        df['primary_key'] = df.Station_ID.astype(np.int64)*100000000+dateKey
         
         
         # adjust cols for month of days file output
@@ -576,22 +1077,6 @@ class ANUClimateAuto(object):
                  'Tmax_Accumulated_Days',
                  'Tmin_Quality',
                  'Tmin_Accumulated_Days',
-                 'Temp_9am_C',
-                 'Temp_9am_Quality',
-                 'Temp_3pm_C',
-                 'Temp_3pm_Quality',
-                 'DewP_9am_C',
-                 'DewP_9am_Quality',
-                 'DewP_3pm_C',
-                 'DewP_3pm_Quality',
-                 'WetB_9am_C',
-                 'WetB_9am_Quality',
-                 'WetB_3pm_C',
-                 'WetB_3pm_Quality',
-                 'RelH_9am_%',
-                 'RelH_9am_Quality',
-                 'RelH_3pm_%',
-                 'RelH_3pm_Quality',
                  'Vapp_9am_hPa',
                  'Vapp_9am_Quality',
                  'Vapp_3pm_hPa',
@@ -600,164 +1085,329 @@ class ANUClimateAuto(object):
                  'SVap_9am_Quality',
                  'SVap_3pm_hPa',
                  'SVap_3pm_Quality'],inplace=True,axis=1)
+
+        # lean mode narrows the observed fields, their 1 decimal values print the same from float32 - the derived
+        # averages stay float64 as the .dat files carry their float64 rounding (eg 9.149999999999999 prints as 9.1)
+        if self.valueType != np.float64:
+            df = df.astype(dict.fromkeys(['Prec_mm','Prec_Days_of_Rain_within_Accumulation','Evap_mm','Tmax_C','Tmin_C'],self.valueType))
         
         df.set_index(['primary_key'],inplace=True)
-        df.sort_index(inplace=True)
+        # stable sort, so a date's rows come out in the same order whether the file is cleaned whole or by date
+        df.sort_index(inplace=True,kind='mergesort')
+        if dtStr is not None:
+            df = self.fileSubset(df,dtStr,dStream)
         return df;
 
 
+    def fileSubset(self,df,dtStr,dStream,parts=None,numParts=1):
+        '''
+        Takes the rows for a datastream date from cleaned rows (fileClean) - the day for alpha, or the month for beta and
+        stable with every station put onto the month's full day range (missing days at the start, middle or end as nan
+        rows with 0 accumulated days)
+
+        args:
+        * df - cleaned df indexed by primary_key, the rows of one or more station files in file order
+        * dtStr - str of date to subset ('YYYY_MM_DD' for alpha, 'YYYY_MM' for beta and stable)
+        * dStream - str of datastream ('alpha','beta' or 'stable')
+        * parts - (optional) int array of the station file (0 to numParts-1) of each row, the subset is taken per file
+          as if each file was cleaned on its own (default all rows are one file)
+        * numParts - (optional) int number of station files in df
+
+        returns:
+        * df - df indexed by primary_key, sorted by it within each file
+        '''
+        dtList = [int(x) for x in dtStr.split('_')]
+        parts = np.zeros(df.index.size,dtype=np.int64) if parts is None else np.asarray(parts)
+        keep = (df.Year.values==dtList[0])&(df.Month.values==dtList[1])
+        if dStream == 'alpha':
+            keep &= df.Day.values==dtList[-1]
+        keep = np.flatnonzero(keep)
+        df,parts = df.iloc[keep],parts[keep]
+        accumCols = ['Prec_Accumulated_Days','Evap_Accumulated_Days']
+        if dStream != 'alpha' and df.index.size != 0:
+            cols = df.columns
+            df = df.reset_index(drop=True).assign(part=parts).drop_duplicates(['part','Station_ID','Day'])
+            # every (file, station) onto the full day range of the month
+            days = self.daysInMth(dtList[0],dtList[1])
+            pairs = df[['part','Station_ID']].drop_duplicates()
+            dayIndex = pd.MultiIndex.from_arrays([np.repeat(pairs.part.values,days),np.repeat(pairs.Station_ID.values,days),np.tile(np.arange(1,days+1),len(pairs))],names=['part','Station_ID','Day'])
+            df = df.set_index(['part','Station_ID','Day']).reindex(dayIndex).reset_index()
+            df[accumCols] = df[accumCols].fillna(0)
+            df = df.assign(Year=dtList[0],Month=dtList[1]).astype(self.keyTypes)
+            dateKey = df.Year.astype(np.int32)*10000+df.Month.astype(np.int32)*100+df.Day
+            df['Year_Month'] = dateKey//100
+            df['primary_key'] = df.Station_ID.astype(np.int64)*100000000+dateKey
+            order = np.lexsort((df.primary_key.values,df.part.values))
+            parts = df.part.values[order]
+            df = df.iloc[order].set_index('primary_key')[cols]
+        # accumulated days are int, but float if any file has no rows for the date (as concatenating its empty df gives)
+        accumType = np.int64 if numParts != 0 and len(np.unique(parts)) == numParts else np.float64
+        return df.astype(dict.fromkeys(accumCols,accumType));
+
+
     ####################################################################################
     # REFORMAT to output
     ####################################################################################
 
     
-    def getData(self,df,var,station):
+    def stationSort(self,df):
         '''
-        getData function - used within reformatDaily and reformatMonthOfDays functions to subset df and create dfOut
-        
+        Sorts df by Station_ID, each station's rows kept in their current order
+
         args:
         * df - input dataframe from BoM data
-        * var - str of one of desired BoM variables
-        * station - str of BoM station
-        
+
         returns:
-        * dfOut - a reformatted df for use in .dat files
+        * df sorted by Station_ID (the same df if it already is)
         '''
-        data = df[var].loc[df.Station_ID == station].values
-        station = str(station).zfill(6)
-        dfOut = pd.DataFrame({station:[x for x in data]},dtype=str)
-        return dfOut.T;
-    
-    
-    def getMthData(self,df,var,station,numDays):
+        sid = df.Station_ID.values
+        if (sid[1:] >= sid[:-1]).all():
+            return df;
+        return df.iloc[np.argsort(sid,kind='mergesort')];
+
+
+    def stationIndex(self,df):
         '''
-        getMthData function - used within reformatMonthly function to subset df and create dfOut
-        
+        Station offset index - each station's rows in a df sorted by Station_ID (see stationSort) are the contiguous
+        slice df.iloc[start:end], so per station access is a lookup and a slice rather than a scan of the whole df
+
         args:
-        * df - input dataframe from BoM data
-        * var - str of one of desired BoM variables
-        * station - str of BoM station
-        
+        * df - input dataframe from BoM data, sorted by Station_ID
+
         returns:
-        * dfOut - a reformatted df for use in .dat files
+        * dfIdx - df of start and end row offsets indexed by Station_ID
         '''
-        data = df[var].loc[df.Station_ID == station].values
-        data1 = np.asarray(data)
-        data1 = [np.nan if x!=x else float(x) for x in data1]
-        # count number of NaN
-        numNonNan = df[var].loc[df.Station_ID == station].notnull().sum()
-        # split processing based on MH email into prec/evap and rest
-        # prec/evap already have checks in place, evap needs min 20 days, prec has no day requirement
-        if var == 'Prec_mm':
-            accumTotP = df.Prec_Accumulated_Days.loc[df.Station_ID==station].sum()
-            lastDayFlag = df.Prec_Accumulated_Days.loc[df.Station_ID==station].tail(1)
-            if accumTotP!=accumTotP:
-                pass
-            else:
-                if float(accumTotP)!=float(numDays):
-                    dataOut = np.nan
-                else:
-                    if float(lastDayFlag) >= 1.:
-                        dataOut=np.nansum(data1)
-                    else:
-                        dataOut = np.nan
-        elif var in ('Tmax_C','Tmin_C','Vapp_avg_hPa','Temp_avg_C','Vpd_avg_hPa','Evap_mm'):# proceed if number of nonNaNs >=25
-            if numNonNan >= 25:
-                if var == 'Evap_mm':
-                    accumTotE = df.Evap_Accumulated_Days.loc[df.Station_ID==station].sum()
-                    if accumTotE!=accumTotE:
-                        pass
-                    else:
-                        if float(accumTotE)<25. or float(accumTotE)>35.:
-                            dataOut=np.nan
-                        else:
-                            dataOut=(np.nansum(data1)/float(accumTotE))*float(numDays)
-                else:
-                    dataOut=np.nanmean(data1)
-            else:
-                dataOut = np.nan
+        sid = df.Station_ID.values
+        if not (sid[1:] >= sid[:-1]).all():
+            raise ValueError('stationIndex needs a df sorted by Station_ID (see stationSort)')
+        starts = np.flatnonzero(np.concatenate([[True],sid[1:] != sid[:-1]])) if sid.size else np.zeros(0,np.int64)
+        ends = np.append(starts[1:],sid.size)
+        return pd.DataFrame({'start':starts,'end':ends},index=pd.Index(sid[starts],name='Station_ID'),columns=['start','end']);
+
+
+    def stationIndexed(self,df):
+        '''
+        A df sorted by station carrying its station offset index (stationIndex) as df.stationIdx - compileLoop,
+        compileRange and storeLoad return their dfs this way, built once, so the reformat functions and any per station
+        QA code take a station's rows as df.iloc[start:end] without sorting or indexing the df again
+
+        args:
+        * df - input dataframe from BoM data
+
+        returns:
+        * df itself if it carries its index already, otherwise df sorted by Station_ID (see stationSort) with the index
+          attached (copies and subsets of a df don't carry it)
+        '''
+        dfIdx = df.__dict__.get('stationIdx')
+        if dfIdx is not None and dfIdx.end.values[-1:].sum() == df.index.size:
+            return df;
+        df = self.stationSort(df)
+        # a plain attribute rather than a column, so it never reaches the .dat files or the store
+        object.__setattr__(df,'stationIdx',self.stationIndex(df))
+        return df;
+
+
+    def groupStats(self,df,varList):
+        '''
+        groupStats function - grouped aggregation engine used within reformatMonthly, one pass over the month df
+        giving every per station figure the monthly rules in getMthData, getPWdata and getFDdata are applied to
+
+        sums and means are taken over each station's rows in df order (stations with the same number of rows
+        reduced together as one matrix) so they match np.nansum/np.nanmean over the station's subset exactly
+        
+        args:
+        * df - input dataframe from BoM data (one month, at least one station)
+        * varList - list of str of desired BoM variables
+        
+        returns:
+        * dfStats - df indexed by Station_ID (sorted) with <var>_count (non nan days), <var>_sum (nansum) and
+          <var>_mean (nanmean) for each var, Prec_accum/Evap_accum (accumulation day totals), Prec_last (last
+          row's Prec_Accumulated_Days), rain_days (Prec_mm > 0.2) and frost_days (Tmin_C <= 2.)
+        '''
+        # a compiled df carries its station index, anything else is sorted (stable, each station's rows in df order) and indexed here
+        if df.Station_ID.isnull().any():
+            df = df.loc[df.Station_ID.notnull()]
+        df = self.stationIndexed(df)
+        dfIdx = df.stationIdx
+        stations = dfIdx.index.values
+        starts = dfIdx.start.values
+        counts = dfIdx.end.values - starts
+        # row positions of each station, one matrix per distinct row count
+        groups = []
+        for n in np.unique(counts):
+            sel = np.flatnonzero(counts==n)
+            groups.append((sel,starts[sel][:,None]+np.arange(n)))
+        
+        cols = {}
+        for var in set(varList)|set(['Prec_mm','Tmin_C','Prec_Accumulated_Days','Evap_Accumulated_Days']):
+            values = df[var].values
+            # float32 (ANUCLIMATE_LEAN) values are widened through their decimal repr, so they sum and compare as parsed
+            cols[var] = values.astype(str).astype(np.float64) if values.dtype == np.float32 else values.astype(np.float64)
+        stats = {}
+        for var in varList:
+            total = np.full(stations.size,np.nan)
+            for sel,idx in groups:
+                total[sel] = np.nansum(cols[var][idx],axis=1)
+            numValid = np.add.reduceat((~np.isnan(cols[var])).astype(np.int64),starts)
+            stats[var+'_count'] = numValid
+            stats[var+'_sum'] = total
+            stats[var+'_mean'] = np.where(numValid>0,total/np.maximum(numValid,1),np.nan)
+        # accumulation days are small whole numbers so the totals are exact in any order
+        stats['Prec_accum'] = np.add.reduceat(np.nan_to_num(cols['Prec_Accumulated_Days']),starts)
+        stats['Evap_accum'] = np.add.reduceat(np.nan_to_num(cols['Evap_Accumulated_Days']),starts)
+        stats['Prec_last'] = cols['Prec_Accumulated_Days'][starts+counts-1]
+        with np.errstate(invalid='ignore'):
+            stats['rain_days'] = np.add.reduceat((cols['Prec_mm']>0.2).astype(np.int64),starts)
+            stats['frost_days'] = np.add.reduceat((cols['Tmin_C']<=2.).astype(np.int64),starts)
+        dfStats = pd.DataFrame(stats,index=stations)
+        return dfStats;
+    
+    
+    def getMthData(self,dfStats,var,numDays):
+        '''
+        getMthData function - used within reformatMonthly function to apply the monthly rules to groupStats figures
+        prec: total if the accumulation days add up to the month and the last day is flagged
+        evap: total scaled by numDays over accumulation days, if >=25 valid days and 25 to 35 accumulation days
+        rest: mean if >=25 valid days
+        
+        args:
+        * dfStats - groupStats df
+        * var - str of one of desired BoM variables
+        * numDays - number of days in month
+        
+        returns:
+        * dfOut - a reformatted df for use in .dat files (one str value per station, nan where a rule fails)
+        '''
+        # split processing based on MH email into prec/evap and rest
+        # prec/evap already have checks in place, evap needs min 20 days, prec has no day requirement
+        if var == 'Prec_mm':
+            ok = (dfStats.Prec_accum==float(numDays))&(dfStats.Prec_last>=1.)
+            data = dfStats[var+'_sum']
+        elif var == 'Evap_mm':
+            ok = (dfStats[var+'_count']>=25)&(dfStats.Evap_accum>=25.)&(dfStats.Evap_accum<=35.)
+            with np.errstate(divide='ignore',invalid='ignore'):
+                data = (dfStats[var+'_sum']/dfStats.Evap_accum)*float(numDays)
+        else:
+            ok = dfStats[var+'_count']>=25
+            data = dfStats[var+'_mean']
         # force station to string
-        station = str(station).zfill(6)
-        dfOut = pd.DataFrame({station:[dataOut]},dtype=str)
-        return dfOut.T;
+        dfOut = pd.DataFrame({0:pd.Series(data.where(ok).values,dtype=str).values},index=[str(x).zfill(6) for x in dfStats.index])
+        return dfOut;
     
       
-    def getPWdata(self,df,station,numDays):
+    def getPWdata(self,dfStats,numDays):
         '''
-        getPWData function - used within reformatMonthly functions to subset df and create dfOut of PW
+        getPWData function - used within reformatMonthly functions to create dfOut of PW from groupStats figures
         
         args:
-        * df - input dataframe from BoM data
-        * var - str of one of desired BoM variables
-        * station - str of BoM station
+        * dfStats - groupStats df
+        * numDays - number of days in month
         
         returns:
         * dfOut - a reformatted df for use in .dat files
         '''
-        # count number of NaN
-        numNoNNan = df.Prec_mm.loc[df.Station_ID==station].notnull().sum()
         # proceed if number of nonNaNs >=25
-        if numNoNNan>=25:
-            # count number of rain days
-            numRain = df.Prec_mm.loc[(df.Station_ID==station)&(df.Prec_mm>0.2)].index.size
-            try:
-                # calc proportion of wet days - scaled by valid days in month
-                pw = np.round((float(numRain)/float(numNoNNan))*numDays,3)
-            except:
-                pass
-        else:
-            pw = np.nan
+        ok = dfStats.Prec_mm_count>=25
+        # calc proportion of wet days - scaled by valid days in month
+        with np.errstate(divide='ignore',invalid='ignore'):
+            pw = np.round((dfStats.rain_days.values.astype(np.float64)/dfStats.Prec_mm_count.values)*numDays,3)
         # create new df for PW
-        station = str(station).zfill(6)
-        dfOut = pd.DataFrame({station:[pw]},dtype=np.float64)
-        return dfOut.T;
+        dfOut = pd.DataFrame({0:np.where(ok,pw,np.nan)},index=[str(x).zfill(6) for x in dfStats.index],dtype=np.float64)
+        return dfOut;
         
-    def getFDdata(self,df,station,numDays):
+    def getFDdata(self,dfStats,numDays):
         '''
-        getFDData function - used within reformatMonthly functions to subset df and create dfOut of frost days
+        getFDData function - used within reformatMonthly functions to create dfOut of frost days from groupStats figures
         
         args:
-        * df - input dataframe from BoM data
-        * var - str of one of desired BoM variables
-        * station - str of BoM station
+        * dfStats - groupStats df
+        * numDays - number of days in month
         
         returns:
         * dfOut - a reformatted df for use in .dat files
         '''
-        # count number of NaN
-        numNoNNan = df.Tmin_C.loc[df.Station_ID==station].notnull().sum()
         # proceed if number of nonNaNs >=25
-        fdays = np.nan
-        if numNoNNan>=25:
-            # count number of frost days
-            frostDays = df.Tmin_C.loc[(df.Station_ID==station)&(df.Tmin_C<=2.)].index.size
-            # calc frost days with ratio of frost to valid days
-            fdays = float(numDays)*(float(frostDays)/float(numNoNNan))
-        else:
-            fdays = np.nan
+        ok = dfStats.Tmin_C_count>=25
+        # calc frost days with ratio of frost to valid days
+        with np.errstate(divide='ignore',invalid='ignore'):
+            fdays = float(numDays)*(dfStats.frost_days.values.astype(np.float64)/dfStats.Tmin_C_count.values)
         # create new df for FD
-        station = str(station).zfill(6)
-        dfOut = pd.DataFrame({station:[fdays]},dtype=np.float64)
-        return dfOut.T;
+        dfOut = pd.DataFrame({0:np.where(ok,fdays,np.nan)},index=[str(x).zfill(6) for x in dfStats.index],dtype=np.float64)
+        return dfOut;
     
     
+    def pivotData(self,df,varList):
+        '''
+        Used within reformatDaily - reshapes df into one station x position table per variable in one pass,
+        each row holding that station's values in df row order (shorter rows padded with nan)
+
+        args:
+        * df - input dataframe from BoM data
+        * varList - list of str of desired BoM variables
+
+        returns:
+        * dict of var:df indexed by zero padded station str (empty dict if df has no stations)
+        '''
+        df = df.loc[df.Station_ID.notnull(),['Station_ID']+varList]
+        if df.index.size == 0:
+            return {};
+        # position of each row within its station is its column in the station's row
+        pos = df.groupby('Station_ID').cumcount().values
+        # values as str (repr precision, nan kept for the nodata fill)
+        dfStr = pd.DataFrame(dict((var,pd.Series(df[var].values,dtype=str).values) for var in varList),columns=varList)
+        dfStr.index = pd.MultiIndex.from_arrays([df.Station_ID.values,pos])
+        dfWide = dfStr.unstack()
+        dfWide.index = [str(x).zfill(6) for x in dfWide.index]
+        return dict((var,dfWide[var]) for var in varList);
+
+
+    def dayMatrix(self,df,varList,numDays):
+        '''
+        Station x day matrix builder for reformatMonthOfDays - scatters each row of the month df into a dense
+        (station, day) array per variable in one pass, days with no row left as nan
+
+        args:
+        * df - input dataframe from BoM data (one month, Day as int)
+        * varList - list of str of desired BoM variables
+        * numDays - number of days in month (matrix width)
+
+        returns:
+        * dict of var:df indexed by zero padded station str, columns 1 to numDays (empty dict if df has no stations)
+        '''
+        if df.Station_ID.isnull().any():
+            df = df.loc[df.Station_ID.notnull()]
+        if df.index.size == 0:
+            return {};
+        # row and col of each observation in the matrix, stations sorted (taken from a compiled df's station index)
+        df = self.stationIndexed(df)
+        dfIdx = df.stationIdx
+        stations = dfIdx.index.values
+        row = np.repeat(np.arange(stations.size),dfIdx.end.values-dfIdx.start.values)
+        col = df.Day.values.astype(np.int64)-1
+        index = [str(x).zfill(6) for x in stations]
+        matrixDict = {}
+        for var in varList:
+            matrix = np.full((stations.size,numDays),np.nan,dtype=object)
+            # values as str, nan kept for the nodata fill
+            matrix[row,col] = pd.Series(df[var].values,dtype=str).values
+            matrixDict[var] = pd.DataFrame(matrix,index=index,columns=range(1,numDays+1))
+        return matrixDict;
+
+
     # reformat Daily
+    @instrumented
     def reFormatDaily(self,df,dtStr):
         start = time.time()
-        # adjust cols for daily file output
-        df = df.assign(Year_Month_Day=str(df.Year)+'_'+str(df.Month)+'_'+str(df.Day)) 
-        
-        # find unique Station_IDs and convert to list for iterating over
-        setStation_ID = set(df.Station_ID)
-        trueSetSI = {x for x in setStation_ID if x==x}
-        listSI = sorted(list(trueSetSI))
+        stageOutput(self,rowsIn=df.index.size)
+        # .dat files to write (to_fwf args), written together by writeFiles
+        jobs = []
+        # one reshape of df into a station table for each variable
+        wideDict = self.pivotData(df,list(self.varDict.keys()))
 
-        dfGroupD = df.set_index('Year_Month_Day',drop=True)
-        # iterate over list to create year/month files for each variable
+        # create year/month/day files for each variable
         for var,varDetails in self.varDict.iteritems():
-            frames = [self.getData(dfGroupD,var,station) for station in listSI]
-            if len(frames)!=0:
-                dfGroup1a = pd.concat(frames)
+            if var in wideDict:
+                dfGroup1a = wideDict[var].copy()
             
                 # drop empty rows before adding year and month cols
                 dfGroup1a.dropna(inplace=True,axis=0,how='all')
@@ -770,33 +1420,35 @@ class ANUClimateAuto(object):
                 dfGroup1a.insert(loc=1,column='month',value=mList)
                 dfGroup1a.insert(loc=2,column='day',value=dList)
                 # change nans to -99.9
-                dfGroup1a = dfGroup1a.applymap(lambda x: '-99.9' if x!=x else x)
+                dfGroup1a = dfGroup1a.fillna(self.nodata)
                 if len(dfGroup1a.index) !=0 and isinstance(dfGroup1a, pd.DataFrame):
-                    self.to_fwf(dfGroup1a,varDetails[1]+varDetails[0]+'_'+dtStr+'.dat','normal')
+                    jobs.append((dfGroup1a,varDetails[1]+varDetails[0]+'_'+dtStr+'.dat','normal'))
             
+        writeTimes = self.writeFiles(jobs)
         timing = time.time() - start
         self.state = 0
-        comment = 'reformatDaily complete'
+        comment = self.writeComment('reformatDaily complete',writeTimes)
         return timing,self.state,comment;
 
 
     # reformat month of days
+    @instrumented
     def reFormatMonthOfDays(self,df,dtStr,dataStream):
         start = time.time()
+        stageOutput(self,rowsIn=df.index.size)
+        # .dat files to write (to_fwf args), written together by writeFiles
+        jobs = []
+
+        dtList = [int(x) for x in dtStr.split('_')]
+        # one station x day matrix for each variable
+        matrixDict = self.dayMatrix(df,list(self.varDict.keys()),self.daysInMth(dtList[0],dtList[1]))
 
-        # find unique Station_IDs and convert to list for iterating over
-        setStation_ID = set(df.Station_ID)
-        trueSetSI = {x for x in setStation_ID if x==x}
-        listSI = sorted(list(trueSetSI))
-        
         # iterate over dict to create year/month files for each variable
         for var,varDetails in self.varDict.iteritems():
-            frames = [self.getData(df,var,station) for station in listSI]
-            if len(frames)!=0:
-                dfGroup1a = pd.concat(frames)
+            if var in matrixDict:
+                dfGroup1a = matrixDict[var]
                 # drop empty rows before adding year and month cols
-                dfGroup1a.dropna(inplace=True,axis=0,how='all')
-                #print dfGroup1a
+                dfGroup1a = dfGroup1a.loc[dfGroup1a.notnull().values.any(axis=1)].copy()
                 # make year and month lists
                 yList = [dtStr.split('_')[0]]*dfGroup1a.index.size
                 mList = [dtStr.split('_')[-1]]*dfGroup1a.index.size
@@ -804,38 +1456,38 @@ class ANUClimateAuto(object):
                 dfGroup1a.insert(loc=0,column='year',value=yList)
                 dfGroup1a.insert(loc=1,column='month',value=mList)
                 # change nans to -99.9
-                dfGroup1a = dfGroup1a.applymap(lambda x: '-99.9' if x!=x else x)
+                dfGroup1a = dfGroup1a.fillna(self.nodata)
                 if dataStream=='beta':
-                    self.to_fwf(dfGroup1a,varDetails[2]+varDetails[0]+'_'+dtStr+'.dat','normal')
+                    jobs.append((dfGroup1a,varDetails[2]+varDetails[0]+'_'+dtStr+'.dat','normal'))
                 if dataStream=='stable':
-                    self.to_fwf(dfGroup1a,varDetails[3]+varDetails[0]+'_'+dtStr+'.dat','normal')
+                    jobs.append((dfGroup1a,varDetails[3]+varDetails[0]+'_'+dtStr+'.dat','normal'))
+        writeTimes = self.writeFiles(jobs)
         timing = time.time() - start
         self.state = 0
-        comment = 'reformatMonthOfDays complete'
+        comment = self.writeComment('reformatMonthOfDays complete',writeTimes)
         return timing,self.state,comment;
 
 
     # reformat monthly file
+    @instrumented
     def reFormatMonthly(self,df,dtStr,dataStream):
         start = time.time()
-        
-        # find unique Station_IDs and convert to list for iterating over
-        setStation_ID = set(df.Station_ID)
-        trueSetSI = {x for x in setStation_ID if x==x}
-        listSI = sorted(list(trueSetSI))
-        
-        # reformat Prec_mm col
-        df.Prec_mm = [np.nan if x!=x else float(x) for x in df.Prec_mm]
+        stageOutput(self,rowsIn=df.index.size)
+        # .dat files to write (to_fwf args), written together by writeFiles
+        jobs = []
         
         # find numDays var for total accum days check and pw calc
         numDays = self.daysInMth(int(dtStr.split('_')[0]),int(dtStr.split('_')[-1]))
         
+        # per station counts, totals and means for every product in one pass
+        if df.Station_ID.notnull().any():
+            dfStats = self.groupStats(df,list(self.varDict.keys()))
+        else:
+            dfStats = None
 
         ##### Proportion of days that are wet
-        #cycle through stations
-        frames = [self.getPWdata(df,station,numDays) for station in listSI]
-        if len(frames)!=0:
-            dfGroupPW = pd.concat(frames)
+        if dfStats is not None:
+            dfGroupPW = self.getPWdata(dfStats,numDays)
             # drop empty rows before adding year and month cols
             dfGroupPW.dropna(inplace=True,axis=0,how='all')
             # make year and month lists
@@ -846,19 +1498,15 @@ class ANUClimateAuto(object):
             dfGroupPW.insert(loc=1,column='month',value=mList)
     
             # change nans to -99.9
-            dfGroupPW = dfGroupPW.applymap(lambda x: '-99.9' if x!=x else x)
+            dfGroupPW = dfGroupPW.fillna(self.nodata)
             if dataStream=='beta':
-                self.to_fwf(dfGroupPW,self.baseDir+'/pw_mth_v2_0/beta/dat/bomdat/pw_'+dtStr+'.dat','pw')
+                jobs.append((dfGroupPW,self.baseDir+'/pw_mth_v2_0/beta/dat/bomdat/pw_'+dtStr+'.dat','pw'))
             if dataStream=='stable':
-                self.to_fwf(dfGroupPW,self.baseDir+'/pw_mth_v2_0/stable/dat/bomdat/pw_'+dtStr+'.dat','pw') 
-        
-        del dfGroupPW
+                jobs.append((dfGroupPW,self.baseDir+'/pw_mth_v2_0/stable/dat/bomdat/pw_'+dtStr+'.dat','pw')) 
         
         ##### Number of Frost Days
-        #cycle through stations
-        frames = [self.getFDdata(df,station,numDays) for station in listSI]
-        if len(frames)!=0:
-            dfGroupFD = pd.concat(frames)
+        if dfStats is not None:
+            dfGroupFD = self.getFDdata(dfStats,numDays)
             # drop empty rows before adding year and month cols
             dfGroupFD.dropna(inplace=True,axis=0,how='all')
             # make year and month lists
@@ -869,24 +1517,21 @@ class ANUClimateAuto(object):
             dfGroupFD.insert(loc=1,column='month',value=mList)
     
             # change nans to -99.9
-            dfGroupFD = dfGroupFD.applymap(lambda x: '-99.9' if x!=x else x)
+            dfGroupFD = dfGroupFD.fillna(self.nodata)
             if dataStream=='beta':
-                self.to_fwf(dfGroupFD,self.baseDir+'/frst_mth_v2_0/beta/dat/bomdat/fd_'+dtStr+'.dat','normal')
+                jobs.append((dfGroupFD,self.baseDir+'/frst_mth_v2_0/beta/dat/bomdat/fd_'+dtStr+'.dat','normal'))
             if dataStream=='stable':
-                self.to_fwf(dfGroupFD,self.baseDir+'/frst_mth_v2_0/stable/dat/bomdat/fd_'+dtStr+'.dat','normal')
-    
-        del dfGroupFD
+                jobs.append((dfGroupFD,self.baseDir+'/frst_mth_v2_0/stable/dat/bomdat/fd_'+dtStr+'.dat','normal'))
         
     
         # iterate over list to create year/month files for each variable
         for var,varDetails in self.varDict.iteritems():
-            frames = [self.getMthData(df,var,station,numDays) for station in listSI]
-            if len(frames)!=0:
-                dfGroup1a = pd.concat(frames)
+            if dfStats is not None:
+                dfGroup1a = self.getMthData(dfStats,var,numDays)
 
                 # convert '0.0' to nan for dropping for Evap_mm
                 if var == 'Evap_mm':
-                    dfGroup1a = dfGroup1a.applymap(lambda x: np.nan if x in ('0.0',' 0.0 ',' 0.0','0.0 ','0',0.,0) else x)
+                    dfGroup1a = dfGroup1a.where(~dfGroup1a.isin(['0.0',' 0.0 ',' 0.0','0.0 ','0']))
                 # drop empty rows before adding year and month cols
                 dfGroup1a.dropna(inplace=True,axis=0,how='all')
                 # make year and month lists
@@ -896,78 +1541,691 @@ class ANUClimateAuto(object):
                 dfGroup1a.insert(loc=0,column='year',value=yList)
                 dfGroup1a.insert(loc=1,column='month',value=mList)
                 # change nans to -99.9
-                dfGroup1a = dfGroup1a.applymap(lambda x: '-99.9' if x!=x else x)
+                dfGroup1a = dfGroup1a.fillna(self.nodata)
                 if dataStream=='beta':
-                    self.to_fwf(dfGroup1a,varDetails[4]+varDetails[0]+'_'+dtStr+'.dat','normal')
+                    jobs.append((dfGroup1a,varDetails[4]+varDetails[0]+'_'+dtStr+'.dat','normal'))
                 if dataStream=='stable':
-                    self.to_fwf(dfGroup1a,varDetails[5]+varDetails[0]+'_'+dtStr+'.dat','normal')
+                    jobs.append((dfGroup1a,varDetails[5]+varDetails[0]+'_'+dtStr+'.dat','normal'))
     
         # remove redundant df
-        del dfGroup1a
+        del dfStats
          
                     
+        writeTimes = self.writeFiles(jobs)
         timing = time.time() - start
         self.state = 0
-        comment = 'reformatMonthly complete'
+        comment = self.writeComment('reformatMonthly complete',writeTimes)
         return timing,self.state,comment;
 
     ####################################################################################
     # COMPILER loop and LOGGER
     ####################################################################################
 
+    # map a file function over the bomdat files, in parallel if numWorkers > 1
+    def mapFiles(self,method,fileList,*args):
+        '''
+        Applies a file method (eg 'fileOpen' or 'fileOpenAll') to each file in fileList, fanned out over a
+        process pool of self.numWorkers processes (falls back to serial if numWorkers <= 1 or the pool can't start)
+
+        args:
+        * method - str name of the ANUClimateAuto method to call with (fname,*args)
+        * fileList - list of bomdat files
+        * args - remaining args passed to the method
+
+        returns:
+        * list of results in the same order as fileList
+        '''
+        numWorkers = min(self.numWorkers,len(fileList))
+        if numWorkers > 1:
+            try:
+                pool = multiprocessing.Pool(numWorkers)
+            except Exception as e:
+                print('Process pool failed, running serial: '+str(e))
+                pool = None
+            if pool is not None:
+                try:
+                    # map keeps fileList order so the compiled df is deterministic
+                    return pool.map(fileWorker,[(self,method,fname,args) for fname in fileList],chunksize=max(1,len(fileList)//(numWorkers*4)));
+                finally:
+                    pool.close()
+                    pool.join()
+        return [getattr(self,method)(fname,*args) for fname in fileList];
+
+
+    # find the bomdat files for a BoM file handle
+    def findFiles(self,fHandle):
+        '''
+        Lists the DC02D_Data_* station files for fHandle, from the unzip folder if the archive was extracted,
+        otherwise from the members of the downloaded zip
+
+        args:
+        * fHandle - str of BoM file identifier
+
+        returns:
+        * fileList - sorted list of station file paths (or zip member names)
+        * zipName - str path of the zip to read members from, None if reading extracted files
+        '''
+        fileList = sorted(glob(self.zipPath+fHandle+'/DC02D_Data_*'))
+        if len(fileList) != 0:
+            return fileList,None;
+        zipName = self.archiveName(fHandle)
+        zipFile = zipfile.ZipFile(zipName,'r')
+        fileList = sorted([x for x in zipFile.namelist() if fn.fnmatch(os.path.basename(x),'DC02D_Data_*')])
+        zipFile.close()
+        return fileList,zipName;
+
+
+    def archiveName(self,fHandle):
+        '''
+        Path downloadFTP leaves fHandle's BoM zip at
+
+        args:
+        * fHandle - str of BoM file identifier
+
+        returns:
+        * str path of the zip
+        '''
+        return self.destPath+fHandle+'/DS082_'+fHandle+'.zip';
+
+
+    # checksums of bomdat files, to spot station files unchanged since the last compile
+    def fileCrc(self,fname):
+        '''
+        CRC-32 of an extracted bomdat file (same value as the zip member CRC, so extracted and zipped files share the cache)
+
+        args:
+        * fname - str path of the station file
+
+        returns:
+        * int CRC-32
+        '''
+        crc = 0
+        f = open(fname,'rb')
+        for block in iter(lambda: f.read(1<<20),b''):
+            crc = zlib.crc32(block,crc)
+        f.close()
+        return crc & 0xffffffff;
+
+
+    def fileCrcs(self,fileList,zipName=None):
+        '''
+        CRC-32 of each file in fileList, from the zip directory if reading zip members (no decompression needed)
+
+        args:
+        * fileList - list of station files from findFiles
+        * zipName - (optional) str path of the BoM zip, if the station files are zip members
+
+        returns:
+        * list of int CRC-32 in the same order as fileList
+        '''
+        if zipName:
+            zipFile = zipfile.ZipFile(zipName,'r')
+            crcDict = dict((x.filename,x.CRC) for x in zipFile.infolist())
+            zipFile.close()
+            return [crcDict[x] for x in fileList];
+        return self.mapFiles('fileCrc',fileList);
+
+
+    def fileKeys(self,fileList,zipName=None):
+        '''
+        Cleaned rows cache key of each file in fileList - its station (the DC02D_Data_<station> start of the name),
+        CRC-32 and size in bytes. Thousands of files change every day, so a CRC-32 alone would sooner or later match a
+        cached file of another station
+
+        args:
+        * fileList - list of station files from findFiles
+        * zipName - (optional) str path of the BoM zip, if the station files are zip members
+
+        returns:
+        * list of (str station, int CRC-32, int size) tuples in the same order as fileList
+        '''
+        stations = ['_'.join(os.path.basename(x).split('_')[:3]) for x in fileList]
+        if zipName:
+            zipFile = zipfile.ZipFile(zipName,'r')
+            infoDict = dict((x.filename,(x.CRC,x.file_size)) for x in zipFile.infolist())
+            zipFile.close()
+            return [(x,)+infoDict[y] for x,y in zip(stations,fileList)];
+        return zip(stations,self.mapFiles('fileCrc',fileList),[os.path.getsize(x) for x in fileList]);
+
+
+    # date index of bomdat files
+    def loadIndex(self,fHandle,fileList,zipName=None):
+        '''
+        Loads the date index for a BoM archive from the backup dir, building (and saving) it with indexFile if
+        it doesn't exist or doesn't match fileList
+
+        args:
+        * fHandle - str of BoM file identifier
+        * fileList - list of station files from findFiles
+        * zipName - (optional) str path of the BoM zip, if the station files are zip members
+
+        returns:
+        * dfIndex - df of fname, date, offset, nbytes and rows (see indexFile)
+        '''
+        indexName = self.backupPath+fHandle+'/'+fHandle+'_index.csv'
+        if os.path.isfile(indexName):
+            dfIndex = pd.read_csv(indexName,dtype={'fname':str,'date':str})
+            if set(dfIndex.fname) == set(fileList):
+                return dfIndex;
+        # reuse the last built index for station files unchanged since then, only scan new or changed files
+        crcList = self.fileCrcs(fileList,zipName)
+        cacheName = self.backupPath+'store/index.csv'
+        hitDict = {}
+        if self.useCache and os.path.isfile(cacheName):
+            dfCache = pd.read_csv(cacheName,dtype={'fname':str,'date':str})
+            crcDict = dict(zip([os.path.basename(x) for x in fileList],crcList))
+            sources = [os.path.basename(x) for x in dfCache.fname]
+            dfCache = dfCache.loc[[crcDict.get(x)==crc for x,crc in zip(sources,dfCache.crc)]]
+            hitDict = dict(list(dfCache.groupby([os.path.basename(x) for x in dfCache.fname])))
+        todo = [x for x in fileList if os.path.basename(x) not in hitDict]
+        newDict = dict(zip(todo,self.mapFiles('indexFile',todo,zipName)))
+        rows = []
+        for fname,crc in zip(fileList,crcList):
+            if fname in newDict:
+                rows += [x+[crc] for x in newDict[fname]]
+            else:
+                rows += [[fname]+list(x)+[crc] for x in hitDict[os.path.basename(fname)][['date','offset','nbytes','rows']].values]
+        dfIndex = pd.DataFrame(rows,columns=['fname','date','offset','nbytes','rows','crc'])
+        self.saveIndex(fHandle,dfIndex)
+        return dfIndex;
+
+
+    def saveIndex(self,fHandle,dfIndex):
+        '''
+        Saves a date index as the index for fHandle and as the rolling index used for unchanged files by loadIndex
+
+        args:
+        * fHandle - str of BoM file identifier
+        * dfIndex - df of fname, date, offset, nbytes, rows and crc
+
+        returns:
+        nothing
+        '''
+        for dirName in [self.backupPath+fHandle,self.backupPath+'store']:
+            try:
+                os.makedirs(dirName)
+            except:
+                pass
+        dfIndex.to_csv(self.backupPath+fHandle+'/'+fHandle+'_index.csv',index=False)
+        dfIndex.to_csv(self.backupPath+'store/index.csv',index=False)
+
+
+    # station observation store (replaces the _df<stream>.csv backups)
+    def storeName(self,dtStr,dStream):
+        '''
+        Path of a compiled df in the observation store - partitioned by datastream and year-month,
+        eg: <backupPath>store/alpha/2017_05/2017_05_27.npz or <backupPath>store/stable/2016_11/2016_11.npz
+
+        args:
+        * dtStr - str of date for compile (YYYY_MM_DD for alpha, YYYY_MM for beta/stable)
+        * dStream - str of datastream (alpha, beta or stable)
+
+        returns:
+        * str path of the .npz partition
+        '''
+        return self.backupPath+'store/'+dStream+'/'+dtStr[:7]+'/'+dtStr+'.npz';
+
+
+    def storeSave(self,df,dtStr,dStream):
+        '''
+        Saves a compiled df (from compileLoop/compileRange) to the observation store, see arraySave
+
+        args:
+        * df - compiled df indexed by primary_key
+        * dtStr - str of date for compile
+        * dStream - str of datastream
+
+        returns:
+        * str path of the saved partition
+        '''
+        return self.arraySave(df,self.storeName(dtStr,dStream));
+
+
+    def storeLoad(self,dtStr,dStream):
+        '''
+        Loads a compiled df back from the observation store, ready for the reformat functions (columns typed as saved)
+
+        args:
+        * dtStr - str of date for compile
+        * dStream - str of datastream
+
+        returns:
+        * df indexed by primary_key, sorted by station and carrying its station index (see stationIndexed)
+        '''
+        df = self.arrayLoad(self.storeName(dtStr,dStream))
+        # compiled dfs are saved sorted by station, older saves are sorted here
+        return self.stationIndexed(df);
+
+
+    def arraySave(self,df,fname):
+        '''
+        Saves a df indexed by primary_key as a compressed .npz with one typed numpy array per column - numeric columns
+        keep their dtype, object columns are saved as strings with a null mask
+
+        args:
+        * df - df indexed by primary_key
+        * fname - str path of the .npz
+
+        returns:
+        * str path of the saved file
+        '''
+        try:
+            os.makedirs(os.path.dirname(fname))
+        except:
+            pass
+        df = df.reset_index()
+        arrays = {'columns':np.array([str(x) for x in df.columns]),'kinds':np.array(['str' if df[x].dtype==object else 'num' for x in df.columns])}
+        for i,col in enumerate(df.columns):
+            if df[col].dtype == object:
+                nulls = df[col].isnull().values
+                arrays['c%d' % i] = df[col].where(~nulls,'').values.astype(str)
+                arrays['m%d' % i] = nulls
+            else:
+                arrays['c%d' % i] = df[col].values
+        # write to a temp file and rename so a failed run never leaves a partial partition
+        with open(fname+'.tmp','wb') as f:
+            np.savez_compressed(f,**arrays)
+        os.rename(fname+'.tmp',fname)
+        stageOutput(self,files=[fname])
+        return fname;
+
+
+    def arrayLoad(self,fname):
+        '''
+        Loads a df saved by arraySave (columns typed as saved)
+
+        args:
+        * fname - str path of the .npz
+
+        returns:
+        * df indexed by primary_key
+        '''
+        data = np.load(fname)
+        cols = []
+        for i,(col,kind) in enumerate(zip(data['columns'],data['kinds'])):
+            values = data['c%d' % i]
+            if kind == 'str':
+                values = values.astype(object)
+                values[data['m%d' % i]] = np.nan
+            cols.append(pd.Series(values,name=str(col)))
+        data.close()
+        return pd.concat(cols,axis=1).set_index('primary_key');
+
+
+    # cleaned rows of each station file keyed by its station, CRC and size, so files unchanged since any earlier compile
+    # aren't parsed again
+    def cacheName(self):
+        '''
+        Path of the cleaned rows cache - float32 (ANUCLIMATE_LEAN) rows are kept apart from float64 ones so switching
+        mode never reuses rows of the other precision
+
+        returns:
+        * str <backupPath>store/rows_cache.npz (float64 values) or <backupPath>store/rows_cache32.npz (float32 values),
+          its manifest of keys is the .csv of the same name
+        '''
+        return self.backupPath+'store/rows_cache'+('' if self.valueType == np.float64 else '32')+'.npz';
+
+
+    def cacheLoad(self,keyList):
+        '''
+        Looks up the cleaned rows (every row, not subset to a date) of each station file by its key in the cleaned rows
+        cache, whichever archive or compile they were cached from
+
+        args:
+        * keyList - list of (station, CRC-32, size) of the station files from fileKeys
+
+        returns:
+        * df - cached rows of the files found, in file order
+        * parts - int array of the position in keyList of each row's file
+        * hits - set of positions in keyList found in the cache (files with no rows included)
+        '''
+        cacheName = self.cacheName()
+        manName = cacheName[:-4]+'.csv'
+        if not self.useCache or not os.path.isfile(manName):
+            return None,np.zeros(0,dtype=np.int64),set();
+        # first file of each key (files with the same station, CRC and size have the same rows)
+        posDict = {}
+        for i,key in enumerate(keyList):
+            posDict.setdefault(key,i)
+        try:
+            dfMan = pd.read_csv(manName,dtype={'station':str})
+            dfCache = self.arrayLoad(cacheName)
+            # position in keyList of each manifest entry (-1 if the file isn't in this compile), and of each row
+            entryPos = np.array([posDict.get(x,-1) for x in zip(dfMan.station,dfMan.crc,dfMan['size'])],dtype=np.int64)
+            rowPos = entryPos[dfCache.entry.values]
+        except Exception as e:
+            print('Cache load failed, parsing all files: '+str(e))
+            return None,np.zeros(0,dtype=np.int64),set();
+        hits = set(int(x) for x in entryPos if x >= 0)
+        keep = np.flatnonzero(rowPos>=0)
+        return dfCache.iloc[keep].drop('entry',axis=1),rowPos[keep],hits;
+
+
+    def cacheSave(self,keyList,df,parts):
+        '''
+        Replaces the cleaned rows cache with the cleaned rows of the station files of this compile, and a manifest
+        (cacheName .csv) of their keys - each cached row carries the manifest entry of its file
+
+        args:
+        * keyList - list of (station, CRC-32, size) of the station files from fileKeys
+        * df - cleaned rows of the files in file order
+        * parts - int array of the position in keyList of each row's file
+
+        returns:
+        nothing
+        '''
+        if not self.useCache:
+            return;
+        cacheName = self.cacheName()
+        manName = cacheName[:-4]+'.csv'
+        # drop the manifest first so an interrupted save can't pair old keys with new rows
+        if os.path.isfile(manName):
+            os.remove(manName)
+        # one manifest entry per key, the rows of the first file with it
+        posDict = {}
+        for i,key in enumerate(keyList):
+            posDict.setdefault(key,i)
+        firsts = sorted(posDict.values())
+        entry = np.full(len(keyList),-1,dtype=np.int64)
+        entry[firsts] = np.arange(len(firsts))
+        keep = np.flatnonzero(entry[parts]>=0)
+        self.arraySave(df.iloc[keep].assign(entry=entry[parts[keep]]),cacheName)
+        pd.DataFrame([keyList[i] for i in firsts],columns=['station','crc','size']).to_csv(manName,index=False)
+        stageOutput(self,files=[manName])
+
+
+    def cleanedRows(self,fileList,zipName=None):
+        '''
+        Cleaned rows (every row, see fileClean) of all station files - from the cleaned rows cache for files whose key
+        (fileKeys) is there, and parsed (fileOpen, over mapFiles) for the rest, after which the cache is replaced with
+        this compile's files. Subset them to a date with fileSubset(df,dtStr,dStream,parts,len(fileList))
+
+        args:
+        * fileList - list of station files from findFiles
+        * zipName - (optional) str path of the BoM zip, if the station files are zip members
+
+        returns:
+        * df - cleaned rows of the files in fileList order
+        * parts - int array of the position in fileList of each row's file
+        '''
+        keyList = self.fileKeys(fileList,zipName)
+        dfHit,hitParts,hits = self.cacheLoad(keyList)
+        todo = [i for i in range(len(fileList)) if i not in hits]
+        frames = self.mapFiles('fileOpen',[fileList[i] for i in todo],None,None,zipName)
+        parts = np.concatenate([hitParts]+[np.full(x.index.size,i,dtype=np.int64) for i,x in zip(todo,frames)])
+        df = pd.concat(([dfHit] if dfHit is not None else [])+frames)
+        del frames
+        if not (parts[1:] >= parts[:-1]).all():
+            order = np.argsort(parts,kind='mergesort')
+            df,parts = df.iloc[order],parts[order]
+        if len(todo) != 0:
+            self.cacheSave(keyList,df,parts)
+        return df,parts;
+
+
     # loop for processing all bomdat daily files using ANUClimateFileOpen function
+    @instrumented
     def compileLoop(self,fHandle,dtStr,dStream):
         start = time.time()
-        itra = 0
-        os.chdir(self.zipPath+fHandle)
-        fileList = glob('DC02D_Data_*')
-        frames = [self.fileOpen(fname,dtStr,dStream) for fname in fileList]
+        fileList,zipName = self.findFiles(fHandle)
+        entryList = []
+        if dStream == 'alpha' and self.useIndex:
+            # seek straight to the target day's rows in each file
+            dfIndex = self.loadIndex(fHandle,fileList,zipName)
+            hdrDict = dict(dfIndex.loc[dfIndex.date=='header',['fname','nbytes']].values)
+            dfDate = dfIndex.loc[dfIndex.date==dtStr]
+            entryList = [(x[0],int(hdrDict[x[0]]),int(x[1]),int(x[2])) for x in dfDate[['fname','offset','nbytes']].values]
+        if len(entryList) != 0:
+            # one batch of rows per worker
+            numChunks = max(1,min(self.numWorkers,len(entryList)))
+            frames = self.mapFiles('fileOpenIndexed',[entryList[i::numChunks] for i in range(numChunks)],dtStr,dStream,zipName)
+        elif self.useCache:
+            # only parse station files not in the cleaned rows cache, then take the date's rows
+            dfAll,parts = self.cleanedRows(fileList,zipName)
+            frames = [self.fileSubset(dfAll,dtStr,dStream,parts,len(fileList))]
+            del dfAll
+        else:
+            frames = self.mapFiles('fileOpen',fileList,dtStr,dStream,zipName)
         df = pd.concat(frames)
-        dfOut = df.drop_duplicates(['Station_ID','Year','Month','Day'])
+        dfOut = self.stationIndexed(df.drop_duplicates(['Station_ID','Year','Month','Day']))
+        stageOutput(self,rowsIn=df.index.size,rowsOut=dfOut.index.size)
         self.state = 0
-        comment = 'compile complete (numFiles, numRows): '+str(len(fileList))+' '+str(dfOut.index.size)
-        dfOut.to_csv(self.backupPath+fHandle+'_df'+dStream+'.csv')
+        comment = 'compile complete (numFiles, numRows, peak rss MB): '+str(len(fileList))+' '+str(dfOut.index.size)+' '+str(self.peakRss())
+        self.storeSave(dfOut,dtStr,dStream)
         timing = time.time() - start
         return dfOut,timing,self.state,comment;
         #return df,timing,self.state,comment;
-    
+
+    # single pass loop for end of month runs (alpha, beta and stable from one read of each file)
+    def compileLoopAll(self,fHandle,dateList):
+        '''
+        End of month version of compileLoop - each bomdat file is parsed once and split into the alpha, beta and stable dfs
+
+        args:
+        * fHandle - str of BoM file identifier
+        * dateList - list of [alpha,beta,stable] date strings from getDateString('all')
+
+        returns:
+        dfDay, dfBMth, dfSMth, timing, state and comment
+        '''
+        dfList,timing,self.state,comment = self.compileRange(fHandle,zip(dateList,['alpha','beta','stable']))
+        return dfList[0],dfList[1],dfList[2],timing,self.state,comment;
+
+
+    # single pass loop for any set of dates (catch up and backfill runs)
+    @instrumented
+    def compileRange(self,fHandle,dateStreams):
+        '''
+        Multi date version of compileLoop - each bomdat file is parsed once and split into a df for every (date,
+        datastream) pair, so a week of missed alpha days or a run of months costs one ingest of the archive
+
+        args:
+        * fHandle - str of BoM file identifier
+        * dateStreams - list of (dtStr, dStream) tuples, eg [('2017_10_23','alpha'),('2017_10_24','alpha')]
+
+        returns:
+        * dfList - list of compiled dfs in dateStreams order, timing, state and comment
+        '''
+        start = time.time()
+        dateStreams = list(dateStreams)
+        fileList,zipName = self.findFiles(fHandle)
+        if self.useCache:
+            # only parse station files not in the cleaned rows cache, each date's rows are taken from them below
+            dfAll,parts = self.cleanedRows(fileList,zipName)
+        else:
+            framesAll = zip(*self.mapFiles('fileOpenRange',fileList,dateStreams,zipName))
+        dfList = []
+        for i,(dtStr,dStream) in enumerate(dateStreams):
+            if self.useCache:
+                df = self.fileSubset(dfAll,dtStr,dStream,parts,len(fileList))
+            else:
+                df = pd.concat(framesAll[i])
+            dfOut = self.stationIndexed(df.drop_duplicates(['Station_ID','Year','Month','Day']))
+            stageOutput(self,rowsIn=df.index.size,rowsOut=dfOut.index.size)
+            self.storeSave(dfOut,dtStr,dStream)
+            dfList.append(dfOut)
+        self.state = 0
+        comment = 'compile complete (numFiles, numRows per date, peak rss MB): '+str(len(fileList))+' '+'/'.join([str(x.index.size) for x in dfList])+' '+str(self.peakRss())
+        timing = time.time() - start
+        return dfList,timing,self.state,comment;
+
+
+    # reformat any set of dates from one ingest
+    def reFormatRange(self,fHandle,dateStreams):
+        '''
+        Multi date reformat for catch up and backfill runs - compiles every (date, datastream) pair from one parse of
+        fHandle's archive (compileRange) and writes all their .dat files: daily files for alpha days, month of days
+        and monthly files for beta/stable months (the archive has to hold the dates, BoM archives cover ~6 months)
+
+        args:
+        * fHandle - str of BoM file identifier of the archive to read
+        * dateStreams - list of (dtStr, dStream) tuples, eg [('2017_10_23','alpha'),('2017_10_24','alpha')] or
+          [('2017_04','stable'),('2017_05','stable')]
+
+        returns:
+        * results - list of (dtStr, dStream, process, timing, state, comment) for each step, process named as in
+          the daily log (compileRange, reFormatDaily, reFormatMonthOfDays_<dStream>, reFormatMonthly_<dStream>)
+        * timing, state and comment
+        '''
+        start = time.time()
+        dateStreams = list(dateStreams)
+        dfList,clTiming,clState,clComment = self.compileRange(fHandle,dateStreams)
+        results = [(None,None,'compileRange',clTiming,clState,clComment)]
+        for (dtStr,dStream),df in zip(dateStreams,dfList):
+            if dStream == 'alpha':
+                results.append((dtStr,dStream,'reFormatDaily')+self.reFormatDaily(df,dtStr))
+            else:
+                results.append((dtStr,dStream,'reFormatMonthOfDays_'+dStream)+self.reFormatMonthOfDays(df,dtStr,dStream))
+                results.append((dtStr,dStream,'reFormatMonthly_'+dStream)+self.reFormatMonthly(df,dtStr,dStream))
+        del dfList
+        timing = time.time() - start
+        self.state = max([x[4] for x in results])
+        comment = 'reformat range complete (numDates): '+str(len(dateStreams))
+        return results,timing,self.state,comment;
+
+    # stage checkpoints, so a rerun only redoes the stages a failed run didn't finish
+    def checkpointName(self,fHandle):
+        '''
+        Path of fHandle's stage checkpoint file (in its backup folder, next to the zip file list)
+
+        args:
+        * fHandle - str of BoM file identifier
+
+        returns:
+        * str path of the checkpoint csv
+        '''
+        return self.backupPath+fHandle+'/'+fHandle+'_checkpoint.csv';
+
+
+    def checkpoint(self,fHandle,stage,state,artefacts):
+        '''
+        Records a finished stage of fHandle's run (process name as logged, eg 'downloadFTP', 'compileLoop_beta',
+        'reFormatMonthly_stable') with the files it produced - one line appended and synced to disk per stage, nothing
+        is recorded for a failed stage
+
+        args:
+        * fHandle - str of BoM file identifier
+        * stage - str process name
+        * state - end state of the stage (0 = success)
+        * artefacts - list of str paths the stage produced (zip, observation store partition or .dat files)
+
+        returns:
+        nothing
+        '''
+        if int(state) != 0:
+            return;
+        try:
+            os.makedirs(os.path.dirname(self.checkpointName(fHandle)))
+        except:
+            pass
+        f = open(self.checkpointName(fHandle),'a')
+        f.write(dt.datetime.today().isoformat()+','+stage+','+';'.join(artefacts)+'\n')
+        f.flush()
+        os.fsync(f.fileno())
+        f.close()
+
+
+    def checkpoints(self,fHandle):
+        '''
+        Stages of fHandle's run with a checkpoint whose artefacts are all still on disk
+
+        args:
+        * fHandle - str of BoM file identifier
+
+        returns:
+        * dict of stage:list of artefacts (the latest checkpoint of each stage)
+        '''
+        done = {}
+        if not os.path.isfile(self.checkpointName(fHandle)):
+            return done;
+        f = open(self.checkpointName(fHandle),'r')
+        for line in f:
+            row = line.rstrip('\n').split(',',2)
+            # a line cut short by a crash mid write is ignored
+            if len(row) == 3 and line.endswith('\n'):
+                done[row[1]] = [x for x in row[2].split(';') if x != '']
+        f.close()
+        return dict((stage,x) for stage,x in done.items() if all(os.path.isfile(y) for y in x));
+
+
         # logger func
-    def logger(self,fHandle,process,timing,status,comment=None):
+    def logger(self,fHandle,process,timing,status,comment=None,stage=None):
         '''
-        Logger function - creates/maintains a csv log file for all steps in ANUClimate class
+        Logger function - appends a row to the csv log file (PyANUClimate_log.ANUClimateLog) for all steps in ANUClimate class
     
         args:
         * fHandle - str of BoM file identifier
         * process - str of ANUClimate_auto step
         * timing - str (rounded to 4 places) of time in secs for processing
         * status - end state of process (0 = success, 1 = fail)
+        * stage - (optional) ANUClimateStage of the step (self.stage after an instrumented method), also logged to
+          log/ANUClimate_stage_log.csv
         
         returns:
         nothing
         '''
-        # check if file exists, if not create it
-        if not os.path.isfile(self.logPath+'ANUClimate_log.csv'):
-            # create seq for date and processing increment (eg: '2017_05_27_1' being 1st step on 27/5/2017 file)
-            date = dt.datetime.today()
-            seq = date.isoformat().split('T')[0][:4]+'_'+date.isoformat().split('T')[0][5:7]+'_'+date.isoformat().split('T')[0][8:10]+'_1'
-            # create df
-            df = pd.DataFrame({'date':[dt.datetime.today().isoformat()],'seq':[seq],'file_handle':[fHandle],'process':[process],'timing_secs':[timing],'state':[status],'comment':[comment]})
-            # save df to csv
-            df.to_csv(self.logPath+'ANUClimate_log.csv')
-        # if file exists, open it
-        elif os.path.isfile(self.logPath+'ANUClimate_log.csv'):
-            df = pd.read_csv(self.logPath+'ANUClimate_log.csv',index_col=[0])
-            # find next increment by index size
-            prev = int(df.index.size)
-            date = dt.datetime.today()
-            seq = date.isoformat().split('T')[0][:4]+'_'+date.isoformat().split('T')[0][5:7]+'_'+date.isoformat().split('T')[0][8:10]+'_'+str(prev+1)
-            # create new df and append to existing
-            df1 = pd.DataFrame({'date':[dt.datetime.today().isoformat()],'seq':[seq],'file_handle':[fHandle],'process':[process],'timing_secs':[timing],'state':[status],'comment':[comment]})
-            df = df.append(df1)
-            # save df back to csv
-            df.to_csv(self.logPath+'ANUClimate_log.csv')
-        else:
-            pass
+        # one appended row (seq is '<today>_<row number>'), the log is never read back or rewritten
+        ANUClimateLog(self.logPath+'ANUClimate_log.csv',prepColumns,index=True,seq='seq').write({'date':dt.datetime.today().isoformat(),
+            'file_handle':fHandle,'process':process,'timing_secs':timing,'state':status,'comment':comment})
+        if stage is not None:
+            ANUClimateLog(self.logPath+'ANUClimate_stage_log.csv',stageColumns).write(stage.row(fHandle,process,status))
+        if stage is not None or process == 'run_complete':
+            self.recordMetrics(process,timing,status,stage)
+
+
+    def recordMetrics(self,process,timing,status,stage=None):
+        '''
+        Publishes a logged step to the node_exporter metrics file - stage durations, rows and bytes, station rows per
+        variable of reformat stages, archive size and download throughput, secs from BoM publishing the archive to the
+        .dat files being ready, and run completion
+
+        args:
+        * process - str of ANUClimate_auto step (as logged)
+        * timing - str of time in secs for processing
+        * status - end state of process (0 = success, 1 = fail)
+        * stage - (optional) ANUClimateStage of the step
+
+        returns:
+        nothing
+        '''
+        metrics = self.metrics()
+        values = []
+        if stage is not None:
+            labels = {'stage':process}
+            values += metrics.stageValues(stage,labels,status)
+            for fname,rows in stage.fileRows.items():
+                values.append(('anuclimate_dat_stations',{'stage':process,'variable':os.path.basename(fname).split('_')[0]},rows))
+            if process == 'downloadFTP' and int(status) == 0:
+                values.append(('anuclimate_archive_bytes',{},stage.bytesWritten))
+                values.append(('anuclimate_download_bytes_per_second',{},stage.bytesWritten/max(stage.wallSecs,0.001)))
+                values.append(('anuclimate_publish_timestamp_seconds',{},self.publishTime))
+            if process.startswith('reFormat') and int(status) == 0 and self.publishTime is not None:
+                values.append(('anuclimate_publish_to_dat_seconds',labels,time.time()-self.publishTime))
+        if process == 'run_complete':
+            values.append(('anuclimate_run_duration_seconds',{},float(timing)))
+            values.append(('anuclimate_run_timestamp_seconds',{},time.time()))
+        metrics.update(values)
+
+
+    def runHistory(self):
+        '''
+        Indexed sqlite copy of the csv log (log/ANUClimate_log.sqlite), see PyANUClimate_log.ANUClimateRunHistory
+
+        returns:
+        * ANUClimateRunHistory
+        '''
+        return ANUClimateRunHistory(self.logPath+'ANUClimate_log.sqlite',self.logPath+'ANUClimate_log.csv');
+
+
+    def metrics(self):
+        '''
+        node_exporter textfile metrics of this script (self.metricsScript) - in ANUCLIMATE_METRICS_DIR (the collector's
+        textfile dir) or log/metrics, see PyANUClimate_log.metricsFor
+
+        returns:
+        * ANUClimateMetrics
+        '''
+        return metricsFor(self.metricsScript,self.logPath);
 
 
 ####################################################################################
@@ -978,6 +2236,8 @@ if __name__ == '__main__':
 
     # function list:
     anc = ANUClimateAuto()
+    # profile the stages named by ANUCLIMATE_PROFILE or --profile (eg 'fileRead,fileClean,reFormatMonthly'), off by default
+    profileHooks([ANUClimateAuto],anc.logPath,'PyANUClimate')
 
     dataStream,fdsTiming,fdsState,fdsComment = anc.findDataStream()
 
@@ -988,32 +2248,40 @@ if __name__ == '__main__':
 
     ftpTiming,ftpState,ftpComment = anc.downloadFTP(fHandle)
 
-    anc.logger(fHandle,'downloadFTP',str(round(ftpTiming,4)),str(ftpState),str(ftpComment))
+    anc.logger(fHandle,'downloadFTP',str(round(ftpTiming,4)),str(ftpState),str(ftpComment),anc.stage)
+    # each finished stage is checkpointed with its outputs, PyANUClimate_RERUN.py resumes from the first one missing
+    anc.checkpoint(fHandle,'downloadFTP',ftpState,[anc.archiveName(fHandle)])
 
     if dataStream == 'alpha':
         dfDay,clTiming,clState,clComment = anc.compileLoop(fHandle,dateList[0],'alpha')
-        anc.logger(fHandle,'compileLoop_alpha',str(round(clTiming,4)),str(clState),str(clComment))
+        anc.logger(fHandle,'compileLoop_alpha',str(round(clTiming,4)),str(clState),str(clComment),anc.stage)
+        anc.checkpoint(fHandle,'compileLoop_alpha',clState,[anc.storeName(dateList[0],'alpha')])
         aTiming,aState,aComment = anc.reFormatDaily(dfDay,dateList[0])
-        anc.logger(fHandle,'reFormatDaily',str(round(aTiming,4)),str(aState),str(aComment))
+        anc.logger(fHandle,'reFormatDaily',str(round(aTiming,4)),str(aState),str(aComment),anc.stage)
+        anc.checkpoint(fHandle,'reFormatDaily',aState,anc.written)
     else:
-        dfDay,clTiming,clState,clComment = anc.compileLoop(fHandle,dateList[0],'alpha')
-        anc.logger(fHandle,'compileLoop_alpha',str(round(clTiming,4)),str(clState),str(clComment))
+        # parse each bomdat file once for all three datastreams
+        dfDay,dfBMth,dfSMth,clTiming,clState,clComment = anc.compileLoopAll(fHandle,dateList)
+        anc.logger(fHandle,'compileLoop_all',str(round(clTiming,4)),str(clState),str(clComment),anc.stage)
+        for dtStr,dStream in zip(dateList,['alpha','beta','stable']):
+            anc.checkpoint(fHandle,'compileLoop_'+dStream,clState,[anc.storeName(dtStr,dStream)])
         aTiming,aState,aComment = anc.reFormatDaily(dfDay,dateList[0])
-        anc.logger(fHandle,'reFormatDaily',str(round(aTiming,4)),str(aState),str(aComment))
+        anc.logger(fHandle,'reFormatDaily',str(round(aTiming,4)),str(aState),str(aComment),anc.stage)
+        anc.checkpoint(fHandle,'reFormatDaily',aState,anc.written)
         del dfDay
-        dfBMth,clTiming,clState,clComment = anc.compileLoop(fHandle,dateList[1],'beta')
-        anc.logger(fHandle,'compileLoop_beta',str(round(clTiming,4)),str(clState),str(clComment))
         bTiming,bState,bComment = anc.reFormatMonthOfDays(dfBMth,dateList[1],'beta')
-        anc.logger(fHandle,'reFormatMonthOfDays_beta',str(round(bTiming,4)),str(bState),str(bComment))
+        anc.logger(fHandle,'reFormatMonthOfDays_beta',str(round(bTiming,4)),str(bState),str(bComment),anc.stage)
+        anc.checkpoint(fHandle,'reFormatMonthOfDays_beta',bState,anc.written)
         bMTiming,bMState,bMComment = anc.reFormatMonthly(dfBMth,dateList[1],'beta')
-        anc.logger(fHandle,'reFormatMonthly_beta',str(round(bMTiming,4)),str(bMState),str(bMComment))
+        anc.logger(fHandle,'reFormatMonthly_beta',str(round(bMTiming,4)),str(bMState),str(bMComment),anc.stage)
+        anc.checkpoint(fHandle,'reFormatMonthly_beta',bMState,anc.written)
         del dfBMth
-        dfSMth,clTiming,clState,clComment = anc.compileLoop(fHandle,dateList[2],'stable')
-        anc.logger(fHandle,'compileLoop_stable',str(round(clTiming,4)),str(clState),str(clComment))
         sTiming,sState,sComment = anc.reFormatMonthOfDays(dfSMth,dateList[2],'stable')
-        anc.logger(fHandle,'reFormatMonthOfDays_stable',str(round(sTiming,4)),str(sState),str(sComment))
+        anc.logger(fHandle,'reFormatMonthOfDays_stable',str(round(sTiming,4)),str(sState),str(sComment),anc.stage)
+        anc.checkpoint(fHandle,'reFormatMonthOfDays_stable',sState,anc.written)
         sMTiming,sMState,sMComment = anc.reFormatMonthly(dfSMth,dateList[2],'stable')
-        anc.logger(fHandle,'reFormatMonthly_stable',str(round(sMTiming,4)),str(sMState),str(sMComment))
+        anc.logger(fHandle,'reFormatMonthly_stable',str(round(sMTiming,4)),str(sMState),str(sMComment),anc.stage)
+        anc.checkpoint(fHandle,'reFormatMonthly_stable',sMState,anc.written)
         del dfSMth
 
     timeFull = time.time()-startFull
@@ -1,6 +1,6 @@
 ####################################################################################
 # ANUClimate automation
-# v15.0
+# v16.0
 # author: Ian Marang
 #
 # Description:
@@ -13,62 +13,34 @@
 
 # import libraries
 import ftplib
-import decimal
 import os, sys
 import pandas as pd
 import numpy as np
 import datetime as dt
 from dateutil import relativedelta
 import zipfile
-import shutil
 import fnmatch as fn
 import calendar
 import time
-from tabulate import tabulate
 from glob import glob
 
-class ANUClimateAuto_rerun(object):
-    def __init__(self):
+# shared download, parsing and reformat code lives in the daily script
+from PyANUClimate import ANUClimateAuto
+# opt in stage profiling (ANUCLIMATE_PROFILE or --profile)
+from PyANUClimate_profile import profileHooks
 
-        self.hostName = 'ftp.bom.gov.au'
-        self.hostPath = '/anon2/home/ncc/srds/Scheduled_Jobs/DS082_ANU/'
-        self.destPath = '/srv/ANUClimate_auto/download/'
-        self.zipPath = '/srv/ANUClimate_auto/unzip/'
-        self.logPath = '/srv/ANUClimate_auto/log/'
-        self.backupPath = '/srv/ANUClimate_auto/backup/'
-        self.nodata = '-99.9'
-        self.state = 0
-        self.baseDir = '/srv/ANUClimate_auto/processed/fenner'
-        # varDict = df col name:[var name for file[0],alpha daily files location[1],beta month of days files location[2], stable month of days files location[3],beta monthly files location[4], stable monthly files location[5]]
-        self.varDict = {'Prec_mm':['rain',self.baseDir+'/rain_day_v2_0/alpha/dat/bomdat/',self.baseDir+'/rain_day_v2_0/beta/dat/bomdat/',self.baseDir+'/rain_day_v2_0/stable/dat/bomdat/',self.baseDir+'/rain_mth_v2_0/beta/dat/bomdat/',self.baseDir+'/rain_mth_v2_0/stable/dat/bomdat'],
-                        'Evap_mm':['evap',self.baseDir+'/evap_day_v2_0/alpha/dat/bomdat/',self.baseDir+'/evap_day_v2_0/beta/dat/bomdat/',self.baseDir+'/evap_day_v2_0/stable/dat/bomdat/',self.baseDir+'/evap_mth_v2_0/beta/dat/bomdat/',self.baseDir+'/evap_mth_v2_0/stable/dat/bomdat/'],
-                        'Tmax_C':['tmax',self.baseDir+'/tmax_day_v2_0/alpha/dat/bomdat/',self.baseDir+'/tmax_day_v2_0/beta/dat/bomdat/',self.baseDir+'/tmax_day_v2_0/stable/dat/bomdat/',self.baseDir+'/tmax_mth_v2_0/beta/dat/bomdat/',self.baseDir+'/tmax_mth_v2_0/stable/dat/bomdat/'],
-                        'Tmin_C':['tmin',self.baseDir+'/tmin_day_v2_0/alpha/dat/bomdat/',self.baseDir+'/tmin_day_v2_0/beta/dat/bomdat/',self.baseDir+'/tmin_day_v2_0/stable/dat/bomdat/',self.baseDir+'/tmin_mth_v2_0/beta/dat/bomdat/',self.baseDir+'/tmin_mth_v2_0/stable/dat/bomdat/'],
-                        'Vapp_avg_hPa':['vp',self.baseDir+'/vp_day_v2_0/alpha/dat/bomdat/',self.baseDir+'/vp_day_v2_0/beta/dat/bomdat/',self.baseDir+'/vp_day_v2_0/stable/dat/bomdat/',self.baseDir+'/vp_mth_v2_0/beta/dat/bomdat/',self.baseDir+'/vp_mth_v2_0/stable/dat/bomdat/'],
-                        'Temp_avg_C':['tavg',self.baseDir+'/tavg_day_v2_0/alpha/dat/bomdat/',self.baseDir+'/tavg_day_v2_0/beta/dat/bomdat/',self.baseDir+'/tavg_day_v2_0/stable/dat/bomdat/',self.baseDir+'/tavg_mth_v2_0/beta/dat/bomdat/',self.baseDir+'/tavg_mth_v2_0/stable/dat/bomdat/'],
-                        'Vpd_avg_hPa':['vpd',self.baseDir+'/vpd_day_v2_0/alpha/dat/bomdat/',self.baseDir+'/vpd_day_v2_0/beta/dat/bomdat/',self.baseDir+'/vpd_day_v2_0/stable/dat/bomdat/',self.baseDir+'/vpd_mth_v2_0/beta/dat/bomdat/',self.baseDir+'/vpd_mth_v2_0/stable/dat/bomdat/']}
-    
+class ANUClimateAuto_rerun(ANUClimateAuto):
+    '''
+    Rerun version of ANUClimateAuto - inherits downloadFTP, fileOpen, compileLoop, reformat and logger
+    functions from the daily script so both jobs process the BoM files the same way
 
-
-     ####################################################################################
-    # UTILITY (prep)
-    ####################################################################################
-
-    # code for fixed width files - GENERAL
-    def to_fwf(self,df, fname, type):
-        '''
-        Function to call from within reformat functions to output fixed width file format .dat files for ANUClimate.
-        args:
-        * df - pandas dataframe
-        * fname - output filename
-        * type - str of output file type (one of 'normal','pw' or 'fd')
-        '''
-        if type == 'normal':
-            content = tabulate(df, tablefmt="plain",floatfmt=".1f")
-        elif type == 'pw':
-            content = tabulate(df, tablefmt="plain",floatfmt=".3f")
-        open(fname, "w").write(content)
-        
+    Compared with the copy of the class this script used to carry (v15.0):
+    * stable rain monthly .dat files go to rain_mth_v2_0/stable/dat/bomdat/ (the old path had no trailing slash, so
+      they were written as rain_mth_v2_0/stable/dat/bomdatrain_<YYYY_MM>.dat); files already written there are not moved
+    * the output dirs are made on start as the daily script does
+    * a failed download is logged as a failed downloadFTP (state 1) and the rerun goes on to the next date, where the
+      old copy stopped the whole rerun with the ftplib exception
+    '''
 
     # date string finder
     def getDateStringMissing(self,call=None,fHandle=None):
@@ -125,932 +97,162 @@ class ANUClimateAuto_rerun(object):
         return dateList,timing,self.state,comment;
         
         
-    def findMissingDates(self,dateL):
+    def findIncompleteRuns(self):
         '''
-        Takes list of dates and finds dates with no entry from the start of the log till now
-        
-        args:
-        * dateL - list of dates in log
-        
+        Finds the runs of the last 6 months (BoM files are deleted after 6 months), from the first logged run on, that
+        never ran or never reached run_complete - one query on the indexed run history rather than a scan of the log csv
+
         returns:
-        * missing - sorted list of missing dates
+        * list of file handles to rerun in date order (those logged for dates that started, built from the date otherwise)
         '''
-        # set cut off at 6mth mark (BoM files deleted after 6mths)
         threshDate = dt.date.today() - relativedelta.relativedelta(months=6)
-        print threshDate
-        if dateL[0]<threshDate:
-            print 'dateL[0] older than threshold'
-            startD = threshDate
-        else:
-            print 'dateL[0] not older than threshold'
-            startD = dateL[0]
-        date_set = set(startD + dt.timedelta(x) for x in range((dt.date.today() - startD).days))
-        missing = sorted(date_set - set(dateL))
-        return missing;
-    
+        missing = self.runHistory().incompleteRuns(threshDate,dt.date.today())
+        return [fH if fH is not None else 'ANUdaily9am3pm'+x.strftime('%Y%m%d')+calendar.day_name[x.weekday()][:3] for x,fH in missing];
 
-    def downloadFTP(self,fHandle):
-        '''
-        Connects to BoM ftp site, makes dirs, downloads file and unzips it, writing a list of unzipped files in the backup dir
 
-        args:
-        * fHandle - str used from ANUClimateGetDateString func
-        
-        returns:
-        timing, state and comment
+    def resumeRuns(self,runs,srcHandle):
         '''
-        start = time.time()
-        # establish ftp connection and move to correct folder
-        ftp = ftplib.FTP(self.hostName)
-        ftp.login()
-        ftp.cwd(self.hostPath)
-        # find correct file on ftp server and create vars for folder names
-        fName = 'DS082_'+fHandle+'.zip'
-        dirName = self.destPath+fHandle
-        zipName = self.zipPath+fHandle
-        listName = self.backupPath+fHandle
-        # make folders
-        try:
-            os.makedirs(dirName)
-        except:
-            pass
-        try:
-            os.makedirs(zipName)
-        except:
-            pass
-        try:
-            os.makedirs(listName)
-        except:
-            pass
-        # create zip file and download
-        zFile = open(dirName+'/'+fName,'wb')
-        remoteSize = ftp.size(fName)
-        ftp.retrbinary('RETR '+fName,zFile.write)
-        zFile.close()
-        localInfo = os.stat(dirName+'/'+fName)
-        if str(localInfo.st_size)!=str(remoteSize):
-            self.state = 1
-            comment = 'Size check failed'
-        else:
-            pass
-        # move to download folder and extract to unzip folder
-        os.chdir(dirName)
-        try:
-            zipFile = zipfile.ZipFile(dirName+'/'+fName,'r')
-            zipFile.extractall(zipName)
-        except Exception as e:
-            self.state = 1
-            comment = 'Unzip failed '+str(e)
-        # make a list of all downloaded files
-        f = open(listName+'/'+fHandle+'.txt','w')
-        for fname in zipFile.namelist():
-            f.write(fname+',\n')
-        f.close()
-        # set state
-        self.state = 0
-        comment = 'FTP success for '+str(fHandle)
-        timing = time.time() - start
-        return timing,self.state,comment;
-
+        Finishes a set of failed or missed runs from their stage checkpoints - only stages without a checkpoint (or whose
+        outputs have gone) are run, the compiled dfs the remaining reformats need are loaded from the observation store
+        if their compile finished, and any others are compiled together from one download and parse of srcHandle's archive
 
-    def daysInMth(self,yrIn,mthIn):
-        '''
-        Function to check for number of days in month
-        
         args:
-        * yrIn - int of current year
-        * mthIn - int of current month
-        * dyIn - int of current day
-        
-        returns:
-        daysInMth - int of number of days in month
-        '''
-        mthDays = {31:['01','03','05','07','08','10','12'],30:['04','06','09','11'],28:['02']}
-        mthDaysLeap = {31:['01','03','05','07','08','10','12'],30:['04','06','09','11'],29:['02']}
-    
-        date = dt.datetime(yrIn,mthIn,1)
-        mth = date.isoformat().split('T')[0][5:7]
-        yr = date.isoformat().split('T')[0][:4]
-    
-    
-        if calendar.isleap(int(yr)):
-            for var,varDetails in mthDaysLeap.items():
-                if mth in set(varDetails):
-                    daysInMth = var
-        else:
-            for var,varDetails in mthDays.items():
-                if mth in set(varDetails):
-                    daysInMth = var
-    
-        return daysInMth;
-
-    ####################################################################################
-    # FILE OPEN
-    ####################################################################################
-
-    # df compiler
-    # testing dropping comparison to see why some rows are dropped from final df
-    def fileOpen(self,fname,dtStr,dStream):
-        '''
-        Daily operations function for use with cron job to store daily bomdat input files
-
-        - drops rows based on quality flags and accumulated days into a dfRemove 
-        (currently not stored) and dfKeep for use in subsequent reformatting into the daily files
-        --- rows with quality flags 'Y' or 'N' kept, anything else dropped
-        --- rows with accumulated days > 1 is dropped
-
-        Args:
-        fname - a string representing the path/filename to open and process
-        '''
-
-        # set col parameters and import unzipped test file
-        usecols = ['Station Number',
-               'Year',
-               'Month',
-               'Day',
-               'Precipitation in the 24 hours before 9am (local time) in mm',
-               'Quality of precipitation value',
-               'Number of days of rain within the days of accumulation',
-               'Accumulated number of days over which the precipitation was measured',
-               'Evaporation in 24 hours before 9am (local time) in mm',
-               'Quality of evaporation in 24 hours before 9am (local time)',
-               'Days of accumulation for evaporation',
-               'Maximum temperature in 24 hours after 9am (local time) in Degrees C',
-               'Quality of maximum temperature in 24 hours after 9am (local time)',
-               'Days of accumulation of maximum temperature',
-               'Minimum temperature in 24 hours before 9am (local time) in Degrees C',
-               'Quality of minimum temperature in 24 hours before 9am (local time)',
-               'Days of accumulation of minimum temperature',
-               'Air temperature observation at 09 hours Local Time in Degrees C',
-               'Quality of air temperature observation at 09 hours Local Time',
-               'Air temperature observation at 15 hours Local Time in Degrees C',
-               'Quality of air temperature observation at 15 hours Local Time',
-               'Dew point temperature observation at 09 hours Local Time in Degrees C',
-               'Quality of dew point temperature observation at 09 hours Local Time',
-               'Dew point temperature observation at 15 hours Local Time in Degrees C',
-               'Quality of dew point temperature observation at 15 hours Local Time',
-               'Wet bulb temperature observation at 09 hours Local Time in Degrees C',
-               'Quality of wet bulb temperature observation at 09 hours Local Time',
-               'Wet bulb temperature observation at 15 hours Local Time in Degrees C',
-               'Quality of wet bulb temperature observation at 15 hours Local Time',
-               'Relative humidity for observation at 09 hours Local Time in percentage %',
-               'Quality of relative humidity for observation at 09 hours Local Time',
-               'Relative humidity for observation at 15 hours Local Time in percentage %',
-               'Quality of relative humidity for observation at 15 hours Local Time',
-               'Vapour pressure at 09 hours Local Time in hPa',
-               'Quality of vapour pressure at 09 hours Local Time',
-               'Vapour pressure at 15 hours Local Time in hPa',
-               'Quality of vapour pressure at 15 hours Local Time',
-               'Saturated vapour pressure at 09 hours in hPa',
-               'Quality of saturated vapour pressure at 09 hours Local Time',
-               'Saturated vapour pressure at 15 hours in hPa',
-               'Quality of saturated vapour pressure at 15 hours Local Time']
-
+        * runs - list of (fHandle, dateStreams) of the runs to finish, dateStreams as for compileRange
+          (eg [('2017_10_29','alpha'),('2017_08','beta'),('2017_04','stable')])
+        * srcHandle - str of BoM file identifier of the archive missing dfs are compiled from (the run's own for end
+          of month runs, the newest one for a batch of alpha days)
 
-        headers = ['Station_ID',
-                   'Year',
-                   'Month',
-                   'Day',
-                   'Prec_mm',# Prec = Precipitation
-                   'Prec_Quality',
-                   'Prec_Days_of_Rain_within_Accumulation',
-                   'Prec_Accumulated_Days',
-                   'Evap_mm', # Evap = Evaporation
-                   'Evap_Quality',
-                   'Evap_Accumulated_Days',
-                   'Tmax_C', # Tmax = Max Temperature
-                   'Tmax_Quality',
-                   'Tmax_Accumulated_Days',
-                   'Tmin_C', # Tmin = Min Temperature
-                   'Tmin_Quality',
-                   'Tmin_Accumulated_Days',
-                   'Temp_9am_C', # Temp = Air Temperature
-                   'Temp_9am_Quality',
-                   'Temp_3pm_C',
-                   'Temp_3pm_Quality',
-                   'DewP_9am_C', # DewP = Dew Point temperature
-                   'DewP_9am_Quality',
-                   'DewP_3pm_C',
-                   'DewP_3pm_Quality',
-                   'WetB_9am_C', # WetB = Wet Bulb temperature
-                   'WetB_9am_Quality',
-                   'WetB_3pm_C',
-                   'WetB_3pm_Quality',
-                   'RelH_9am_%', # RelH = Relative Humidity
-                   'RelH_9am_Quality',
-                   'RelH_3pm_%',
-                   'RelH_3pm_Quality',
-                   'Vapp_9am_hPa', # Vapp = Vapour Pressure
-                   'Vapp_9am_Quality',
-                   'Vapp_3pm_hPa',
-                   'Vapp_3pm_Quality',
-                   'SVap_9am_hPa', # SVap = Saturated Vapour pressure
-                   'SVap_9am_Quality',
-                   'SVap_3pm_hPa',
-                   'SVap_3pm_Quality']
-
-        nodata = '-99.9'
-        dfIn = pd.read_table(fname,sep=',',usecols=usecols)
-        dfIn.columns = headers
-        dfIn.Station_ID = [str(x).zfill(6) for x in dfIn.Station_ID]
-
-        # from http://stackoverflow.com/questions/13445241/replacing-blank-values-white-space-with-nan-in-pandas
-        dfIn = dfIn.applymap(lambda x: np.nan if isinstance(x, basestring) and x.isspace() else x)
-
-        # strip extra whitespace
-        dfIn = dfIn.applymap(lambda x: x.strip() if isinstance(x, basestring) else x)
-        
-        # fix type on year & month
-        dfIn.Day = [str(x).zfill(2) for x in dfIn.Day]
-        dfIn.Month = [str(x).zfill(2) for x in dfIn.Month]
-        dfIn.Year = [str(x) for x in dfIn.Year]
-        
-        # only propagate df for dStream and date
-        if dStream == 'alpha':
-            df = dfIn.loc[(dfIn.Year==dtStr.split('_')[0])&(dfIn.Month==dtStr.split('_')[1])&(dfIn.Day==dtStr.split('_')[-1])]
-        else:
-            df = dfIn.loc[(dfIn.Year==dtStr.split('_')[0])&(dfIn.Month==dtStr.split('_')[1])]
-            if df.Day.min()!='01' and df.index.size!=0:
-                station = df.Station_ID.iloc[0]
-                dayList = range(1,int(df.Day.min()))
-                dayList = [str(x).zfill(2) for x in dayList]
-                a = {'Station_ID':[station]*len(dayList),
-                      'Year':[dtStr.split('_')[0]]*len(dayList),
-                      'Month':[dtStr.split('_')[1]]*len(dayList),
-                      'Day':dayList,
-                     'Prec_mm':[np.nan]*len(dayList),
-                     'Prec_Days_of_Rain_within_Accumulation':[np.nan]*len(dayList),
-                     'Prec_Quality':[np.nan]*len(dayList),
-                     'Prec_Accumulated_Days':[np.nan]*len(dayList),
-                     'Evap_mm':[np.nan]*len(dayList),
-                     'Evap_Quality':[np.nan]*len(dayList),
-                     'Evap_Accumulated_Days':[np.nan]*len(dayList),
-                     'Tmax_C':[np.nan]*len(dayList),
-                     'Tmax_Quality':[np.nan]*len(dayList),
-                     'Tmax_Accumulated_Days':[np.nan]*len(dayList),
-                     'Tmin_C':[np.nan]*len(dayList),
-                     'Tmin_Quality':[np.nan]*len(dayList),
-                     'Tmin_Accumulated_Days':[np.nan]*len(dayList),
-                     'Temp_9am_C':[np.nan]*len(dayList),
-                     'Temp_9am_Quality':[np.nan]*len(dayList),
-                     'Temp_3pm_C':[np.nan]*len(dayList),
-                     'Temp_3pm_Quality':[np.nan]*len(dayList),
-                     'DewP_9am_C':[np.nan]*len(dayList),
-                     'DewP_9am_Quality':[np.nan]*len(dayList),
-                     'DewP_3pm_C':[np.nan]*len(dayList),
-                     'DewP_3pm_Quality':[np.nan]*len(dayList),
-                     'WetB_9am_C':[np.nan]*len(dayList),
-                     'WetB_9am_Quality':[np.nan]*len(dayList),
-                     'WetB_3pm_C':[np.nan]*len(dayList),
-                     'WetB_3pm_Quality':[np.nan]*len(dayList),
-                     'RelH_9am_%':[np.nan]*len(dayList),
-                     'RelH_9am_Quality':[np.nan]*len(dayList),
-                     'RelH_3pm_%':[np.nan]*len(dayList),
-                     'RelH_3pm_Quality':[np.nan]*len(dayList),
-                     'Vapp_9am_hPa':[np.nan]*len(dayList),
-                     'Vapp_9am_Quality':[np.nan]*len(dayList),
-                     'Vapp_3pm_hPa':[np.nan]*len(dayList),
-                     'Vapp_3pm_Quality':[np.nan]*len(dayList),
-                     'SVap_9am_hPa':[np.nan]*len(dayList),
-                     'SVap_9am_Quality':[np.nan]*len(dayList),
-                     'SVap_3pm_hPa':[np.nan]*len(dayList),
-                     'SVap_3pm_Quality':[np.nan]*len(dayList)}
-
-                newdf = pd.DataFrame.from_dict(a)
-                df = df.append(newdf)
-        
-        del dfIn
-        #print 'second index size: '+str(df.index.size)
-        # fix Quality
-        # convert fields to str for removal comparison operation
-        df.Prec_Quality = [str(x) for x in df.Prec_Quality]
-        df.Evap_Quality = [str(x) for x in df.Evap_Quality]
-        df.Tmax_Quality = [str(x) for x in df.Tmax_Quality]
-        df.Tmin_Quality = [str(x) for x in df.Tmin_Quality]
-        df.Temp_9am_Quality = [str(x) for x in df.Temp_9am_Quality]
-        df.Temp_3pm_Quality = [str(x) for x in df.Temp_3pm_Quality]
-        df.DewP_9am_Quality = [str(x) for x in df.DewP_9am_Quality]
-        df.DewP_3pm_Quality = [str(x) for x in df.DewP_3pm_Quality]
-        df.WetB_9am_Quality = [str(x) for x in df.WetB_9am_Quality]
-        df.WetB_3pm_Quality = [str(x) for x in df.WetB_3pm_Quality]
-        df.RelH_9am_Quality = [str(x) for x in df.RelH_9am_Quality]
-        df.RelH_3pm_Quality = [str(x) for x in df.RelH_3pm_Quality]
-        df.Vapp_9am_Quality = [str(x) for x in df.Vapp_9am_Quality]
-        df.Vapp_3pm_Quality = [str(x) for x in df.Vapp_3pm_Quality]
-        df.SVap_9am_Quality = [str(x) for x in df.SVap_9am_Quality]
-        df.SVap_3pm_Quality = [str(x) for x in df.SVap_3pm_Quality]
-
-        # fix data fields (testing Assign rather than loop)
-        df.Prec_mm = [str(x) for x in df.Prec_mm]
-        df.Evap_mm = [str(x) for x in df.Evap_mm]
-        df.Tmax_C = [str(x) for x in df.Tmax_C]
-        df.Tmin_C = [str(x) for x in df.Tmin_C]
-        df.Vapp_9am_hPa = [str(x) for x in df.Vapp_9am_hPa]
-        df.Vapp_3pm_hPa = [str(x) for x in df.Vapp_3pm_hPa]
-        df.SVap_9am_hPa = [str(x) for x in df.SVap_9am_hPa]
-        df.SVap_3pm_hPa = [str(x) for x in df.SVap_3pm_hPa]
-        
-        
-        # fix data fields (testing Assign rather than loop)
-        df.Prec_mm = [np.nan if len(x.strip())==0 or x!=x or x == 'nan' else float(x) for x in df.Prec_mm]
-        df.Evap_mm = [np.nan if len(x.strip())==0 or x!=x or x == 'nan' else float(x) for x in df.Evap_mm]
-        df.Tmax_C = [np.nan if len(x.strip())==0 or x!=x or x == 'nan' else float(x) for x in df.Tmax_C]
-        df.Tmin_C = [np.nan if len(x.strip())==0 or x!=x or x == 'nan' else float(x) for x in df.Tmin_C]
-        df.Vapp_9am_hPa = [np.nan if len(x.strip())==0 or x!=x or x == 'nan' else float(x) for x in df.Vapp_9am_hPa]
-        df.Vapp_3pm_hPa = [np.nan if len(x.strip())==0 or x!=x or x == 'nan' else float(x) for x in df.Vapp_3pm_hPa]
-        df.SVap_9am_hPa = [np.nan if len(x.strip())==0 or x!=x or x == 'nan' else float(x) for x in df.SVap_9am_hPa]
-        df.SVap_3pm_hPa = [np.nan if len(x.strip())==0 or x!=x or x == 'nan' else float(x) for x in df.SVap_3pm_hPa]
-        
-        
-        # convert string nan to N for empty Quality flag cells
-        df.loc[(df.Prec_mm.notnull()) & (df.Prec_Quality.isnull()), 'Prec_Quality'] = 'N'
-        df.loc[(df.Evap_mm.notnull()) & (df.Evap_Quality.isnull()), 'Evap_Quality'] = 'N'
-        df.loc[(df.Tmax_C.notnull()) & (df.Tmax_Quality.isnull()), 'Tmax_Quality'] = 'N'
-        df.loc[(df.Tmin_C.notnull()) & (df.Tmin_Quality.isnull()), 'Tmin_Quality'] = 'N'
-        df.loc[(df.Temp_9am_C.notnull()) & (df.Temp_9am_Quality.isnull()), 'Temp_9am_Quality'] = 'N'
-        df.loc[(df.Temp_3pm_C.notnull()) & (df.Temp_3pm_Quality.isnull()), 'Temp_3pm_Quality'] = 'N'
-        df.loc[(df.DewP_9am_C.notnull()) & (df.DewP_9am_Quality.isnull()), 'DewP_9am_Quality'] = 'N'
-        df.loc[(df.DewP_3pm_C.notnull()) & (df.DewP_3pm_Quality.isnull()), 'DewP_3pm_Quality'] = 'N'
-        df.loc[(df.WetB_9am_C.notnull()) & (df.WetB_9am_Quality.isnull()), 'WetB_9am_Quality'] = 'N'
-        df.loc[(df.WetB_3pm_C.notnull()) & (df.WetB_3pm_Quality.isnull()), 'WetB_3pm_Quality'] = 'N'
-        df.loc[(df['RelH_9am_%'].notnull()) & (df.RelH_9am_Quality.isnull()), 'RelH_9am_Quality'] = 'N'
-        df.loc[(df['RelH_3pm_%'].notnull()) & (df.RelH_3pm_Quality.isnull()), 'RelH_3pm_Quality'] = 'N'
-        df.loc[(df.Vapp_3pm_hPa.notnull()) & (df.Vapp_9am_Quality.isnull()), 'Vapp_9am_Quality'] = 'N'
-        df.loc[(df.Vapp_3pm_hPa.notnull()) & (df.Vapp_3pm_Quality.isnull()), 'Vapp_3pm_Quality'] = 'N'
-        df.loc[(df.SVap_3pm_hPa.notnull()) & (df.SVap_9am_Quality.isnull()), 'SVap_9am_Quality'] = 'N'
-        df.loc[(df.SVap_3pm_hPa.notnull()) & (df.SVap_3pm_Quality.isnull()), 'SVap_3pm_Quality'] = 'N'
-        
-        
-        # discrepancy with station 14955 Prec_accumm_day = 1 tho prec_mm empty
-        df.Prec_Accumulated_Days = df.Prec_Accumulated_Days.apply(lambda x: np.nan if isinstance(x, basestring) and x.isspace() else x)
-        
-        # fix Accum days
-        # convert field to str for removal comparison operation
-        df.Prec_Accumulated_Days = [str(x) for x in df.Prec_Accumulated_Days]
-        df.Evap_Accumulated_Days = [str(x) for x in df.Evap_Accumulated_Days]
-        df.Tmax_Accumulated_Days = [str(x) for x in df.Tmax_Accumulated_Days]
-        df.Tmin_Accumulated_Days = [str(x) for x in df.Tmin_Accumulated_Days]
-        
-        # make all accum flags numeric
-        df.Prec_Accumulated_Days = [0 if x!=x or x == 'nan' else int(float(x)) for x in df.Prec_Accumulated_Days]
-        df.Evap_Accumulated_Days = [0 if x!=x or x == 'nan' else int(float(x)) for x in df.Evap_Accumulated_Days]
-        df.Tmax_Accumulated_Days = [0 if x!=x or x == 'nan' else int(float(x)) for x in df.Tmax_Accumulated_Days]
-        df.Tmin_Accumulated_Days = [0 if x!=x or x == 'nan' else int(float(x)) for x in df.Tmin_Accumulated_Days]
-
-        
-        # convert nan to 1 for zero Accumulated days if var is not null
-        df.loc[(df.Prec_mm.notnull()) & (df.Prec_Accumulated_Days==0),'Prec_Accumulated_Days'] = 1
-        df.loc[(df.Evap_mm.notnull()) & (df.Evap_Accumulated_Days==0),'Evap_Accumulated_Days'] = 1
-        
-        # mark rows with empty prec_mm but accum flag = 1 as accum flag = 0
-        df.loc[(df.Prec_mm.isnull()) & (df.Prec_Accumulated_Days==1),'Prec_Accumulated_Days'] = 0
-        
-        # mark temp accum days flag > 1 as np.nan
-        #df.loc[df.Tmax_Accumulated_Days>1,'Tmax_C']=np.nan
-        #df.loc[df.Tmin_Accumulated_Days>1,'Tmin_C']=np.nan
-        
-        # find rows with quality NOT == ('Y','N') or Accumulated_days>1 replace
-        okQual = ['Y','N']
-
-        # quality rows
-        df.loc[~df.Prec_Quality.isin(okQual),'Prec_mm']=np.nan
-        df.loc[~df.Evap_Quality.isin(okQual),'Evap_mm']=np.nan
-        df.loc[~df.Tmax_Quality.isin(okQual),'Tmax_C']=np.nan
-        df.loc[~df.Tmin_Quality.isin(okQual),'Tmin_C']=np.nan
-        df.loc[~df.Temp_9am_Quality.isin(okQual),'Temp_9am_C']=np.nan
-        df.loc[~df.Temp_3pm_Quality.isin(okQual),'Temp_3pm_C']=np.nan
-        df.loc[~df.DewP_9am_Quality.isin(okQual),'DewP_9am_C']=np.nan
-        df.loc[~df.DewP_3pm_Quality.isin(okQual),'DewP_3pm_C']=np.nan
-        df.loc[~df.WetB_9am_Quality.isin(okQual),'WetB_9am_C']=np.nan
-        df.loc[~df.WetB_3pm_Quality.isin(okQual),'WetB_3pm_C']=np.nan
-        df.loc[~df.RelH_9am_Quality.isin(okQual),'RelH_9am_%']=np.nan
-        df.loc[~df.RelH_3pm_Quality.isin(okQual),'RelH_3pm_%']=np.nan
-        df.loc[~df.Vapp_9am_Quality.isin(okQual),'Vapp_9am_hPa']=np.nan
-        df.loc[~df.Vapp_3pm_Quality.isin(okQual),'Vapp_3pm_hPa']=np.nan
-        df.loc[~df.SVap_9am_Quality.isin(okQual),'SVap_9am_hPa']=np.nan
-        df.loc[~df.SVap_3pm_Quality.isin(okQual),'SVap_3pm_hPa']=np.nan
-
-
-        # add cols for Tavg, Vavg, Year_Month (for output files) and index (for cross ref)
-        df = df.assign(Temp_avg_C=(df.Tmax_C+df.Tmin_C)/2.,Vapp_avg_hPa=(df.Vapp_9am_hPa+df.Vapp_3pm_hPa)/2.,SVap_avg_hPa=(df.SVap_9am_hPa+df.SVap_3pm_hPa)/2.)
-        df = df.assign(Vpd_avg_hPa=df.SVap_avg_hPa-df.Vapp_avg_hPa)
-        df['Year_Month'] = df[['Year','Month']].apply(lambda x: '_'.join(x),axis=1)
-        df['primary_key'] = df[['Station_ID','Year','Month','Day']].apply(lambda x: '_'.join(x),axis=1)
-        
-        
-        # adjust cols for month of days file output
-        df.drop(['Prec_Quality',
-                 'Evap_Quality',
-                 'Tmax_Quality',
-                 'Tmax_Accumulated_Days',
-                 'Tmin_Quality',
-                 'Tmin_Accumulated_Days',
-                 'Temp_9am_C',
-                 'Temp_9am_Quality',
-                 'Temp_3pm_C',
-                 'Temp_3pm_Quality',
-                 'DewP_9am_C',
-                 'DewP_9am_Quality',
-                 'DewP_3pm_C',
-                 'DewP_3pm_Quality',
-                 'WetB_9am_C',
-                 'WetB_9am_Quality',
-                 'WetB_3pm_C',
-                 'WetB_3pm_Quality',
-                 'RelH_9am_%',
-                 'RelH_9am_Quality',
-                 'RelH_3pm_%',
-                 'RelH_3pm_Quality',
-                 'Vapp_9am_hPa',
-                 'Vapp_9am_Quality',
-                 'Vapp_3pm_hPa',
-                 'Vapp_3pm_Quality',
-                 'SVap_9am_hPa',
-                 'SVap_9am_Quality',
-                 'SVap_3pm_hPa',
-                 'SVap_3pm_Quality'],inplace=True,axis=1)
-        
-        df.set_index(['primary_key'],inplace=True)
-        df.sort_index(inplace=True)
-        return df;
-
-
-    ####################################################################################
-    # REFORMAT to output
-    ####################################################################################
-
-    
-    def getData(self,df,var,station):
-        '''
-        getData function - used within reformatDaily and reformatMonthOfDays functions to subset df and create dfOut
-        
-        args:
-        * df - input dataframe from BoM data
-        * var - str of one of desired BoM variables
-        * station - str of BoM station
-        
         returns:
-        * dfOut - a reformatted df for use in .dat files
-        '''
-        data = df[var].loc[df.Station_ID == station].values
-        station = str(station).zfill(6)
-        dfOut = pd.DataFrame({station:[x for x in data]},dtype=str)
-        return dfOut.T;
-    
-    
-    def getMthData(self,df,var,station,numDays):
+        nothing (stages are logged and checkpointed against their run's fHandle)
         '''
-        getMthData function - used within reformatMonthly function to subset df and create dfOut
-        
-        args:
-        * df - input dataframe from BoM data
-        * var - str of one of desired BoM variables
-        * station - str of BoM station
-        
-        returns:
-        * dfOut - a reformatted df for use in .dat files
-        '''
-        data = df[var].loc[df.Station_ID == station].values
-        data1 = np.asarray(data)
-        data1 = [np.nan if x!=x else float(x) for x in data1]
-        # count number of NaN
-        numNonNan = df[var].loc[df.Station_ID == station].notnull().sum()
-        # split processing based on MH email into prec/evap and rest
-        # prec/evap already have checks in place, evap needs min 20 days, prec has no day requirement
-        if var == 'Prec_mm':
-            accumTotP = df.Prec_Accumulated_Days.loc[df.Station_ID==station].sum()
-            lastDayFlag = df.Prec_Accumulated_Days.loc[df.Station_ID==station].tail(1)
-            if accumTotP!=accumTotP:
-                pass
+        start = time.time()
+        runs = [(fHandle,list(dateStreams)) for fHandle,dateStreams in runs]
+        done = dict((fHandle,self.checkpoints(fHandle)) for fHandle,dateStreams in runs)
+        # reformat stages still to run, and the (dtStr, dStream) dfs they need
+        todo = []
+        for fHandle,dateStreams in runs:
+            if len(done[fHandle]) != 0:
+                self.logger(fHandle,'resume','0.001','0','checkpointed: '+', '.join(sorted(done[fHandle]))+' RERUN')
+            for dtStr,dStream in dateStreams:
+                stages = ['reFormatDaily'] if dStream == 'alpha' else ['reFormatMonthOfDays_'+dStream,'reFormatMonthly_'+dStream]
+                todo += [(fHandle,dtStr,dStream,x) for x in stages if x not in done[fHandle]]
+        compileList = []
+        for fHandle,dtStr,dStream,stage in todo:
+            if 'compileLoop_'+dStream not in done[fHandle] and (fHandle,dtStr,dStream) not in compileList:
+                compileList.append((fHandle,dtStr,dStream))
+
+        dfDict = {}
+        if len(compileList) != 0:
+            compileRuns = sorted(set(x[0] for x in compileList))
+            if 'downloadFTP' in self.checkpoints(srcHandle):
+                ftpTiming,ftpState,ftpComment = 0.001,0,'checkpointed'
+                ftpStage = None
             else:
-                if float(accumTotP)!=float(numDays):
-                    dataOut = np.nan
+                ftpTiming,ftpState,ftpComment = self.downloadFTP(srcHandle)
+                ftpStage = self.stage
+                self.checkpoint(srcHandle,'downloadFTP',ftpState,[self.archiveName(srcHandle)])
+            for fHandle in compileRuns:
+                self.logger(fHandle,'downloadFTP',str(round(ftpTiming,4)),str(ftpState),str(ftpComment)+' ('+srcHandle+') RERUN',ftpStage)
+            if ftpState != 0:
+                return;
+            pairs = []
+            for fHandle,dtStr,dStream in compileList:
+                if (dtStr,dStream) not in pairs:
+                    pairs.append((dtStr,dStream))
+            dfList,clTiming,clState,clComment = self.compileRange(srcHandle,pairs)
+            clStage = self.stage
+            dfDict = dict(zip(pairs,dfList))
+            del dfList
+            for fHandle in compileRuns:
+                streams = [x[2] for x in compileList if x[0] == fHandle]
+                process = 'compileLoop_all' if len(streams) == 3 else 'compileLoop_'+'_'.join(streams)
+                self.logger(fHandle,process,str(round(clTiming,4)),str(clState),str(clComment)+' (compileRange '+srcHandle+') RERUN',clStage)
+                for dtStr,dStream in [x[1:] for x in compileList if x[0] == fHandle]:
+                    self.checkpoint(fHandle,'compileLoop_'+dStream,clState,[self.storeName(dtStr,dStream)])
+
+        for fHandle,dateStreams in runs:
+            for dtStr,dStream in dateStreams:
+                stages = [x[3] for x in todo if x[:3] == (fHandle,dtStr,dStream)]
+                if len(stages) == 0:
+                    continue
+                if (dtStr,dStream) in dfDict:
+                    df = dfDict.pop((dtStr,dStream))
                 else:
-                    if float(lastDayFlag) >= 1.:
-                        dataOut=np.nansum(data1)
-                    else:
-                        dataOut = np.nan
-        elif var in ('Tmax_C','Tmin_C','Vapp_avg_hPa','Temp_avg_C','Vpd_avg_hPa','Evap_mm'):# proceed if number of nonNaNs >=25
-            if numNonNan >= 25:
-                if var == 'Evap_mm':
-                    accumTotE = df.Evap_Accumulated_Days.loc[df.Station_ID==station].sum()
-                    if accumTotE!=accumTotE:
-                        pass
+                    df = self.storeLoad(dtStr,dStream)
+                for stage in stages:
+                    if stage == 'reFormatDaily':
+                        rTiming,rState,rComment = self.reFormatDaily(df,dtStr)
+                    elif stage.startswith('reFormatMonthOfDays'):
+                        rTiming,rState,rComment = self.reFormatMonthOfDays(df,dtStr,dStream)
                     else:
-                        if float(accumTotE)<25. or float(accumTotE)>35.:
-                            dataOut=np.nan
-                        else:
-                            dataOut=(np.nansum(data1)/float(accumTotE))*float(numDays)
-                else:
-                    dataOut=np.nanmean(data1)
-            else:
-                dataOut = np.nan
-        # force station to string
-        station = str(station).zfill(6)
-        dfOut = pd.DataFrame({station:[dataOut]},dtype=str)
-        return dfOut.T;
-    
-      
-    def getPWdata(self,df,station,numDays):
-        '''
-        getPWData function - used within reformatMonthly functions to subset df and create dfOut of PW
-        
-        args:
-        * df - input dataframe from BoM data
-        * var - str of one of desired BoM variables
-        * station - str of BoM station
-        
-        returns:
-        * dfOut - a reformatted df for use in .dat files
-        '''
-        # count number of NaN
-        numNoNNan = df.Prec_mm.loc[df.Station_ID==station].notnull().sum()
-        # proceed if number of nonNaNs >=25
-        if numNoNNan>=25:
-            # count number of rain days
-            numRain = df.Prec_mm.loc[(df.Station_ID==station)&(df.Prec_mm>0.2)].index.size
-            try:
-                # calc proportion of wet days - scaled by valid days in month
-                pw = np.round((float(numRain)/float(numNoNNan))*numDays,3)
-            except:
-                pass
-        else:
-            pw = np.nan
-        # create new df for PW
-        station = str(station).zfill(6)
-        dfOut = pd.DataFrame({station:[pw]},dtype=np.float64)
-        return dfOut.T;
-        
-    def getFDdata(self,df,station,numDays):
-        '''
-        getFDData function - used within reformatMonthly functions to subset df and create dfOut of frost days
-        
-        args:
-        * df - input dataframe from BoM data
-        * var - str of one of desired BoM variables
-        * station - str of BoM station
-        
-        returns:
-        * dfOut - a reformatted df for use in .dat files
-        '''
-        # count number of NaN
-        numNoNNan = df.Tmin_C.loc[df.Station_ID==station].notnull().sum()
-        # proceed if number of nonNaNs >=25
-        fdays = np.nan
-        if numNoNNan>=25:
-            # count number of frost days
-            frostDays = df.Tmin_C.loc[(df.Station_ID==station)&(df.Tmin_C<=2.)].index.size
-            # calc frost days with ratio of frost to valid days
-            fdays = float(numDays)*(float(frostDays)/float(numNoNNan))
-        else:
-            fdays = np.nan
-        # create new df for FD
-        station = str(station).zfill(6)
-        dfOut = pd.DataFrame({station:[fdays]},dtype=np.float64)
-        return dfOut.T;
-    
-    
-    # reformat Daily
-    def reFormatDaily(self,df,dtStr):
-        start = time.time()
-        # adjust cols for daily file output
-        df = df.assign(Year_Month_Day=str(df.Year)+'_'+str(df.Month)+'_'+str(df.Day)) 
-        
-        # find unique Station_IDs and convert to list for iterating over
-        setStation_ID = set(df.Station_ID)
-        trueSetSI = {x for x in setStation_ID if x==x}
-        listSI = sorted(list(trueSetSI))
-
-        dfGroupD = df.set_index('Year_Month_Day',drop=True)
-        # iterate over list to create year/month files for each variable
-        for var,varDetails in self.varDict.iteritems():
-            frames = [self.getData(dfGroupD,var,station) for station in listSI]
-            if len(frames)!=0:
-                dfGroup1a = pd.concat(frames)
-            
-                # drop empty rows before adding year and month cols
-                dfGroup1a.dropna(inplace=True,axis=0,how='all')
-                # make year and month lists
-                yList = [dtStr.split('_')[0]]*dfGroup1a.index.size
-                mList = [dtStr.split('_')[1]]*dfGroup1a.index.size
-                dList = [dtStr.split('_')[-1]]*dfGroup1a.index.size
-                # insert cols
-                dfGroup1a.insert(loc=0,column='year',value=yList)
-                dfGroup1a.insert(loc=1,column='month',value=mList)
-                dfGroup1a.insert(loc=2,column='day',value=dList)
-                # change nans to -99.9
-                dfGroup1a = dfGroup1a.applymap(lambda x: '-99.9' if x!=x else x)
-                if len(dfGroup1a.index) !=0 and isinstance(dfGroup1a, pd.DataFrame):
-                    self.to_fwf(dfGroup1a,varDetails[1]+varDetails[0]+'_'+dtStr+'.dat','normal')
-            
-        timing = time.time() - start
-        self.state = 0
-        comment = 'reformatDaily complete'
-        return timing,self.state,comment;
-
-
-    # reformat month of days
-    def reFormatMonthOfDays(self,df,dtStr,dataStream):
-        start = time.time()
-
-        # find unique Station_IDs and convert to list for iterating over
-        setStation_ID = set(df.Station_ID)
-        trueSetSI = {x for x in setStation_ID if x==x}
-        listSI = sorted(list(trueSetSI))
-        
-        # iterate over dict to create year/month files for each variable
-        for var,varDetails in self.varDict.iteritems():
-            frames = [self.getData(df,var,station) for station in listSI]
-            if len(frames)!=0:
-                dfGroup1a = pd.concat(frames)
-                # drop empty rows before adding year and month cols
-                dfGroup1a.dropna(inplace=True,axis=0,how='all')
-                #print dfGroup1a
-                # make year and month lists
-                yList = [dtStr.split('_')[0]]*dfGroup1a.index.size
-                mList = [dtStr.split('_')[-1]]*dfGroup1a.index.size
-                # insert cols
-                dfGroup1a.insert(loc=0,column='year',value=yList)
-                dfGroup1a.insert(loc=1,column='month',value=mList)
-                # change nans to -99.9
-                dfGroup1a = dfGroup1a.applymap(lambda x: '-99.9' if x!=x else x)
-                if dataStream=='beta':
-                    self.to_fwf(dfGroup1a,varDetails[2]+varDetails[0]+'_'+dtStr+'.dat','normal')
-                if dataStream=='stable':
-                    self.to_fwf(dfGroup1a,varDetails[3]+varDetails[0]+'_'+dtStr+'.dat','normal')
-        timing = time.time() - start
-        self.state = 0
-        comment = 'reformatMonthOfDays complete'
-        return timing,self.state,comment;
-
-
-    # reformat monthly file
-    def reFormatMonthly(self,df,dtStr,dataStream):
-        start = time.time()
-        
-        # find unique Station_IDs and convert to list for iterating over
-        setStation_ID = set(df.Station_ID)
-        trueSetSI = {x for x in setStation_ID if x==x}
-        listSI = sorted(list(trueSetSI))
-        
-        # reformat Prec_mm col
-        df.Prec_mm = [np.nan if x!=x else float(x) for x in df.Prec_mm]
-        
-        # find numDays var for total accum days check and pw calc
-        numDays = self.daysInMth(int(dtStr.split('_')[0]),int(dtStr.split('_')[-1]))
-        
-
-        ##### Proportion of days that are wet
-        #cycle through stations
-        frames = [self.getPWdata(df,station,numDays) for station in listSI]
-        if len(frames)!=0:
-            dfGroupPW = pd.concat(frames)
-            # drop empty rows before adding year and month cols
-            dfGroupPW.dropna(inplace=True,axis=0,how='all')
-            # make year and month lists
-            yList = [dtStr.split('_')[0]]*dfGroupPW.index.size
-            mList = [dtStr.split('_')[-1]]*dfGroupPW.index.size
-            # insert cols
-            dfGroupPW.insert(loc=0,column='year',value=yList)
-            dfGroupPW.insert(loc=1,column='month',value=mList)
-    
-            # change nans to -99.9
-            dfGroupPW = dfGroupPW.applymap(lambda x: '-99.9' if x!=x else x)
-            if dataStream=='beta':
-                self.to_fwf(dfGroupPW,self.baseDir+'/pw_mth_v2_0/beta/dat/bomdat/pw_'+dtStr+'.dat','pw')
-            if dataStream=='stable':
-                self.to_fwf(dfGroupPW,self.baseDir+'/pw_mth_v2_0/stable/dat/bomdat/pw_'+dtStr+'.dat','pw') 
-        
-        del dfGroupPW
-        
-        ##### Number of Frost Days
-        #cycle through stations
-        frames = [self.getFDdata(df,station,numDays) for station in listSI]
-        if len(frames)!=0:
-            dfGroupFD = pd.concat(frames)
-            # drop empty rows before adding year and month cols
-            dfGroupFD.dropna(inplace=True,axis=0,how='all')
-            # make year and month lists
-            yList = [dtStr.split('_')[0]]*dfGroupFD.index.size
-            mList = [dtStr.split('_')[-1]]*dfGroupFD.index.size
-            # insert cols
-            dfGroupFD.insert(loc=0,column='year',value=yList)
-            dfGroupFD.insert(loc=1,column='month',value=mList)
-    
-            # change nans to -99.9
-            dfGroupFD = dfGroupFD.applymap(lambda x: '-99.9' if x!=x else x)
-            if dataStream=='beta':
-                self.to_fwf(dfGroupFD,self.baseDir+'/frst_mth_v2_0/beta/dat/bomdat/fd_'+dtStr+'.dat','normal')
-            if dataStream=='stable':
-                self.to_fwf(dfGroupFD,self.baseDir+'/frst_mth_v2_0/stable/dat/bomdat/fd_'+dtStr+'.dat','normal')
-    
-        del dfGroupFD
-        
-    
-        # iterate over list to create year/month files for each variable
-        for var,varDetails in self.varDict.iteritems():
-            frames = [self.getMthData(df,var,station,numDays) for station in listSI]
-            if len(frames)!=0:
-                dfGroup1a = pd.concat(frames)
-
-                # convert '0.0' to nan for dropping for Evap_mm
-                if var == 'Evap_mm':
-                    dfGroup1a = dfGroup1a.applymap(lambda x: np.nan if x in ('0.0',' 0.0 ',' 0.0','0.0 ','0',0.,0) else x)
-                # drop empty rows before adding year and month cols
-                dfGroup1a.dropna(inplace=True,axis=0,how='all')
-                # make year and month lists
-                yList = [dtStr.split('_')[0]]*dfGroup1a.index.size
-                mList = [dtStr.split('_')[-1]]*dfGroup1a.index.size
-                # insert cols
-                dfGroup1a.insert(loc=0,column='year',value=yList)
-                dfGroup1a.insert(loc=1,column='month',value=mList)
-                # change nans to -99.9
-                dfGroup1a = dfGroup1a.applymap(lambda x: '-99.9' if x!=x else x)
-                if dataStream=='beta':
-                    self.to_fwf(dfGroup1a,varDetails[4]+varDetails[0]+'_'+dtStr+'.dat','normal')
-                if dataStream=='stable':
-                    self.to_fwf(dfGroup1a,varDetails[5]+varDetails[0]+'_'+dtStr+'.dat','normal')
-    
-        # remove redundant df
-        del dfGroup1a
-         
-                    
-        timing = time.time() - start
-        self.state = 0
-        comment = 'reformatMonthly complete'
-        return timing,self.state,comment;
-
-    ####################################################################################
-    # COMPILER loop and LOGGER
-    ####################################################################################
-
-    # loop for processing all bomdat daily files using ANUClimateFileOpen function
-    def compileLoop(self,fHandle,dtStr,dStream):
-        start = time.time()
-        itra = 0
-        os.chdir(self.zipPath+fHandle)
-        fileList = glob('DC02D_Data_*')
-        frames = [self.fileOpen(fname,dtStr,dStream) for fname in fileList]
-        df = pd.concat(frames)
-        dfOut = df.drop_duplicates(['Station_ID','Year','Month','Day'])
-        self.state = 0
-        comment = 'compile complete (numFiles, numRows): '+str(len(fileList))+' '+str(dfOut.index.size)
-        dfOut.to_csv(self.backupPath+fHandle+'_df'+dStream+'.csv')
-        timing = time.time() - start
-        return dfOut,timing,self.state,comment;
-        #return df,timing,self.state,comment;
-    
-        # logger func
-    def logger(self,fHandle,process,timing,status,comment=None):
-        '''
-        Logger function - creates/maintains a csv log file for all steps in ANUClimate class
-    
-        args:
-        * fHandle - str of BoM file identifier
-        * process - str of ANUClimate_auto step
-        * timing - str (rounded to 4 places) of time in secs for processing
-        * status - end state of process (0 = success, 1 = fail)
-        
-        returns:
-        nothing
-        '''
-        # check if file exists, if not create it
-        if not os.path.isfile(self.logPath+'ANUClimate_log.csv'):
-            # create seq for date and processing increment (eg: '2017_05_27_1' being 1st step on 27/5/2017 file)
-            date = dt.datetime.today()
-            seq = date.isoformat().split('T')[0][:4]+'_'+date.isoformat().split('T')[0][5:7]+'_'+date.isoformat().split('T')[0][8:10]+'_1'
-            # create df
-            df = pd.DataFrame({'date':[dt.datetime.today().isoformat()],'seq':[seq],'file_handle':[fHandle],'process':[process],'timing_secs':[timing],'state':[status],'comment':[comment]})
-            # save df to csv
-            df.to_csv(self.logPath+'ANUClimate_log.csv')
-        # if file exists, open it
-        elif os.path.isfile(self.logPath+'ANUClimate_log.csv'):
-            df = pd.read_csv(self.logPath+'ANUClimate_log.csv',index_col=[0])
-            # find next increment by index size
-            prev = int(df.index.size)
-            date = dt.datetime.today()
-            seq = date.isoformat().split('T')[0][:4]+'_'+date.isoformat().split('T')[0][5:7]+'_'+date.isoformat().split('T')[0][8:10]+'_'+str(prev+1)
-            # create new df and append to existing
-            df1 = pd.DataFrame({'date':[dt.datetime.today().isoformat()],'seq':[seq],'file_handle':[fHandle],'process':[process],'timing_secs':[timing],'state':[status],'comment':[comment]})
-            df = df.append(df1)
-            # save df back to csv
-            df.to_csv(self.logPath+'ANUClimate_log.csv')
-        else:
-            pass
-            
-            
+                        rTiming,rState,rComment = self.reFormatMonthly(df,dtStr,dStream)
+                    self.logger(fHandle,stage,str(round(rTiming,4)),str(rState),str(rComment)+' RERUN',self.stage)
+                    self.checkpoint(fHandle,stage,rState,self.written)
+                del df
+            self.logger(fHandle,'run_complete',str(round(time.time()-start,4)),'0','RERUN')
 
 
 ##################################################
 # LOOP
 ##################################################
 # find unique dates of processing
-## two parts:
+## two parts, both from one run history query:
 ## 1) find dates that didn't run at all
-## 2) find dates that didn't complete (ie have entries, but no 'run_complete' in dfLog.process) DONE
-
-ancr = ANUClimateAuto_rerun()
-
-# part 1
-
-# open log file
-dfLog = pd.read_csv(ancr.logPath+'ANUClimate_log.csv',index_col=[0])
-dfLogDates = sorted(list(set(dfLog.file_handle.sort_values())))
-dfLogDates = [dt.date(int(x[14:18]),int(x[18:20]),int(x[20:22])) if type(x) == str and len(x) == 25 else '' for x in dfLogDates]
-dfLogDates = list(filter(None, dfLogDates))
-print dfLogDates
-fullMissingDates = ancr.findMissingDates(dfLogDates)
-
-fullMissingDatesFH = ['ANUdaily9am3pm'+str(x.isoformat().split('T')[0][:4])+str(x.isoformat().split('T')[0][5:7]).zfill(2)+str(x.isoformat().split('T')[0][8:10]).zfill(2)+calendar.day_name[x.weekday()][:3] for x in fullMissingDates]
-
-# Part 2
-#### N.B. run this process weekly and only look for dates in preceding week, therefore avoiding repeat re-runs
-dateNow = dt.datetime.today()
-dateMin = dateNow - relativedelta.relativedelta(months=6)
-
-# split out int time components from file_handle (eg: 'ANUdaily9am3pm20170812Sat' is 2017,08,12 for datetime comparison)
-dfLog['fhDate'] = [dt.date(int(x[14:18]),int(x[18:20]),int(x[20:22])) if type(x) == str and len(x) == 25 else '' for x in dfLog.file_handle]
-dateListFH = list(set(dfLog.fhDate.loc[pd.to_datetime(dfLog.fhDate)>=dateMin]))
-
-# loop over dates to find processing dates where run_complete flag not found
-for date in dateListFH:
-    #print date
-    dfLogDate = dfLog.loc[dfLog.fhDate==date]
-    # check for run_complete flag (if found, pass; if missing process)
-    if 'run_complete' in list(set(dfLogDate.process)):
-        pass
-    else:
-        # create datevars to include in missingDict
-        fH = list(set(dfLogDate.file_handle))
-        #print fH
-        fullMissingDatesFH.append(fH[0])
-# initial dict creation
-
-# create master list of dates to rerun
-itr = 0
-for i in fullMissingDatesFH:
-    numDays = ancr.daysInMth(int(i[14:18]),int(i[18:20]))
-    if int(i[20:22])==int(numDays):
-        call = 'all'
-    else:
-        call = 'alpha'
-    dateList,timing,state,comment = ancr.getDateStringMissing(call=call,fHandle=i)
-    if itr == 0:
-        missingDict = {i:[call,dateList]}
-    # append for new dates
-    else:
-        missingDict1 = {i:[call,dateList]}
-        missingDict.update(missingDict1)
-    itr+=1
-
-f = open(ancr.logPath+'missingDates_'+str(dt.datetime.today().isoformat().split('T')[0])+'.txt','w')
-
+## 2) find dates that didn't complete (ie have entries, but no 'run_complete' process)
+
+if __name__ == '__main__':
+    ancr = ANUClimateAuto_rerun()
+    # metrics kept apart from the daily run's (anuclimate_prep_rerun.prom)
+    ancr.metricsScript = 'prep_rerun'
+    # profile the stages named by ANUCLIMATE_PROFILE or --profile (eg 'compileRange,reFormatMonthly'), off by default
+    profileHooks([ANUClimateAuto_rerun],ancr.logPath,'PyANUClimate_RERUN')
+
+    fullMissingDatesFH = ancr.findIncompleteRuns()
+    print fullMissingDatesFH
+    # initial dict creation
+
+    # create master list of dates to rerun
+    itr = 0
+    for i in fullMissingDatesFH:
+        numDays = ancr.daysInMth(int(i[14:18]),int(i[18:20]))
+        if int(i[20:22])==int(numDays):
+            call = 'all'
+        else:
+            call = 'alpha'
+        dateList,timing,state,comment = ancr.getDateStringMissing(call=call,fHandle=i)
+        if itr == 0:
+            missingDict = {i:[call,dateList]}
+        # append for new dates
+        else:
+            missingDict1 = {i:[call,dateList]}
+            missingDict.update(missingDict1)
+        itr+=1
 
-try:
-    print missingDict
+    f = open(ancr.logPath+'missingDates_'+str(dt.datetime.today().isoformat().split('T')[0])+'.txt','w')
 
-    for mFHandle,mDateVars in missingDict.iteritems():
-        f.write(mFHandle+','+str(mDateVars)+'\n')
-        print mFHandle,str(mDateVars)
-        startFull = time.time()
-    
-        ancr.logger(mFHandle,'findDataStream_'+str(mDateVars[0]),'0.001','0','findDataStream complete RERUN')
-        ancr.logger(mFHandle,'getDateString_'+str(mDateVars[1]),'0.001','0',mDateVars[0]+' call RERUN')
 
-        ftpTiming,ftpState,ftpComment = ancr.downloadFTP(mFHandle)
+    try:
+        print missingDict
 
-        ancr.logger(mFHandle,'downloadFTP',str(round(ftpTiming,4)),str(ftpState),str(ftpComment)+' RERUN')
+        for mFHandle,mDateVars in missingDict.iteritems():
+            f.write(mFHandle+','+str(mDateVars)+'\n')
+            print mFHandle,str(mDateVars)
+            ancr.logger(mFHandle,'findDataStream_'+str(mDateVars[0]),'0.001','0','findDataStream complete RERUN')
+            ancr.logger(mFHandle,'getDateString_'+str(mDateVars[1]),'0.001','0',mDateVars[0]+' call RERUN')
+            # missed alpha only runs are done together below
+            if mDateVars[0] == 'alpha':
+                continue
 
-        if mDateVars[0] == 'alpha':
-            dfDay,clTiming,clState,clComment = ancr.compileLoop(mFHandle,mDateVars[1][0],'alpha')
-            ancr.logger(mFHandle,'compileLoop_alpha',str(round(clTiming,4)),str(clState),str(clComment)+' RERUN')
-            aTiming,aState,aComment = ancr.reFormatDaily(dfDay,mDateVars[1][0])
-            ancr.logger(mFHandle,'reFormatDaily',str(round(aTiming,4)),str(aState),str(aComment)+' RERUN')
-        else:
-            dfDay,clTiming,clState,clComment = ancr.compileLoop(mFHandle,mDateVars[1][0],'alpha')
-            ancr.logger(mFHandle,'compileLoop_alpha',str(round(clTiming,4)),str(clState),str(clComment)+' RERUN')
-            aTiming,aState,aComment = ancr.reFormatDaily(dfDay,mDateVars[1][0])
-            ancr.logger(mFHandle,'reFormatDaily',str(round(aTiming,4)),str(aState),str(aComment)+' RERUN')
-            del dfDay
-            dfBMth,clTiming,clState,clComment = ancr.compileLoop(mFHandle,mDateVars[1][1],'beta')
-            ancr.logger(mFHandle,'compileLoop_beta',str(round(clTiming,4)),str(clState),str(clComment)+' RERUN')
-            bTiming,bState,bComment = ancr.reFormatMonthOfDays(dfBMth,mDateVars[1][1],'beta')
-            ancr.logger(mFHandle,'reFormatMonthOfDays_beta',str(round(bTiming,4)),str(bState),str(bComment))
-            bMTiming,bMState,bMComment = ancr.reFormatMonthly(dfBMth,mDateVars[1][1],'beta')
-            ancr.logger(mFHandle,'reFormatMonthly_beta',str(round(bMTiming,4)),str(bMState),str(bMComment)+' RERUN')
-            del dfBMth
-            dfSMth,clTiming,clState,clComment = ancr.compileLoop(mFHandle,mDateVars[1][2],'stable')
-            ancr.logger(mFHandle,'compileLoop_stable',str(round(clTiming,4)),str(clState),str(clComment)+' RERUN')
-            sTiming,sState,sComment = ancr.reFormatMonthOfDays(dfSMth,mDateVars[1][2],'stable')
-            ancr.logger(mFHandle,'reFormatMonthOfDays_stable',str(round(sTiming,4)),str(sState),str(sComment)+' RERUN')
-            sMTiming,sMState,sMComment = ancr.reFormatMonthly(dfSMth,mDateVars[1][2],'stable')
-            ancr.logger(mFHandle,'reFormatMonthly_stable',str(round(sMTiming,4)),str(sMState),str(sMComment)+' RERUN')
-            del dfSMth
+            # end of month runs need their own archive for the beta and stable months, stages checkpointed by the failed run are skipped
+            ancr.resumeRuns([(mFHandle,zip(mDateVars[1],['alpha','beta','stable']))],mFHandle)
 
-        timeFull = time.time()-startFull
-        ancr.logger(mFHandle,'run_complete',str(round(timeFull,4)),'0','RERUN')
+        # missed alpha only runs all fall inside the newest missed archive (BoM archives hold ~6 months of days),
+        # so the days still to compile come from one download and one parse of it rather than one per day
+        alphaFHs = sorted([x for x in missingDict if missingDict[x][0] == 'alpha'],key=lambda x: x[14:22])
+        if len(alphaFHs) != 0:
+            ancr.resumeRuns([(x,[(missingDict[x][1][0],'alpha')]) for x in alphaFHs],alphaFHs[-1])
 
-    f.close()
+        f.close()
 
-except:
-    print 'No missing dates'
+    except:
+        print 'No missing dates'
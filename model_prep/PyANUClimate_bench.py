@@ -0,0 +1,402 @@
+####################################################################################
+# ANUClimate automation - ingest benchmarks
+# v16.0
+# author: Ian Marang
+#
+# Description:
+# writes a synthetic BoM DS082 archive (DC02D station files in a zip, laid out as
+# downloadFTP leaves it) and times the ingest stages of ANUClimateAuto on it, reporting
+# rows/s and peak memory per stage. Run before deploying changes to PyANUClimate.py so
+# throughput regressions show up here rather than in the daily cron.
+#
+# usage: python PyANUClimate_bench.py [--stations 500] [--days 215] [--workers 1] [--lean] [--log bench_log.csv]
+####################################################################################
+
+# import libraries
+import os, sys
+import argparse
+import pandas as pd
+import numpy as np
+import datetime as dt
+from dateutil import relativedelta
+import zipfile
+import shutil
+import tempfile
+import time
+import resource
+import multiprocessing
+import random
+import warnings
+
+# shared download, parsing and reformat code lives in the daily script
+from PyANUClimate import ANUClimateAuto
+
+
+# DC02D columns after Station Number/Year/Month/Day (the usecols of fileRead) - value header, quality header,
+# extra accumulation headers, value range and kind ('prec' and 'evap' get multi day accumulations)
+bomCols = [('Precipitation in the 24 hours before 9am (local time) in mm','Quality of precipitation value',
+            ['Number of days of rain within the days of accumulation','Accumulated number of days over which the precipitation was measured'],0.,60.,'prec'),
+           ('Evaporation in 24 hours before 9am (local time) in mm','Quality of evaporation in 24 hours before 9am (local time)',
+            ['Days of accumulation for evaporation'],0.,15.,'evap'),
+           ('Maximum temperature in 24 hours after 9am (local time) in Degrees C','Quality of maximum temperature in 24 hours after 9am (local time)',
+            ['Days of accumulation of maximum temperature'],5.,45.,'temp'),
+           ('Minimum temperature in 24 hours before 9am (local time) in Degrees C','Quality of minimum temperature in 24 hours before 9am (local time)',
+            ['Days of accumulation of minimum temperature'],-8.,28.,'temp'),
+           ('Air temperature observation at 09 hours Local Time in Degrees C','Quality of air temperature observation at 09 hours Local Time',[],0.,40.,'obs'),
+           ('Air temperature observation at 15 hours Local Time in Degrees C','Quality of air temperature observation at 15 hours Local Time',[],5.,45.,'obs'),
+           ('Dew point temperature observation at 09 hours Local Time in Degrees C','Quality of dew point temperature observation at 09 hours Local Time',[],-10.,25.,'obs'),
+           ('Dew point temperature observation at 15 hours Local Time in Degrees C','Quality of dew point temperature observation at 15 hours Local Time',[],-10.,25.,'obs'),
+           ('Wet bulb temperature observation at 09 hours Local Time in Degrees C','Quality of wet bulb temperature observation at 09 hours Local Time',[],-5.,30.,'obs'),
+           ('Wet bulb temperature observation at 15 hours Local Time in Degrees C','Quality of wet bulb temperature observation at 15 hours Local Time',[],-5.,30.,'obs'),
+           ('Relative humidity for observation at 09 hours Local Time in percentage %','Quality of relative humidity for observation at 09 hours Local Time',[],5.,100.,'obs'),
+           ('Relative humidity for observation at 15 hours Local Time in percentage %','Quality of relative humidity for observation at 15 hours Local Time',[],5.,100.,'obs'),
+           ('Vapour pressure at 09 hours Local Time in hPa','Quality of vapour pressure at 09 hours Local Time',[],2.,35.,'obs'),
+           ('Vapour pressure at 15 hours Local Time in hPa','Quality of vapour pressure at 15 hours Local Time',[],2.,35.,'obs'),
+           ('Saturated vapour pressure at 09 hours in hPa','Quality of saturated vapour pressure at 09 hours Local Time',[],5.,60.,'obs'),
+           ('Saturated vapour pressure at 15 hours in hPa','Quality of saturated vapour pressure at 15 hours Local Time',[],5.,60.,'obs')]
+
+
+def benchWorker(bench,stage,conn):
+    '''
+    Runs one benchmark stage in a child process, so each stage's peak memory is measured on its own
+
+    args:
+    * bench - ANUClimateBench instance
+    * stage - str name of the stage method (without the 'stage' prefix)
+    * conn - multiprocessing Pipe end to send (timing, rows, base rss, peak rss) back on
+    '''
+    try:
+        baseRss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        start = time.time()
+        rows = getattr(bench,'stage'+stage)()
+        timing = time.time() - start
+        # stages that only time part of their work return (rows, timing)
+        if isinstance(rows,tuple):
+            rows,timing = rows
+        # pool workers (numWorkers > 1) are children of this process
+        peakRss = max(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss)
+        conn.send((timing,rows,baseRss,peakRss,None))
+    except Exception as e:
+        conn.send((0.,0,0,0,str(e)))
+    conn.close()
+
+
+class ANUClimateBench(ANUClimateAuto):
+    '''
+    Benchmark version of ANUClimateAuto - download, unzip and backup paths point at a scratch dir holding a
+    synthetic archive, and each ingest stage (stage* methods) is timed in its own process
+    '''
+
+    def __init__(self,workDir,runDate):
+        super(ANUClimateBench,self).__init__()
+        self.workDir = workDir
+        self.destPath = workDir+'/download/'
+        self.zipPath = workDir+'/unzip/'
+        self.backupPath = workDir+'/backup/'
+        # timings should never come from cached rows or indexes of a previous stage
+        self.useCache = False
+        # dates the daily script would process on runDate (see getDateString)
+        self.runDate = runDate
+        alpha = runDate-relativedelta.relativedelta(days=2)
+        beta = runDate-relativedelta.relativedelta(months=2)
+        stable = runDate-relativedelta.relativedelta(months=6)
+        self.fHandle = 'ANUdaily9am3pm'+runDate.strftime('%Y%m%d')+runDate.strftime('%A')[:3]
+        self.dateList = [alpha.strftime('%Y_%m_%d'),beta.strftime('%Y_%m'),stable.strftime('%Y_%m')]
+        # .dat output goes to the scratch dir too
+        baseDir = self.baseDir
+        self.baseDir = workDir+'/processed'
+        for var,varDetails in self.varDict.iteritems():
+            self.varDict[var] = varDetails[:1]+[x.replace(baseDir,self.baseDir) for x in varDetails[1:]]
+        for outDir in sum([x[1:] for x in self.varDict.values()],[])+[self.baseDir+'/'+x+'_mth_v2_0/'+y+'/dat/bomdat/' for x in ('pw','frst') for y in ('beta','stable')]:
+            if not os.path.isdir(outDir):
+                os.makedirs(outDir)
+
+
+    ####################################################################################
+    # synthetic BoM archive
+    ####################################################################################
+
+    def bomValue(self,rand,low,high,blankFrac):
+        '''
+        Random DC02D value cell - right aligned to 6 chars, blank (all white space) for blankFrac of cells
+        '''
+        if rand.random() < blankFrac:
+            return ' '*6;
+        return ('%.1f' % rand.uniform(low,high)).rjust(6);
+
+
+    def bomFlag(self,rand):
+        '''
+        Random DC02D quality flag - mostly Y/N with some blank and W/S/I (which fail the quality check)
+        '''
+        x = rand.random()
+        if x < 0.08:
+            return ' ';
+        if x < 0.68:
+            return 'Y';
+        if x < 0.94:
+            return 'N';
+        return rand.choice('WSI');
+
+
+    def writeStation(self,fname,station,startDate,numDays,seed,blankFrac=0.1,skipFrac=0.03):
+        '''
+        Writes a synthetic DC02D station file with the full usecols header set, record marker ('dc') and end
+        marker ('#') columns, white space padded and blank cells, mixed quality flags, skipped days and multi
+        day accumulations (blank precipitation/evaporation days followed by a value with accumulated days > 1)
+
+        args:
+        * fname - str path to write
+        * station - int station number
+        * startDate - datetime.date of the first row
+        * numDays - int of days of history
+        * seed - int random seed, the file is the same for the same args
+        * blankFrac - (optional) float fraction of blank value cells
+        * skipFrac - (optional) float fraction of days with no row
+
+        returns:
+        * int number of data rows written
+        '''
+        rand = random.Random(seed)
+        header = ['Station Number','Year','Month','Day']
+        for value,quality,accumCols,low,high,kind in bomCols:
+            header += [value,quality]+accumCols
+        f = open(fname,'w')
+        f.write('dc,'+','.join(header)+',#\n')
+        # days left in a running prec/evap accumulation
+        accum = {'prec':0,'evap':0}
+        numRows = 0
+        for i in range(numDays):
+            date = startDate+dt.timedelta(days=i)
+            if rand.random() < skipFrac:
+                continue
+            row = [str(station).rjust(6),str(date.year),'%02d' % date.month,'%02d' % date.day]
+            for value,quality,accumCols,low,high,kind in bomCols:
+                if kind in accum:
+                    if accum[kind] == 0 and rand.random() < 0.02:
+                        accum[kind] = rand.randint(2,4)
+                    if accum[kind] > 1:
+                        # no reading, the total comes in on the last day of the accumulation
+                        accum[kind] -= 1
+                        row += [' '*6,' ']+['  ']*len(accumCols)
+                        continue
+                    if accum[kind] == 1:
+                        accum[kind] = 0
+                        row += [self.bomValue(rand,low,high*2,0.),self.bomFlag(rand)]+[' 1',' '+str(rand.randint(2,4))][-len(accumCols):]
+                        continue
+                # evaporation pans are read at fewer stations, so more blanks
+                row += [self.bomValue(rand,low,high,blankFrac*3 if kind == 'evap' else blankFrac),self.bomFlag(rand)]
+                row += [rand.choice(['  ',' 1',' 1']) for x in accumCols]
+            f.write('dc,'+','.join(row)+',#\n')
+            numRows += 1
+        f.close()
+        return numRows;
+
+
+    def writeArchive(self,numStations,numDays,seed=0,blankFrac=0.1):
+        '''
+        Writes a synthetic DS082_<fHandle>.zip to destPath/<fHandle>/ (as left by downloadFTP) with numStations
+        DC02D_Data_* files plus station details and notes files. Station histories end the day before runDate
+        and vary in length (most have numDays, some start later or stop early)
+
+        args:
+        * numStations - int number of station files
+        * numDays - int of days of history for a full length station
+        * seed - (optional) int random seed
+        * blankFrac - (optional) float fraction of blank value cells
+
+        returns:
+        * int total data rows in the archive
+        '''
+        rand = random.Random(seed)
+        stationList = sorted(rand.sample(range(1000,100000),numStations))
+        srcDir = self.workDir+'/src/'
+        zipDir = self.destPath+self.fHandle+'/'
+        for dirName in [srcDir,zipDir]:
+            try:
+                os.makedirs(dirName)
+            except:
+                pass
+        endDate = self.runDate.date()-dt.timedelta(days=1)
+        zipFile = zipfile.ZipFile(zipDir+'DS082_'+self.fHandle+'.zip','w',zipfile.ZIP_DEFLATED)
+        numRows = 0
+        stnDet = ['dc,Station Number,Station Name,Latitude,Longitude,Elevation,#']
+        for i,station in enumerate(stationList):
+            x = rand.random()
+            if x < 0.1:
+                # station opened during the period
+                stnDays = rand.randint(1,numDays)
+                stnEnd = endDate
+            elif x < 0.15:
+                # station closed during the period
+                stnDays = rand.randint(1,numDays)
+                stnEnd = endDate-dt.timedelta(days=numDays-stnDays)
+            else:
+                stnDays = numDays
+                stnEnd = endDate
+            fname = 'DC02D_Data_%06d_999999999999999.txt' % station
+            numRows += self.writeStation(srcDir+fname,station,stnEnd-dt.timedelta(days=stnDays-1),stnDays,seed*100000+station,blankFrac)
+            zipFile.write(srcDir+fname,fname)
+            os.remove(srcDir+fname)
+            stnDet.append('dc,%6d,SYNTHETIC STATION %d,%.4f,%.4f,%.1f,#' % (station,station,rand.uniform(-44.,-10.),rand.uniform(113.,154.),rand.uniform(0.,1500.)))
+        zipFile.writestr('DC02D_StnDet_999999999999999.txt','\n'.join(stnDet)+'\n')
+        zipFile.writestr('DC02D_Notes_999999999999999.txt','Synthetic DC02D archive written by PyANUClimate_bench.py\n')
+        zipFile.close()
+        shutil.rmtree(srcDir)
+        return numRows;
+
+
+    ####################################################################################
+    # benchmark stages - each returns the number of rows it processed
+    ####################################################################################
+
+    def stageParse(self):
+        '''fileRead of every station file'''
+        fileList,zipName = self.findFiles(self.fHandle)
+        return sum([x.index.size for x in self.mapFiles('fileRead',fileList,zipName)]);
+
+
+    def stageIndex(self):
+        '''loadIndex from scratch (the date index alpha compileLoop seeks with)'''
+        fileList,zipName = self.findFiles(self.fHandle)
+        for fname in [self.backupPath+self.fHandle+'/'+self.fHandle+'_index.csv',self.backupPath+'store/index.csv']:
+            if os.path.isfile(fname):
+                os.remove(fname)
+        return self.loadIndex(self.fHandle,fileList,zipName).rows.sum()-len(fileList);
+
+
+    def stageAlpha(self):
+        '''daily alpha compileLoop, seeking with the index built by stageIndex'''
+        return self.compileLoop(self.fHandle,self.dateList[0],'alpha')[0].index.size;
+
+
+    def stageAlphaFull(self):
+        '''daily alpha compileLoop parsing every file in full'''
+        self.useIndex = False
+        return self.compileLoop(self.fHandle,self.dateList[0],'alpha')[0].index.size;
+
+
+    def stageMonth(self):
+        '''beta compileLoop (month of days for every station)'''
+        return self.compileLoop(self.fHandle,self.dateList[1],'beta')[0].index.size;
+
+
+    def stageAll(self):
+        '''end of month compileLoopAll (alpha, beta and stable from one parse)'''
+        return sum([x.index.size for x in self.compileLoopAll(self.fHandle,self.dateList)[:3]]);
+
+
+    def stageMonthly(self):
+        '''beta month of days and monthly .dat files (reFormatMonthOfDays and reFormatMonthly) from a compiled month'''
+        df = self.compileLoop(self.fHandle,self.dateList[1],'beta')[0]
+        start = time.time()
+        self.reFormatMonthOfDays(df,self.dateList[1],'beta')
+        self.reFormatMonthly(df,self.dateList[1],'beta')
+        # only the reformat is timed
+        return df.index.size,time.time() - start;
+
+
+    def stageDedupe(self):
+        '''concat and drop_duplicates of the per file beta dfs, as at the end of compileLoop'''
+        fileList,zipName = self.findFiles(self.fHandle)
+        frames = self.mapFiles('fileOpen',fileList,self.dateList[1],'beta',zipName)
+        start = time.time()
+        df = pd.concat(frames)
+        df.drop_duplicates(['Station_ID','Year','Month','Day'])
+        # only the concat and dedupe are timed
+        return df.index.size,time.time() - start;
+
+
+    def runStage(self,stage):
+        '''
+        Runs a stage in a child process
+
+        args:
+        * stage - str name of the stage (eg 'Parse')
+
+        returns:
+        * timing, rows, base rss and peak rss (KB) of the stage and error message (None if it ran)
+        '''
+        recv,send = multiprocessing.Pipe(False)
+        proc = multiprocessing.Process(target=benchWorker,args=(self,stage,send))
+        proc.start()
+        result = recv.recv()
+        proc.join()
+        return result;
+
+
+####################################################################################
+# MAIN loop
+####################################################################################
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Synthetic BoM archive ingest benchmarks for PyANUClimate.py')
+    parser.add_argument('--stations',type=int,default=500,help='number of station files in the archive (default 500)')
+    parser.add_argument('--days',type=int,default=215,help='days of history per station (default 215, ~7 months)')
+    parser.add_argument('--date',default='2017-10-31',help='run date the archive is for, YYYY-MM-DD (default 2017-10-31)')
+    parser.add_argument('--workers',type=int,default=int(os.environ.get('ANUCLIMATE_WORKERS',1)),help='numWorkers for compileLoop (default ANUCLIMATE_WORKERS or 1)')
+    parser.add_argument('--unzip',action='store_true',help='extract the archive and read station files from disk (default reads from the zip)')
+    parser.add_argument('--lean',action='store_true',help='float32 values, as with ANUCLIMATE_LEAN=1 (compare peak MB with a run without it)')
+    parser.add_argument('--stages',default='Parse,Index,Alpha,AlphaFull,Month,Monthly,All,Dedupe',help='comma separated stages to run')
+    parser.add_argument('--seed',type=int,default=0,help='random seed for the archive')
+    parser.add_argument('--workdir',default=None,help='scratch dir (default a new temp dir, removed afterwards)')
+    parser.add_argument('--log',default=None,help='csv to append results to and check for regressions against')
+    parser.add_argument('--tolerance',type=float,default=0.25,help='fractional drop in rows/s vs the best logged run that counts as a regression (default 0.25)')
+    args = parser.parse_args()
+    # pandas 0.24 read_table deprecation warnings would bury the results
+    warnings.simplefilter('ignore',FutureWarning)
+
+    workDir = args.workdir or tempfile.mkdtemp(prefix='anuclimate_bench_')
+    runDate = dt.datetime.strptime(args.date,'%Y-%m-%d')
+    bench = ANUClimateBench(workDir,runDate)
+    bench.numWorkers = args.workers
+    if args.lean:
+        bench.valueType = np.float32
+    try:
+        start = time.time()
+        numRows = bench.writeArchive(args.stations,args.days,args.seed)
+        print('archive: '+str(args.stations)+' stations, '+str(numRows)+' rows, '+str(round(time.time()-start,2))+' secs to write')
+        bench.extractZip = int(args.unzip)
+        if args.unzip:
+            zipFile = zipfile.ZipFile(bench.destPath+bench.fHandle+'/DS082_'+bench.fHandle+'.zip','r')
+            zipFile.extractall(bench.zipPath+bench.fHandle)
+            zipFile.close()
+
+        results = []
+        print('%-10s %10s %10s %14s %10s %10s' % ('stage','secs','rows','rows/s','base MB','peak MB'))
+        for stage in args.stages.split(','):
+            timing,rows,baseRss,peakRss,error = bench.runStage(stage)
+            if error is not None:
+                print('%-10s failed: %s' % (stage,error))
+                continue
+            # stage rows are outputs, throughput is always input rows (or concat/month rows for Dedupe/Monthly) per sec
+            inRows = rows if stage in ('Parse','Index','Dedupe','Monthly') else numRows
+            rate = inRows/timing if timing > 0 else np.nan
+            print('%-10s %10.3f %10d %14.0f %10.1f %10.1f' % (stage,timing,rows,rate,baseRss/1024.,peakRss/1024.))
+            results.append({'date':dt.datetime.today().isoformat(),'stage':stage,'stations':args.stations,'days':args.days,
+                            'workers':args.workers,'unzip':int(args.unzip),'lean':int(args.lean),'secs':timing,'rows':rows,'rows_per_sec':rate,
+                            'base_mb':baseRss/1024.,'peak_mb':peakRss/1024.})
+    finally:
+        if args.workdir is None:
+            shutil.rmtree(workDir,True)
+
+    if args.log and len(results) != 0:
+        cols = ['date','stage','stations','days','workers','unzip','lean','secs','rows','rows_per_sec','base_mb','peak_mb']
+        dfNew = pd.DataFrame(results,columns=cols)
+        regressions = []
+        if os.path.isfile(args.log):
+            dfLog = pd.read_csv(args.log)
+            # logs from before --lean was added are float64 runs
+            if 'lean' not in dfLog.columns:
+                dfLog['lean'] = 0
+                dfLog[cols].to_csv(args.log,index=False)
+            # only compare like with like (same archive size, workers, zip/unzip and value type)
+            for x in results:
+                dfPrev = dfLog.loc[(dfLog.stage==x['stage'])&(dfLog.stations==x['stations'])&(dfLog.days==x['days'])&(dfLog.workers==x['workers'])&(dfLog.unzip==x['unzip'])&(dfLog.lean==x['lean'])]
+                if dfPrev.index.size != 0 and x['rows_per_sec'] < dfPrev.rows_per_sec.max()*(1.-args.tolerance):
+                    regressions.append(x['stage']+' '+str(int(x['rows_per_sec']))+' rows/s vs best '+str(int(dfPrev.rows_per_sec.max())))
+            dfNew.to_csv(args.log,mode='a',header=False,index=False)
+        else:
+            dfNew.to_csv(args.log,index=False)
+        if len(regressions) != 0:
+            print('REGRESSION: '+'; '.join(regressions))
+            sys.exit(1)
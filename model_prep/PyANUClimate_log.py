@@ -0,0 +1,557 @@
+####################################################################################
+# ANUClimate automation - run log
+# v16.0
+# author: Ian Marang
+#
+# Description:
+# append only csv log shared by the prep (PyANUClimate.py, PyANUClimate_RERUN.py) and
+# model run (PyANUClimate_model_run.py, PyANUClimate_reRunModel.py, PyANUClimate_nc.py)
+# scripts. Each row is one locked write to the end of the file, so logging costs the same
+# however long the log gets, and the files keep the layout pandas to_csv gave them.
+# The prep log is imported into an indexed sqlite run history (ANUClimateRunHistory) when
+# PyANUClimate_RERUN.py looks up missing and incomplete dates, so logging never touches sqlite.
+# Stage methods decorated with instrumented record their wall and cpu time, peak rss, rows
+# and bytes written (ANUClimateStage), logged to a stage log next to each run log and
+# published as node_exporter textfile metrics (ANUClimateMetrics).
+# Standard library only (no pandas needed to log).
+####################################################################################
+
+# import libraries
+import os
+import csv
+import fcntl
+import sqlite3
+import time
+import resource
+import functools
+import datetime as dt
+from cStringIO import StringIO
+
+
+# ANUClimate_log.csv (prep) columns, after the blank named index column
+prepColumns = ['comment','date','file_handle','process','seq','state','timing_secs']
+# ANUClimate_model_run_log.csv (model run and netcdf) columns
+modelColumns = ['datetime','process','target_date','jobID']
+# ANUClimate_stage_log.csv (prep) and ANUClimate_model_run_stage_log.csv (model run and netcdf) columns, run is the
+# file handle (prep) or target date (model run)
+stageColumns = ['date','run','process','state','wall_secs','cpu_secs','peak_rss_mb','rows_in','rows_out','files','bytes_written']
+# node_exporter textfile metrics (ANUClimateMetrics) - name:(type, help), every series is labelled with its script
+metricHelp = {'anuclimate_stage_duration_seconds':('gauge','Wall time of the last run of a stage'),
+              'anuclimate_stage_cpu_seconds':('gauge','Cpu time of the last run of a stage, pool workers included'),
+              'anuclimate_stage_peak_rss_bytes':('gauge','Peak rss of the run by the end of the last run of a stage'),
+              'anuclimate_stage_rows_in':('gauge','Rows read by the last run of a stage (rows parsed for compile stages, source .dat station rows for runModel)'),
+              'anuclimate_stage_rows_out':('gauge','Rows written by the last run of a stage'),
+              'anuclimate_stage_files_written':('gauge','Files written by the last run of a stage (.dat files for reformat stages)'),
+              'anuclimate_stage_bytes_written':('gauge','Bytes written by the last run of a stage'),
+              'anuclimate_stage_state':('gauge','End state of the last run of a stage (0 = success)'),
+              'anuclimate_stage_timestamp_seconds':('gauge','Unix time the last run of a stage finished'),
+              'anuclimate_dat_stations':('gauge','Station rows in the .dat file of a variable written by the last run of a stage'),
+              'anuclimate_archive_bytes':('gauge','Size of the last BoM archive downloaded'),
+              'anuclimate_download_bytes_per_second':('gauge','Throughput of the last BoM archive download'),
+              'anuclimate_publish_timestamp_seconds':('gauge','Unix time BoM published the last archive downloaded (ftp MDTM)'),
+              'anuclimate_publish_to_dat_seconds':('gauge','Secs from BoM publishing the archive to the last run of a reformat stage finishing its .dat files'),
+              'anuclimate_nc_files_written':('gauge','NetCDF files written for a variable by the last run'),
+              'anuclimate_nc_bytes_written':('gauge','Bytes of NetCDF files written for a variable by the last run'),
+              'anuclimate_nc_seconds':('gauge','Wall time of make_nc for a variable in the last run'),
+              'anuclimate_run_duration_seconds':('gauge','Wall time of the last complete run'),
+              'anuclimate_run_timestamp_seconds':('gauge','Unix time the last run completed')}
+
+
+class ANUClimateLog(object):
+    '''
+    Append only csv log - rows are formatted as pandas to_csv wrote them (minimal quoting, '\\n' line ends, None as
+    blank) and appended with a single write under an exclusive lock, so concurrent jobs never interleave or lose rows
+    '''
+
+    def __init__(self,fname,columns,index=False,seq=None):
+        '''
+        args:
+        * fname - str path of the csv log
+        * columns - list of str column names in file order
+        * index - (optional) bool, True for a log with pandas' blank named index column in front (ANUClimate_log.csv)
+        * seq - (optional) str name of a column filled with '<YYYY_MM_DD>_<row number>' (1 for the first row)
+        '''
+        self.fname = fname
+        self.columns = columns
+        self.index = index
+        self.seq = seq
+
+
+    def formatRow(self,values):
+        '''
+        Formats one csv record
+
+        args:
+        * values - list of values in file order (str, numbers or None)
+
+        returns:
+        * str record ending in '\\n'
+        '''
+        buf = StringIO()
+        csv.writer(buf,lineterminator='\n').writerow([x.encode('utf-8') if isinstance(x,unicode) else x for x in values])
+        return buf.getvalue();
+
+
+    def countRows(self,f):
+        '''
+        Number of rows in the log (quoted fields can hold line breaks, so records are counted by the csv reader)
+
+        args:
+        * f - open log file
+
+        returns:
+        * int of rows, not counting the header
+        '''
+        f.seek(0)
+        return max(sum(1 for x in csv.reader(f))-1,0);
+
+
+    def nextSeq(self,f,size):
+        '''
+        Row number of the next row - kept with the log size in a '<log>.seq' file, the log is only counted again if its
+        size no longer matches (first use, or the log was changed by something else)
+
+        args:
+        * f - open log file (locked)
+        * size - int of log size in bytes before the row is appended
+
+        returns:
+        * int of the new row's number
+        '''
+        rows = None
+        if os.path.isfile(self.fname+'.seq'):
+            with open(self.fname+'.seq','r') as s:
+                saved = s.read().split(',')
+            if len(saved) == 2 and saved[1].strip() == str(size):
+                rows = int(saved[0])
+        if rows is None:
+            rows = self.countRows(f) if size != 0 else 0
+        return rows+1;
+
+
+    def write(self,row):
+        '''
+        Appends one row to the log, writing the header first if the log is new
+
+        args:
+        * row - dict of column:value (missing columns are left blank, a seq column is filled in)
+
+        returns:
+        nothing
+        '''
+        f = open(self.fname,'a+')
+        try:
+            fcntl.flock(f.fileno(),fcntl.LOCK_EX)
+            f.seek(0,os.SEEK_END)
+            size = f.tell()
+            row = dict(row)
+            if self.seq:
+                seqNum = self.nextSeq(f,size)
+                row[self.seq] = dt.datetime.today().strftime('%Y_%m_%d')+'_'+str(seqNum)
+            record = ''
+            if size == 0:
+                record = self.formatRow(([''] if self.index else [])+self.columns)
+            record += self.formatRow(([0] if self.index else [])+[row.get(x) for x in self.columns])
+            # one write of the whole record to the end of the file
+            os.write(f.fileno(),record)
+            os.fsync(f.fileno())
+            if self.seq:
+                with open(self.fname+'.seq.tmp','w') as s:
+                    s.write(str(seqNum)+','+str(size+len(record)))
+                os.rename(self.fname+'.seq.tmp',self.fname+'.seq')
+        finally:
+            fcntl.flock(f.fileno(),fcntl.LOCK_UN)
+            f.close()
+
+
+class ANUClimateStage(object):
+    '''
+    Resource use of one pipeline stage - wall time, cpu time (this process and the worker processes it waited for),
+    peak rss of the run by the end of the stage, rows in and out, and the files it wrote (sized when it ends)
+    '''
+
+    def __init__(self,name):
+        '''
+        args:
+        * name - str name of the stage method (eg 'compileLoop')
+        '''
+        self.name = name
+        self.rowsIn = 0
+        self.rowsOut = 0
+        self.files = []
+        # rows written to each file (.dat files), for per variable station counts
+        self.fileRows = {}
+        self.wallSecs = None
+        self.cpuSecs = None
+        self.peakRss = None
+        self.bytesWritten = None
+
+
+    def cpuTime(self):
+        '''
+        User and system cpu time of this process and its finished (waited for) children, eg compileLoop pool workers
+
+        returns:
+        * float of cpu secs
+        '''
+        times = os.times()
+        return times[0]+times[1]+times[2]+times[3];
+
+
+    def __enter__(self):
+        self.start = time.time()
+        self.startCpu = self.cpuTime()
+        return self;
+
+
+    def __exit__(self,excType,excValue,tb):
+        self.wallSecs = time.time()-self.start
+        self.cpuSecs = self.cpuTime()-self.startCpu
+        # ru_maxrss is in KB on linux
+        self.peakRss = round(max(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss)/1024.,1)
+        self.files = sorted(set(self.files))
+        self.bytesWritten = sum(os.path.getsize(x) for x in self.files if os.path.isfile(x))
+        return False;
+
+
+    def row(self,run,process,state):
+        '''
+        Stage log row of the finished stage
+
+        args:
+        * run - str of file handle (prep) or target date (model run)
+        * process - str of process name as in the run log (eg 'compileLoop_alpha')
+        * state - end state of the stage (0 = success, None if not known)
+
+        returns:
+        * dict of stageColumns:value
+        '''
+        return {'date':dt.datetime.today().isoformat(),'run':run,'process':process,'state':state,'wall_secs':round(self.wallSecs,4),
+                'cpu_secs':round(self.cpuSecs,4),'peak_rss_mb':self.peakRss,'rows_in':self.rowsIn,'rows_out':self.rowsOut,
+                'files':len(self.files),'bytes_written':self.bytesWritten};
+
+
+def instrumented(method):
+    '''
+    Decorator for stage methods (downloadFTP, compileLoop, reFormat*, runModel, make_nc, ...) - runs the method in an
+    ANUClimateStage kept on self.stages while it runs (see stageOutput) and left on self.stage once it returns, for the
+    caller to log with its process name. Files written by a nested stage are added to the stage that called it
+
+    args:
+    * method - stage method of a class with a self.stages list
+
+    returns:
+    wrapped method
+    '''
+    @functools.wraps(method)
+    def stageMethod(self,*args,**kwargs):
+        with ANUClimateStage(method.__name__) as stage:
+            self.stages.append(stage)
+            try:
+                return method(self,*args,**kwargs);
+            finally:
+                self.stages.pop()
+                if len(self.stages) != 0:
+                    self.stages[-1].files += stage.files
+                    self.stages[-1].fileRows.update(stage.fileRows)
+                self.stage = stage
+    return stageMethod;
+
+
+def stageOutput(obj,rowsIn=0,rowsOut=0,files=(),fileRows=None):
+    '''
+    Adds rows and written files to the innermost running stage of obj (nothing if no stage is running, eg when a
+    helper like storeSave is called directly)
+
+    args:
+    * obj - instance with a self.stages list (see instrumented)
+    * rowsIn - int of rows read
+    * rowsOut - int of rows written
+    * files - list of str paths written
+    * fileRows - (optional) dict of path:rows written to it
+
+    returns:
+    nothing
+    '''
+    if len(obj.stages) == 0:
+        return;
+    obj.stages[-1].rowsIn += rowsIn
+    obj.stages[-1].rowsOut += rowsOut
+    obj.stages[-1].files += list(files)
+    if fileRows is not None:
+        obj.stages[-1].fileRows.update(fileRows)
+
+
+def stageLogger(logPath,action,tarDt,stage):
+    '''
+    Appends the row of a finished instrumented model run or netcdf step to <logPath>/ANUClimate_model_run_stage_log.csv
+    only (ANUClimate_model_run_log.csv gets no row for it)
+
+    args:
+    * logPath - str of the model run log dir
+    * action - str of step (eg 'runModel tmax')
+    * tarDt - str of target date of the step
+    * stage - ANUClimateStage of the step (self.stage after an instrumented method)
+
+    returns:
+    nothing
+    '''
+    ANUClimateLog(os.path.join(logPath,'ANUClimate_model_run_stage_log.csv'),stageColumns).write(stage.row(tarDt,action,None))
+
+
+class ANUClimateMetrics(object):
+    '''
+    node_exporter textfile collector metrics of one script (<path>/anuclimate_<script>.prom) - each update is merged
+    into the series already in the file (so a series keeps the value of the last run that set it) and the file is
+    rewritten with a rename under a lock, so node_exporter never reads a partial file. Local filesystem only
+    '''
+
+    def __init__(self,path,script):
+        '''
+        args:
+        * path - str dir the node_exporter textfile collector reads (eg ANUCLIMATE_METRICS_DIR or <logPath>metrics)
+        * script - str label of the script (eg 'prep', 'prep_rerun', 'model_run', 'nc')
+        '''
+        self.fname = os.path.join(path,'anuclimate_'+script+'.prom')
+        self.script = script
+
+
+    def series(self,name,labels=None):
+        '''
+        Series name in the exposition format, eg anuclimate_stage_duration_seconds{script="prep",stage="downloadFTP"}
+
+        args:
+        * name - str metric name (a metricHelp key)
+        * labels - (optional) dict of label:value
+
+        returns:
+        * str series
+        '''
+        labels = dict(labels or {},script=self.script)
+        escape = lambda x: str(x).replace('\\','\\\\').replace('"','\\"').replace('\n','\\n')
+        return name+'{'+','.join([k+'="'+escape(v)+'"' for k,v in sorted(labels.items())])+'}';
+
+
+    def stageValues(self,stage,labels,state=None):
+        '''
+        Metrics of a finished ANUClimateStage
+
+        args:
+        * stage - ANUClimateStage
+        * labels - dict of label:value of the stage (eg {'stage':'compileLoop_alpha'})
+        * state - (optional) end state of the stage (0 = success)
+
+        returns:
+        * list of (name, labels, value)
+        '''
+        values = [('anuclimate_stage_duration_seconds',labels,stage.wallSecs),
+                  ('anuclimate_stage_cpu_seconds',labels,stage.cpuSecs),
+                  ('anuclimate_stage_peak_rss_bytes',labels,int(stage.peakRss*1024*1024)),
+                  ('anuclimate_stage_rows_in',labels,stage.rowsIn),
+                  ('anuclimate_stage_rows_out',labels,stage.rowsOut),
+                  ('anuclimate_stage_files_written',labels,len(stage.files)),
+                  ('anuclimate_stage_bytes_written',labels,stage.bytesWritten),
+                  ('anuclimate_stage_timestamp_seconds',labels,time.time())]
+        if state is not None:
+            values.append(('anuclimate_stage_state',labels,int(state)))
+        return values;
+
+
+    def update(self,values):
+        '''
+        Sets metric values and rewrites the metrics file
+
+        args:
+        * values - list of (name, labels dict, value), None values are skipped
+
+        returns:
+        nothing
+        '''
+        try:
+            os.makedirs(os.path.dirname(self.fname))
+        except:
+            pass
+        lock = open(self.fname+'.lock','a')
+        try:
+            fcntl.flock(lock.fileno(),fcntl.LOCK_EX)
+            samples = {}
+            if os.path.isfile(self.fname):
+                with open(self.fname,'r') as f:
+                    for line in f:
+                        if line.startswith('#') or ' ' not in line.strip():
+                            continue
+                        series,value = line.strip().rsplit(' ',1)
+                        samples[series] = value
+            for name,labels,value in values:
+                if value is not None:
+                    samples[self.series(name,labels)] = repr(round(float(value),6))
+            lines = []
+            for name in sorted(set(x.split('{')[0] for x in samples)):
+                if name in metricHelp:
+                    lines += ['# HELP '+name+' '+metricHelp[name][1],'# TYPE '+name+' '+metricHelp[name][0]]
+                lines += [x+' '+samples[x] for x in sorted(samples) if x.split('{')[0] == name]
+            with open(self.fname+'.tmp','w') as f:
+                f.write('\n'.join(lines)+'\n')
+            os.rename(self.fname+'.tmp',self.fname)
+        finally:
+            fcntl.flock(lock.fileno(),fcntl.LOCK_UN)
+            lock.close()
+
+
+def metricsFor(script,logPath):
+    '''
+    node_exporter textfile metrics of a script - in ANUCLIMATE_METRICS_DIR (the collector's textfile dir) or
+    <logPath>/metrics
+
+    args:
+    * script - str label of the script (eg 'prep', 'prep_rerun', 'model_run', 'model_rerun', 'nc')
+    * logPath - str of the script's log dir
+
+    returns:
+    * ANUClimateMetrics writing <dir>/anuclimate_<script>.prom
+    '''
+    return ANUClimateMetrics(os.environ.get('ANUCLIMATE_METRICS_DIR',os.path.join(logPath,'metrics')),script);
+
+
+class ANUClimateRunHistory(object):
+    '''
+    Indexed sqlite copy of ANUClimate_log.csv (one runlog row per log row, with the date parsed from the file handle),
+    so PyANUClimate_RERUN.py finds dates that never ran or never completed without reading the whole log - the csv
+    stays the log of record and the rows appended since the last lookup are imported from it at the start of each
+    lookup (logging itself never opens the history, so a locked or broken sqlite file can't stop a run)
+    '''
+
+    def __init__(self,dbName,logName):
+        '''
+        args:
+        * dbName - str path of the sqlite file (eg <logPath>ANUClimate_log.sqlite)
+        * logName - str path of the csv log it mirrors (prepColumns layout)
+        '''
+        self.dbName = dbName
+        self.logName = logName
+
+
+    def connect(self):
+        '''
+        Opens the history, creating the tables and indexes on first use
+
+        returns:
+        * sqlite3 connection
+        '''
+        con = sqlite3.connect(self.dbName,timeout=60)
+        con.execute('CREATE TABLE IF NOT EXISTS runlog (seq TEXT, date TEXT, file_handle TEXT, fh_date TEXT, process TEXT, timing_secs TEXT, state TEXT, comment TEXT)')
+        # run_complete lookups by date (and the handle of each date) are answered from this index alone
+        con.execute('CREATE INDEX IF NOT EXISTS runlog_date ON runlog (fh_date, process, file_handle)')
+        con.execute('CREATE INDEX IF NOT EXISTS runlog_handle ON runlog (file_handle, process)')
+        con.execute('CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT)')
+        return con;
+
+
+    def fhDate(self,fHandle):
+        '''
+        Date of a BoM file handle (eg 'ANUdaily9am3pm20170812Sat' is '2017-08-12')
+
+        args:
+        * fHandle - str of BoM file identifier
+
+        returns:
+        * str 'YYYY-MM-DD', None for anything that isn't a file handle
+        '''
+        if not isinstance(fHandle,basestring) or len(fHandle) != 25 or not fHandle[14:22].isdigit():
+            return None;
+        return fHandle[14:18]+'-'+fHandle[18:20]+'-'+fHandle[20:22];
+
+
+    def record(self,row):
+        '''
+        runlog values for a log row
+
+        args:
+        * row - dict of prepColumns:value
+
+        returns:
+        * tuple in runlog column order
+        '''
+        text = lambda x: x if x is None or isinstance(x,basestring) else str(x)
+        values = [text(row.get(x)) for x in ['seq','date','file_handle']]
+        values.append(self.fhDate(row.get('file_handle')))
+        values += [text(row.get(x)) for x in ['process','timing_secs','state','comment']]
+        return tuple(values);
+
+
+    def sync(self,con,f,size):
+        '''
+        Imports the csv rows the history hasn't seen - the rows after the log size recorded at the last import, or the
+        whole log if it has shrunk (rotated or edited) since
+
+        args:
+        * con - sqlite3 connection from connect
+        * f - open csv log file
+        * size - int of log size in bytes to import up to
+
+        returns:
+        nothing (commit is left to the caller)
+        '''
+        seen = con.execute("SELECT value FROM meta WHERE key='log_size'").fetchone()
+        seen = int(seen[0]) if seen else 0
+        if seen == size:
+            return;
+        if seen > size:
+            con.execute('DELETE FROM runlog')
+            seen = 0
+        f.seek(0)
+        headLine = f.readline()
+        header = next(csv.reader(StringIO(headLine)),[])
+        # only the new records (up to size) are read
+        f.seek(max(seen,len(headLine)))
+        rows = csv.reader(StringIO(f.read(size-max(seen,len(headLine)))))
+        records = [self.record(dict(zip(header,x))) for x in rows if len(x) == len(header)]
+        con.executemany('INSERT INTO runlog VALUES (?,?,?,?,?,?,?,?)',records)
+        con.execute("INSERT OR REPLACE INTO meta VALUES ('log_size',?)",(str(size),))
+
+
+    def incompleteRuns(self,start,end):
+        '''
+        Dates from start to end without a run_complete row - one indexed query for the dates' runs, after importing
+        any csv rows the history hasn't seen (the calendar of dates is built here rather than in sql, as the recursive
+        queries that could build it need sqlite 3.8.3 and RHEL/CentOS 7 has 3.7.17)
+
+        args:
+        * start - datetime.date of the first date to check (dates before the first logged run are never returned)
+        * end - datetime.date of the last date to check (dates with no rows at all are only returned before end,
+          as end's own run may not have started)
+
+        returns:
+        * list of (datetime.date, file handle of the date's rows or None if it never ran) in date order
+        '''
+        if not os.path.isfile(self.logName):
+            return [];
+        f = open(self.logName,'r')
+        con = self.connect()
+        try:
+            fcntl.flock(f.fileno(),fcntl.LOCK_SH)
+            f.seek(0,os.SEEK_END)
+            self.sync(con,f,f.tell())
+            con.commit()
+            fcntl.flock(f.fileno(),fcntl.LOCK_UN)
+            first = con.execute('SELECT MIN(fh_date) FROM runlog').fetchone()[0]
+            # file handle and whether it completed, for each date with rows
+            runs = {}
+            if first is not None:
+                for d,fh,done in con.execute('''SELECT fh_date,MIN(file_handle),MAX(process='run_complete') FROM runlog
+                                                WHERE fh_date >= ? AND fh_date <= ? GROUP BY fh_date''',
+                                             (max(start.isoformat(),first),end.isoformat())):
+                    runs[d] = (fh,done)
+        finally:
+            con.close()
+            f.close()
+        if first is None:
+            return [];
+        missing = []
+        day = max(start,dt.datetime.strptime(first,'%Y-%m-%d').date())
+        while day <= end:
+            fh,done = runs.get(day.isoformat(),(None,0))
+            if done != 1 and (fh is not None or day < end):
+                missing.append((day,fh))
+            day += dt.timedelta(days=1)
+        return missing;
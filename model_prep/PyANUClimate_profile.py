@@ -0,0 +1,199 @@
+####################################################################################
+# ANUClimate automation - stage profiling
+# v16.0
+# author: Ian Marang
+#
+# Description:
+# opt in cProfile hooks for the prep (PyANUClimate.py, PyANUClimate_RERUN.py) and netcdf
+# (PyANUClimate_nc.py) scripts. ANUCLIMATE_PROFILE (or --profile) names the methods to
+# profile, eg 'fileRead,fileClean,reFormatMonthly' or 'make_nc'; their class methods are only
+# wrapped when it is set, so there is nothing in the way of a normal run. Profiles and a
+# top N hot function summary are written to <logPath>profile/<run>/ when the script exits.
+# Standard library only.
+####################################################################################
+
+# import libraries
+import os, sys
+import atexit
+import cProfile
+import pstats
+import functools
+import multiprocessing.util
+import datetime as dt
+from glob import glob
+from cStringIO import StringIO
+
+
+def profileArg(argv=None):
+    '''
+    Stages to profile - from a '--profile <names>' or '--profile=<names>' command line arg, or the ANUCLIMATE_PROFILE
+    environment variable
+
+    args:
+    * argv - (optional) list of command line args (default sys.argv)
+
+    returns:
+    * list of str method names, empty if profiling is off
+    '''
+    argv = sys.argv if argv is None else argv
+    value = os.environ.get('ANUCLIMATE_PROFILE','')
+    for i,arg in enumerate(argv):
+        if arg == '--profile' and i+1 < len(argv):
+            value = argv[i+1]
+        elif arg.startswith('--profile='):
+            value = arg.split('=',1)[1]
+    return [x.strip() for x in value.split(',') if x.strip() != ''];
+
+
+class ANUClimateProfile(object):
+    '''
+    cProfile hooks for chosen stage methods - each method is replaced on its class by a wrapper that profiles its calls
+    into one profile per method and process (pool workers profile their own calls and save them once, as they exit). A
+    method called inside another profiled method is counted in the outer method's profile, and only the calling
+    thread is profiled (not writeFiles' writer threads)
+    '''
+
+    def __init__(self,path,stages,top=None):
+        '''
+        args:
+        * path - str dir the profiles and summaries are written to (made on first use)
+        * stages - list of str method names to profile
+        * top - (optional) int of functions listed per stage in the summary (default ANUCLIMATE_PROFILE_TOP or 30)
+        '''
+        self.path = path
+        self.stages = stages
+        self.top = int(top if top is not None else os.environ.get('ANUCLIMATE_PROFILE_TOP',30))
+        # process that set up the hooks, its profiles are saved by summary
+        self.pid = os.getpid()
+        # cProfile.Profile of each (process id, method name), and the method being profiled in each process
+        self.profiles = {}
+        self.active = {}
+
+
+    def wrap(self,cls):
+        '''
+        Replaces the chosen methods of cls (and its parent classes, as seen from cls) with profiled ones
+
+        args:
+        * cls - class to hook (eg ANUClimateAuto)
+
+        returns:
+        * list of str method names hooked (names cls doesn't have are skipped)
+        '''
+        hooked = []
+        for name in self.stages:
+            method = getattr(cls,name,None)
+            if method is None or not callable(method):
+                print('No '+name+' method to profile in '+cls.__name__)
+                continue
+            setattr(cls,name,self.profiled(name,getattr(method,'__func__',method)))
+            hooked.append(name)
+        return hooked;
+
+
+    def profiled(self,name,func):
+        '''
+        Profiled version of a method
+
+        args:
+        * name - str method name
+        * func - function of the method
+
+        returns:
+        * function calling func under the method's cProfile.Profile
+        '''
+        @functools.wraps(func)
+        def profileMethod(*args,**kwargs):
+            pid = os.getpid()
+            # inside another profiled method of this process, already counted in its profile
+            if self.active.get(pid) is not None:
+                return func(*args,**kwargs);
+            if (pid,name) not in self.profiles:
+                self.profiles[(pid,name)] = cProfile.Profile()
+                # pool workers don't outlive the pool, so they save as they exit (run on close/join, not terminate)
+                if pid != self.pid:
+                    multiprocessing.util.Finalize(None,self.save,args=(pid,name),exitpriority=0)
+            prof = self.profiles[(pid,name)]
+            self.active[pid] = name
+            prof.enable()
+            try:
+                return func(*args,**kwargs);
+            finally:
+                prof.disable()
+                self.active[pid] = None
+        return profileMethod;
+
+
+    def save(self,pid,name):
+        '''
+        Writes a process's profile of a method to <path><name>.<pid>.prof
+
+        args:
+        * pid - int process id
+        * name - str method name
+
+        returns:
+        nothing
+        '''
+        try:
+            os.makedirs(self.path)
+        except:
+            pass
+        self.profiles[(pid,name)].dump_stats(self.path+name+'.'+str(pid)+'.prof')
+
+
+    def summary(self):
+        '''
+        Saves this process's profiles and writes <path>profile_summary.txt (and <name>.txt per method) with the top
+        functions by cumulative time, the profiles of every process merged
+
+        returns:
+        * str path of the summary (None if nothing was profiled, or called in a pool worker)
+        '''
+        if os.getpid() != self.pid:
+            return None;
+        for pid,name in list(self.profiles):
+            if pid == self.pid:
+                self.save(pid,name)
+        out = []
+        for name in self.stages:
+            files = sorted(glob(self.path+name+'.*.prof'))
+            if len(files) == 0:
+                continue
+            buf = StringIO()
+            stats = pstats.Stats(*files,stream=buf)
+            buf.write(name+' - '+str(len(files))+' process profile(s), '+str(stats.total_calls)+' calls, '+str(round(stats.total_tt,4))+' secs\n')
+            stats.sort_stats('cumulative').print_stats(self.top)
+            with open(self.path+name+'.txt','w') as f:
+                f.write(buf.getvalue())
+            out.append(buf.getvalue())
+        if len(out) == 0:
+            return None;
+        with open(self.path+'profile_summary.txt','w') as f:
+            f.write('\n'.join(out))
+        print('Profile summary: '+self.path+'profile_summary.txt')
+        return self.path+'profile_summary.txt';
+
+
+def profileHooks(classes,logPath,script):
+    '''
+    Sets up profiling of the stages named by profileArg, nothing at all if none are - the summary is written when the
+    script exits (failed runs included)
+
+    args:
+    * classes - list of classes whose methods can be profiled
+    * logPath - str log dir, profiles go to <logPath>/profile/<YYYYMMDDTHHMMSS>_<script>/
+    * script - str name of the run for the profile dir (eg 'PyANUClimate')
+
+    returns:
+    * ANUClimateProfile, None if profiling is off
+    '''
+    stages = profileArg()
+    if len(stages) == 0:
+        return None;
+    path = os.path.join(logPath,'profile',dt.datetime.today().strftime('%Y%m%dT%H%M%S')+'_'+script)+'/'
+    profile = ANUClimateProfile(path,stages)
+    for cls in classes:
+        profile.wrap(cls)
+    atexit.register(profile.summary)
+    return profile;
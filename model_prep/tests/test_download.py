@@ -0,0 +1,218 @@
+####################################################################################
+# ANUClimate automation - downloadFTP retry test
+# v16.0
+# author: Ian Marang
+#
+# Description:
+# serves the fixture archive (fixtures/golden/DS082_golden.zip) from a local ftp stand-in
+# (FtpStub, a few commands over plain sockets, passive mode only) that can drop the
+# connection part way through a transfer or flip a byte of it, and checks downloadFTP:
+# - resumes a dropped transfer from the size of its .part file (REST) and still indexes it
+# - rejects a corrupt zip and downloads it again from scratch
+# - gives up after ftpRetries attempts, with every failed attempt in the comment
+#
+# usage: cd model_prep; python -m unittest discover tests
+####################################################################################
+
+# import libraries
+import os, sys
+import unittest
+import tempfile
+import shutil
+import socket
+import threading
+import warnings
+
+sys.path.insert(0,os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from PyANUClimate import ANUClimateAuto
+
+fixturePath = os.path.join(os.path.dirname(os.path.abspath(__file__)),'fixtures')+'/'
+
+
+class FtpStub(object):
+    '''
+    Local ftp stand-in serving the files of one dir - each RETR is recorded with its REST offset, the first dropCount
+    transfers are cut after dropAfter bytes (data and control connections closed, no reply) and the first corrupt
+    transfers have a byte flipped half way through
+    '''
+
+    def __init__(self,root,dropAfter=0,dropCount=0,corrupt=0):
+        '''
+        args:
+        * root - str dir of the files served
+        * dropAfter - int of bytes sent before a dropped transfer is cut
+        * dropCount - int of transfers to drop
+        * corrupt - int of transfers to corrupt
+        '''
+        self.root = root
+        self.dropAfter = dropAfter
+        self.dropCount = dropCount
+        self.corrupt = corrupt
+        self.retrs = []
+        self.server = socket.socket()
+        self.server.bind(('127.0.0.1',0))
+        self.server.listen(5)
+        self.port = self.server.getsockname()[1]
+        thread = threading.Thread(target=self.serve)
+        thread.daemon = True
+        thread.start()
+
+
+    def serve(self):
+        while True:
+            try:
+                conn = self.server.accept()[0]
+            except socket.error:
+                return;
+            thread = threading.Thread(target=self.session,args=(conn,))
+            thread.daemon = True
+            thread.start()
+
+
+    def session(self,conn):
+        '''
+        One control connection, answering the commands ftplib sends for a download
+        '''
+        reply = lambda msg: conn.sendall(msg+'\r\n')
+        lines = conn.makefile('rb')
+        reply('220 stub')
+        rest = 0
+        pasv = None
+        try:
+            while True:
+                cmd,_,arg = lines.readline().strip().partition(' ')
+                path = os.path.join(self.root,os.path.basename(arg))
+                if cmd == '':
+                    break
+                elif cmd == 'USER':
+                    reply('331 ok')
+                elif cmd == 'PASS':
+                    reply('230 ok')
+                elif cmd in ['CWD','TYPE']:
+                    reply('250 ok')
+                elif cmd == 'SIZE':
+                    reply('213 '+str(os.path.getsize(path)) if os.path.isfile(path) else '550 no file')
+                elif cmd == 'MDTM':
+                    reply('213 20170406120000')
+                elif cmd == 'REST':
+                    rest = int(arg)
+                    reply('350 ok')
+                elif cmd == 'PASV':
+                    pasv = socket.socket()
+                    pasv.bind(('127.0.0.1',0))
+                    pasv.listen(1)
+                    port = pasv.getsockname()[1]
+                    reply('227 Entering Passive Mode (127,0,0,1,%d,%d)' % (port//256,port%256))
+                elif cmd == 'RETR':
+                    with open(path,'rb') as f:
+                        data = bytearray(f.read()[rest:])
+                    self.retrs.append(rest)
+                    if len(self.retrs) <= self.corrupt:
+                        data[len(data)//2] ^= 0xff
+                    reply('150 sending')
+                    dataConn = pasv.accept()[0]
+                    pasv.close()
+                    if len(self.retrs) <= self.dropCount:
+                        dataConn.sendall(str(data[:self.dropAfter]))
+                        dataConn.close()
+                        return;
+                    dataConn.sendall(str(data))
+                    dataConn.close()
+                    reply('226 done')
+                    rest = 0
+                elif cmd == 'QUIT':
+                    reply('221 bye')
+                    break
+                else:
+                    reply('502 not here')
+        finally:
+            conn.close()
+
+
+    def close(self):
+        self.server.close()
+
+
+class DownloadRetryTest(unittest.TestCase):
+    '''
+    downloadFTP against FtpStub dropping or corrupting transfers of the fixture archive
+    '''
+
+    def setUp(self):
+        self.cwd = os.getcwd()
+        self.tmp = tempfile.mkdtemp()
+        self.auto = ANUClimateAuto()
+        self.auto.destPath = self.tmp+'/download/'
+        self.auto.zipPath = self.tmp+'/unzip/'
+        self.auto.backupPath = self.tmp+'/backup/'
+        self.auto.logPath = self.tmp+'/log/'
+        self.auto.hostName = '127.0.0.1'
+        self.auto.hostPath = '/'
+        self.auto.ftpBackoff = 0
+        self.auto.ftpTimeout = 10
+        self.stub = None
+        with open(fixturePath+'golden/DS082_golden.zip','rb') as f:
+            self.archive = f.read()
+
+
+    def tearDown(self):
+        if self.stub is not None:
+            self.stub.close()
+        os.chdir(self.cwd)
+        shutil.rmtree(self.tmp,True)
+
+
+    def download(self,**kwargs):
+        '''
+        Runs downloadFTP against a new FtpStub
+
+        args:
+        * kwargs - FtpStub drop and corrupt settings
+
+        returns:
+        * tuple of (state, comment, bytes of the downloaded zip or None)
+        '''
+        self.stub = FtpStub(fixturePath+'golden/',**kwargs)
+        self.auto.ftpPort = self.stub.port
+        timing,state,comment = self.auto.downloadFTP('golden')
+        zipName = self.auto.destPath+'golden/DS082_golden.zip'
+        if not os.path.isfile(zipName):
+            return state,comment,None;
+        with open(zipName,'rb') as f:
+            return state,comment,f.read();
+
+
+    def test_resume(self):
+        state,comment,data = self.download(dropAfter=5000,dropCount=1)
+        self.assertEqual(state,0,comment)
+        # second attempt asked for the rest of the file only
+        self.assertEqual(self.stub.retrs,[0,5000])
+        self.assertEqual(data,self.archive)
+        self.assertIn('attempt 1 EOFError',comment)
+        # the station files were still indexed as they arrived
+        self.assertTrue(os.path.isfile(self.auto.backupPath+'golden/golden_index.csv'))
+        self.assertFalse(os.path.isfile(self.auto.destPath+'golden/DS082_golden.zip.part'))
+
+
+    def test_corrupt(self):
+        state,comment,data = self.download(corrupt=1)
+        self.assertEqual(state,0,comment)
+        # the corrupt file was thrown away, not resumed
+        self.assertEqual(self.stub.retrs,[0,0])
+        self.assertEqual(data,self.archive)
+        self.assertIn('attempt 1 rejected',comment)
+
+
+    def test_give_up(self):
+        self.auto.ftpRetries = 3
+        state,comment,data = self.download(dropAfter=4000,dropCount=10)
+        self.assertEqual(state,1)
+        self.assertIsNone(data)
+        self.assertEqual(len(self.stub.retrs),3)
+        self.assertTrue(comment.startswith('FTP failed after 3 attempts: attempt 1 '),comment)
+        self.assertIn('attempt 3 ',comment)
+
+
+if __name__ == '__main__':
+    warnings.simplefilter('ignore')
+    unittest.main()
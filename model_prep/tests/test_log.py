@@ -0,0 +1,89 @@
+####################################################################################
+# ANUClimate automation - run log round trip test
+# v16.0
+# author: Ian Marang
+#
+# Description:
+# appends rows to a prep log with ANUClimateLog and reads them back as the old pandas
+# logger and PyANUClimate_RERUN.py did (pd.read_csv(log,index_col=[0])), comments with
+# commas, quotes and line breaks included, and checks the seq counter kept in <log>.seq
+# carries on across writers and is rebuilt when the log was changed by something else.
+#
+# usage: cd model_prep; python -m unittest discover tests
+####################################################################################
+
+# import libraries
+import os, sys
+import unittest
+import tempfile
+import shutil
+import datetime as dt
+import pandas as pd
+
+sys.path.insert(0,os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from PyANUClimate_log import ANUClimateLog, prepColumns
+
+comments = ['FTP success for ANUdaily9am3pm20170812Sat',
+            'FTP failed after 2 attempts: attempt 1 EOFError, attempt 2 error_temp 421 "too many users"',
+            'reformat failed:\nTraceback (most recent call last):\n  KeyError: tmax',
+            None,
+            u'caf\xe9 at 42.0, RERUN']
+
+
+class LogRoundTripTest(unittest.TestCase):
+    '''
+    ANUClimate_log.csv rows written by ANUClimateLog, read back with pandas
+    '''
+
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.fname = self.tmp+'/ANUClimate_log.csv'
+
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp,True)
+
+
+    def write(self,comments,process='downloadFTP'):
+        # a new logger per row, as ANUClimateAuto.logger makes one for each call
+        for comment in comments:
+            ANUClimateLog(self.fname,prepColumns,index=True,seq='seq').write({'date':dt.datetime.today().isoformat(),
+                'file_handle':'ANUdaily9am3pm20170812Sat','process':process,'timing_secs':'0.5','state':0,'comment':comment})
+
+
+    def seqNums(self,df):
+        return [int(x.split('_')[-1]) for x in df.seq];
+
+
+    def test_round_trip(self):
+        self.write(comments)
+        df = pd.read_csv(self.fname,index_col=[0])
+        self.assertEqual(list(df.columns),prepColumns)
+        self.assertEqual(df.index.size,len(comments))
+        self.assertEqual([None if pd.isnull(x) else x.decode('utf-8') for x in df.comment],comments)
+        self.assertEqual(list(df.state),[0]*len(comments))
+        self.assertEqual(self.seqNums(df),range(1,len(comments)+1))
+        today = dt.datetime.today().strftime('%Y_%m_%d')
+        self.assertTrue(all(x.startswith(today+'_') for x in df.seq))
+        with open(self.fname+'.seq','r') as f:
+            self.assertEqual(f.read(),str(len(comments))+','+str(os.path.getsize(self.fname)))
+
+
+    def test_seq_rebuilt(self):
+        self.write(comments[:3])
+        # a row appended by another tool leaves the size saved in .seq behind, so the log is counted again
+        with open(self.fname,'a') as f:
+            f.write('0,"hand added,\nrow",2017-08-12T16:00:00,ANUdaily9am3pm20170812Sat,note,2017_08_12_4,0,0.0\n')
+        self.write(comments[3:])
+        # and counted again if .seq is lost
+        os.remove(self.fname+'.seq')
+        self.write(comments[:1],'run_complete')
+        df = pd.read_csv(self.fname,index_col=[0])
+        self.assertEqual(self.seqNums(df),range(1,len(comments)+3))
+        self.assertEqual(df.comment.iloc[3],'hand added,\nrow')
+        self.assertEqual(list(df.process)[-1],'run_complete')
+        self.assertEqual(df.comment.iloc[2],comments[2])
+
+
+if __name__ == '__main__':
+    unittest.main()
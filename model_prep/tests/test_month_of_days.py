@@ -0,0 +1,123 @@
+####################################################################################
+# ANUClimate automation - month of days .dat golden test
+# v16.0
+# author: Ian Marang
+#
+# Description:
+# compiles February and March 2017 of the fixture archive used by test_monthly.py
+# (fixtures/golden/DS082_golden.zip) and checks the month of days .dat files
+# reFormatMonthOfDays writes byte for byte against fixtures/expected/days/, the same for
+# beta and stable. Every station row holds one column per day of the month (fileSubset
+# reindexes each station onto the full month), so a day a station skipped is -99.9 in its
+# own column and the days after it stay in place:
+# 001010 - no row on 2017-03-15, -99.9 in day column 15 of every variable
+# 001009 - rain not reported on 2017-03-31, -99.9 in the last rain column
+# 001002 - blank from day 26, -99.9 from day column 26 to the end of the month
+#
+# usage: cd model_prep; python -m unittest discover tests
+####################################################################################
+
+# import libraries
+import os, sys
+import unittest
+import tempfile
+import shutil
+import warnings
+
+sys.path.insert(0,os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from PyANUClimate import ANUClimateAuto
+
+fixturePath = os.path.join(os.path.dirname(os.path.abspath(__file__)),'fixtures')+'/'
+
+
+class MonthOfDaysGoldenTest(unittest.TestCase):
+    '''
+    reFormatMonthOfDays output for the fixture archive, station rows aligned on the days of the month
+    '''
+
+    months = ['2017_02','2017_03']
+
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.auto = ANUClimateAuto()
+        # read the fixture zip where downloadFTP would leave it, everything written goes to tmp
+        self.auto.destPath = fixturePath
+        self.auto.zipPath = self.tmp+'/unzip/'
+        self.auto.backupPath = self.tmp+'/backup/'
+        self.auto.logPath = self.tmp+'/log/'
+
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp,True)
+
+
+    def runMonthOfDays(self,dStream):
+        '''
+        Compiles and reformats the fixture months for a datastream, the .dat files all written to one dir
+
+        args:
+        * dStream - str of datastream ('beta' or 'stable')
+
+        returns:
+        * str path of the dir holding the .dat files
+        '''
+        out = self.tmp+'/'+dStream+'/'
+        os.makedirs(out)
+        for key,var in self.auto.varDict.items():
+            self.auto.varDict[key] = [var[0]]+[out]*5
+        for dtStr in self.months:
+            df = self.auto.compileLoop('golden',dtStr,dStream)[0]
+            self.auto.reFormatMonthOfDays(df,dtStr,dStream)
+        return out;
+
+
+    def stationRow(self,fname,station):
+        '''
+        Day values of a station in a month of days .dat file
+
+        args:
+        * fname - str path of the .dat file
+        * station - str of Station_ID
+
+        returns:
+        * list of str values, one per day of the month
+        '''
+        with open(fname,'r') as f:
+            rows = [x.split() for x in f if x.split()[0] == station]
+        self.assertEqual(len(rows),1,station+' rows in '+fname)
+        return rows[0][3:];
+
+
+    def checkMonthOfDays(self,dStream):
+        out = self.runMonthOfDays(dStream)
+        expected = fixturePath+'expected/days/'
+        self.assertEqual(sorted(os.listdir(out)),sorted(os.listdir(expected)))
+        for fname in sorted(os.listdir(expected)):
+            with open(expected+fname,'rb') as f:
+                want = f.read()
+            with open(out+fname,'rb') as f:
+                got = f.read()
+            self.assertEqual(got,want,dStream+' '+fname+' differs from the expected output')
+        # the skipped day is blank in its own column, the days around it are kept where they were
+        for var in ['tmax','rain']:
+            days = self.stationRow(out+var+'_2017_03.dat','001010')
+            full = self.stationRow(out+var+'_2017_03.dat','001001')
+            self.assertEqual(len(days),31)
+            self.assertEqual(days[14],'-99.9')
+            self.assertEqual(days[:14]+days[15:],full[:14]+full[15:])
+        self.assertEqual(self.stationRow(out+'rain_2017_03.dat','001009')[-1],'-99.9')
+        self.assertEqual(self.stationRow(out+'tmax_2017_03.dat','001002')[25:],['-99.9']*6)
+        self.assertEqual(len(self.stationRow(out+'tmax_2017_02.dat','001001')),28)
+
+
+    def test_beta(self):
+        self.checkMonthOfDays('beta')
+
+
+    def test_stable(self):
+        self.checkMonthOfDays('stable')
+
+
+if __name__ == '__main__':
+    warnings.simplefilter('ignore')
+    unittest.main()
@@ -0,0 +1,126 @@
+####################################################################################
+# ANUClimate automation - monthly .dat golden test
+# v16.0
+# author: Ian Marang
+#
+# Description:
+# compiles the beta and stable months of a small fixture archive (fixtures/golden/DS082_golden.zip,
+# 12 DC02D station files from 2017-01-25 to 2017-04-05) and checks the .dat files reFormatMonthly
+# writes byte for byte against fixtures/expected/<stream>/, the output of the v15 monthly code
+# (per station groupby) before the single pass groupStats engine replaced it.
+#
+# fixture stations, each sat on one of the monthly rules:
+# 001001 - every day reported, rain cycling 0.0/0.2/0.3 (only >0.2 mm is a rain day), tmin cycling
+#          -1.5/2.0/2.1 (<=2 C is a frost day), some N quality flags
+# 001002 - 25 valid days (blank from day 26), monthly values kept, rain accumulation incomplete
+# 001003 - 24 valid days (day 25 failing its quality flags), dropped from every monthly file
+# 001004 - evap first day accumulated over 5 days, 35 accumulation days in March (kept)
+# 001005 - evap first day accumulated over 6 days, 36 accumulation days in March (dropped)
+# 001006 - evap on 25 days only, 25 accumulation days (kept)
+# 001007 - evap all 0.0 (dropped)
+# 001008 - rain accumulated over 3 days mid month, month still complete (kept)
+# 001009 - last day of the month not reported (rain dropped)
+# 001010 - no row on the 15th (filled by fileSubset, rain dropped)
+# 001011 - frost and rain every day
+# 001012 - no rows in February or March
+#
+# usage: cd model_prep; python -m unittest discover tests
+####################################################################################
+
+# import libraries
+import os, sys
+import unittest
+import numpy as np
+import tempfile
+import shutil
+import warnings
+
+sys.path.insert(0,os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from PyANUClimate import ANUClimateAuto
+
+fixturePath = os.path.join(os.path.dirname(os.path.abspath(__file__)),'fixtures')+'/'
+
+
+class MonthlyGoldenTest(unittest.TestCase):
+    '''
+    reFormatMonthly output for the fixture archive against the v15 .dat files
+    '''
+
+    months = ['2017_02','2017_03']
+
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.auto = ANUClimateAuto()
+        # read the fixture zip where downloadFTP would leave it, everything written goes to tmp
+        self.auto.destPath = fixturePath
+        self.auto.zipPath = self.tmp+'/unzip/'
+        self.auto.backupPath = self.tmp+'/backup/'
+        self.auto.logPath = self.tmp+'/log/'
+
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp,True)
+
+
+    def runMonthly(self,dStream):
+        '''
+        Compiles and reformats the fixture months for a datastream, the .dat files all written to one dir
+
+        args:
+        * dStream - str of datastream ('beta' or 'stable')
+
+        returns:
+        * str path of the dir holding the .dat files
+        '''
+        out = self.tmp+'/'+dStream+'/'
+        self.auto.baseDir = out
+        for key,var in self.auto.varDict.items():
+            self.auto.varDict[key] = [var[0]]+[out]*5
+        for name in ['pw','frst']:
+            os.makedirs(out+name+'_mth_v2_0/'+dStream+'/dat/bomdat/')
+        for dtStr in self.months:
+            df = self.auto.compileLoop('golden',dtStr,dStream)[0]
+            self.auto.reFormatMonthly(df,dtStr,dStream)
+        # pw and fd files are written under baseDir, move them in with the rest
+        for name in ['pw','frst']:
+            path = out+name+'_mth_v2_0/'+dStream+'/dat/bomdat/'
+            for fname in os.listdir(path):
+                shutil.move(path+fname,out+fname)
+            shutil.rmtree(out+name+'_mth_v2_0')
+        return out;
+
+
+    def checkMonthly(self,dStream):
+        out = self.runMonthly(dStream)
+        expected = fixturePath+'expected/'+dStream+'/'
+        self.assertEqual(sorted(os.listdir(out)),sorted(os.listdir(expected)))
+        for fname in sorted(os.listdir(expected)):
+            with open(expected+fname,'rb') as f:
+                want = f.read()
+            with open(out+fname,'rb') as f:
+                got = f.read()
+            self.assertEqual(got,want,dStream+' '+fname+' differs from the v15 output')
+
+
+    def test_beta(self):
+        self.checkMonthly('beta')
+
+
+    def test_stable(self):
+        self.checkMonthly('stable')
+
+
+    def test_stable_nocache(self):
+        self.auto.useCache = False
+        self.checkMonthly('stable')
+
+
+    def test_stable_lean(self):
+        # ANUCLIMATE_LEAN float32 values
+        self.auto.valueType = np.float32
+        self.checkMonthly('stable')
+
+
+if __name__ == '__main__':
+    warnings.simplefilter('ignore')
+    unittest.main()
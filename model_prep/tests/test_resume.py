@@ -0,0 +1,177 @@
+####################################################################################
+# ANUClimate automation - PyANUClimate_RERUN resume test
+# v16.0
+# author: Ian Marang
+#
+# Description:
+# resumes runs over the fixture archive (fixtures/golden/DS082_golden.zip, its downloadFTP
+# checkpointed so nothing is fetched) with ANUClimateAuto_rerun.resumeRuns and checks from
+# the run log and checkpoints which stages ran again:
+# - an end of month run checkpointed up to reFormatMonthOfDays_beta only compiles stable,
+#   loads beta from the observation store and writes the remaining .dat files (the monthly
+#   ones byte for byte against fixtures/expected/)
+# - missed alpha days are all compiled by one compileRange of the newest archive
+# - a checkpointed stage whose .dat file was deleted runs again, and nothing else does
+#
+# usage: cd model_prep; python -m unittest discover tests
+####################################################################################
+
+# import libraries
+import os, sys
+import unittest
+import tempfile
+import shutil
+import warnings
+import pandas as pd
+
+sys.path.insert(0,os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from PyANUClimate_RERUN import ANUClimateAuto_rerun
+
+fixturePath = os.path.join(os.path.dirname(os.path.abspath(__file__)),'fixtures')+'/'
+
+
+class ResumeTest(unittest.TestCase):
+    '''
+    resumeRuns from the stage checkpoints of failed and missed runs of the fixture archive
+    '''
+
+    # end of month run of the fixture archive (months as for test_monthly.py)
+    monthEnd = [('2017_03_29','alpha'),('2017_02','beta'),('2017_03','stable')]
+
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.out = self.tmp+'/dat/'
+        self.auto = ANUClimateAuto_rerun()
+        # read the fixture zip where downloadFTP would leave it, everything written goes to tmp
+        self.auto.destPath = fixturePath
+        self.auto.zipPath = self.tmp+'/unzip/'
+        self.auto.backupPath = self.tmp+'/backup/'
+        self.auto.logPath = self.tmp+'/log/'
+        os.makedirs(self.auto.logPath)
+        # every .dat file to one dir per datastream, pw and fd files go under baseDir
+        self.auto.baseDir = self.out
+        for key,var in self.auto.varDict.items():
+            self.auto.varDict[key] = [var[0],self.out+'alpha/',self.out+'beta_days/',self.out+'stable_days/',self.out+'beta/',self.out+'stable/']
+        for name in ['alpha','beta_days','stable_days','beta','stable']:
+            os.makedirs(self.out+name)
+        for name in ['pw','frst']:
+            for dStream in ['beta','stable']:
+                os.makedirs(self.out+name+'_mth_v2_0/'+dStream+'/dat/bomdat/')
+        self.auto.checkpoint('golden','downloadFTP',0,[self.auto.archiveName('golden')])
+        # compileRange calls, each a parse of an archive
+        self.compiles = []
+        compileRange = self.auto.compileRange
+        def countCompiles(fHandle,dateStreams):
+            self.compiles.append((fHandle,list(dateStreams)))
+            return compileRange(fHandle,dateStreams);
+        self.auto.compileRange = countCompiles
+
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp,True)
+
+
+    def processes(self,fHandle):
+        '''
+        Processes logged for a run, in log order
+
+        args:
+        * fHandle - str of BoM file identifier
+
+        returns:
+        * list of str process names
+        '''
+        df = pd.read_csv(self.auto.logPath+'ANUClimate_log.csv',index_col=[0])
+        return list(df.loc[df.file_handle == fHandle,'process']);
+
+
+    def monthlyFiles(self,dStream,dtStr):
+        '''
+        Monthly .dat files of a datastream month, wherever reFormatMonthly put them
+
+        args:
+        * dStream - str of datastream ('beta' or 'stable')
+        * dtStr - str of month (YYYY_MM)
+
+        returns:
+        * dict of file name:bytes
+        '''
+        paths = [self.out+dStream+'/']+[self.out+x+'_mth_v2_0/'+dStream+'/dat/bomdat/' for x in ['pw','frst']]
+        files = {}
+        for path in paths:
+            for fname in os.listdir(path):
+                if fname.endswith(dtStr+'.dat'):
+                    with open(path+fname,'rb') as f:
+                        files[fname] = f.read()
+        return files;
+
+
+    def expectedFiles(self,dStream,dtStr):
+        path = fixturePath+'expected/'+dStream+'/'
+        files = {}
+        for fname in os.listdir(path):
+            if fname.endswith(dtStr+'.dat'):
+                with open(path+fname,'rb') as f:
+                    files[fname] = f.read()
+        return files;
+
+
+    def test_month_end_partial(self):
+        # the failed run got as far as the beta month of days files
+        df = self.auto.compileLoop('golden','2017_03_29','alpha')[0]
+        self.auto.checkpoint('golden','compileLoop_alpha',0,[self.auto.storeName('2017_03_29','alpha')])
+        self.auto.reFormatDaily(df,'2017_03_29')
+        self.auto.checkpoint('golden','reFormatDaily',0,self.auto.written)
+        df = self.auto.compileLoop('golden','2017_02','beta')[0]
+        self.auto.checkpoint('golden','compileLoop_beta',0,[self.auto.storeName('2017_02','beta')])
+        self.auto.reFormatMonthOfDays(df,'2017_02','beta')
+        self.auto.checkpoint('golden','reFormatMonthOfDays_beta',0,self.auto.written)
+        self.auto.resumeRuns([('golden',self.monthEnd)],'golden')
+        self.assertEqual(self.processes('golden'),['resume','downloadFTP','compileLoop_stable','reFormatMonthly_beta',
+                                                   'reFormatMonthOfDays_stable','reFormatMonthly_stable','run_complete'])
+        # beta came from the observation store, only stable was parsed
+        self.assertEqual(self.compiles,[('golden',[('2017_03','stable')])])
+        self.assertEqual(self.monthlyFiles('beta','2017_02'),self.expectedFiles('beta','2017_02'))
+        self.assertEqual(self.monthlyFiles('stable','2017_03'),self.expectedFiles('stable','2017_03'))
+        self.assertEqual(len(os.listdir(self.out+'stable_days/')),7)
+        self.assertEqual(sorted(self.auto.checkpoints('golden')),['compileLoop_alpha','compileLoop_beta','compileLoop_stable',
+                                                                  'downloadFTP','reFormatDaily','reFormatMonthOfDays_beta',
+                                                                  'reFormatMonthOfDays_stable','reFormatMonthly_beta',
+                                                                  'reFormatMonthly_stable'])
+
+
+    def test_alpha_batch(self):
+        # three missed alpha only days, all inside the newest archive (the fixture's)
+        runs = [('ANUdaily9am3pm20170305Sun',[('2017_03_03','alpha')]),
+                ('ANUdaily9am3pm20170306Mon',[('2017_03_04','alpha')]),
+                ('ANUdaily9am3pm20170307Tue',[('2017_03_05','alpha')])]
+        self.auto.resumeRuns(runs,'golden')
+        # one download (checkpointed) and one parse for all of them
+        self.assertEqual(self.compiles,[('golden',[('2017_03_03','alpha'),('2017_03_04','alpha'),('2017_03_05','alpha')])])
+        for fHandle,dateStreams in runs:
+            self.assertEqual(self.processes(fHandle),['downloadFTP','compileLoop_alpha','reFormatDaily','run_complete'])
+            self.assertEqual(sorted(self.auto.checkpoints(fHandle)),['compileLoop_alpha','reFormatDaily'])
+            self.assertTrue(all(x.endswith(dateStreams[0][0]+'.dat') for x in self.auto.checkpoints(fHandle)['reFormatDaily']))
+        self.assertEqual(len(os.listdir(self.out+'alpha/')),3*len(self.auto.checkpoints(runs[0][0])['reFormatDaily']))
+
+
+    def test_deleted_output(self):
+        self.auto.resumeRuns([('golden',self.monthEnd)],'golden')
+        self.assertEqual(len(self.compiles),1)
+        lost = [x for x in self.auto.checkpoints('golden')['reFormatMonthly_beta'] if os.path.basename(x).startswith('rain_')][0]
+        with open(lost,'rb') as f:
+            want = f.read()
+        os.remove(lost)
+        logged = len(self.processes('golden'))
+        self.assertNotIn('reFormatMonthly_beta',self.auto.checkpoints('golden'))
+        self.auto.resumeRuns([('golden',self.monthEnd)],'golden')
+        # only the stage that lost its file ran again, its df from the observation store
+        self.assertEqual(self.processes('golden')[logged:],['resume','reFormatMonthly_beta','run_complete'])
+        self.assertEqual(len(self.compiles),1)
+        with open(lost,'rb') as f:
+            self.assertEqual(f.read(),want)
+
+
+if __name__ == '__main__':
+    warnings.simplefilter('ignore')
+    unittest.main()
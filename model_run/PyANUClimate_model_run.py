@@ -9,7 +9,6 @@
 # author: Ian Marang
 
 # import libraries
-import pandas as pd
 import numpy as np
 import os,sys
 import time
@@ -17,6 +16,10 @@ import datetime as dt
 import subprocess
 from dateutil.relativedelta import relativedelta
 
+# run log, stage log and metrics helpers (PyANUClimate_log.py, next to this script once deployed or in ../model_prep)
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)),'..','model_prep'))
+from PyANUClimate_log import ANUClimateLog, metricsFor, instrumented, stageOutput, stageLogger, modelColumns
+
 
 # create class object
 class ANUClimate_model_run(object):
@@ -24,6 +27,9 @@ class ANUClimate_model_run(object):
         self.baseDir = '/g/data/rr9/fenner'
         self.scriptPath = '/g/data/rr9/fenner/prerelease/ANUClimate_auto/script/model_runtime'
         self.logPath = '/g/data/rr9/fenner/prerelease/ANUClimate_auto/log'
+        # running instrumented stages (innermost last) and the last one to finish, see PyANUClimate_log.instrumented
+        self.stages = []
+        self.stage = None
         # varDict definition = {variable:[.dat source file location, batch file location, output array location]}
         self.varDict = {'tmax':[self.baseDir+'/prerelease/fenner/tmax_day_v2_0/alpha/dat/bomdat/',self.baseDir+'/prerelease/fenner/tmax_day_v2_0/alpha/batch/',self.baseDir+'aus_tmax_day_v2_0/alpha/']}#,
                         #'tmin':[self.baseDir+'/prerelease/fenner/tmin_day_v2_0/alpha/dat/bomdat/',self.baseDir+'/prerelease/fenner/tmin_day_v2_0/alpha/batch/',self.baseDir+'aus_tmin_day_v2_0/alpha/'],
@@ -36,33 +42,22 @@ class ANUClimate_model_run(object):
 
     def logger(self,currDt,action,tarDt,jobID):
         '''
-        Logger function - creates/maintains a csv log file for all steps in ANUClimate class
+        Logger function - appends a row to the csv log file (PyANUClimate_log.ANUClimateLog) for all steps in ANUClimate class
     
         args:
-        * fHandle - str of BoM file identifier
-        * process - str of ANUClimate_auto step
-        * timing - str (rounded to 4 places) of time in secs for processing
-        * status - end state of process (0 = success, 1 = fail)
+        * currDt - str of date/time of the step
+        * action - str of step (eg the qsub command run)
+        * tarDt - str of target date of the step
+        * jobID - str of PBS job id (or qsub output)
         
         returns:
         nothing
         '''
-        # check if file exists, if not create it
-        if not os.path.isfile(self.logPath+'/ANUClimate_model_run_log.csv'):
-            # create df
-            df = pd.DataFrame({'datetime':[currDt],'process':[action],'target_date':[tarDt],'jobID':[jobID]})
-            # save df to csv
-            df.to_csv(self.logPath+'/ANUClimate_model_run_log.csv',columns=['datetime','process','target_date','jobID'],index=False)
-        # if file exists, open it
-        else:
-            df = pd.read_csv(self.logPath+'/ANUClimate_model_run_log.csv')
-            # create new df and append to existing
-            df1 = pd.DataFrame({'datetime':[currDt],'process':[action],'target_date':[tarDt],'jobID':[jobID]})
-            df = df.append(df1)
-            # save df back to csv
-            df.to_csv(self.logPath+'/ANUClimate_model_run_log.csv',columns=['datetime','process','target_date','jobID'],index=False)
+        # one appended row, the log is never read back or rewritten
+        ANUClimateLog(self.logPath+'/ANUClimate_model_run_log.csv',modelColumns).write({'datetime':currDt,'process':action,'target_date':tarDt,'jobID':jobID})
     
     
+    @instrumented
     def runModel(self,var):
         '''
         Function to see if source files are present, to launch initial run<var> compiled fortran code and to run model batch.  If src files
@@ -90,6 +85,9 @@ class ANUClimate_model_run(object):
         
         # check if source files available
         if os.path.isfile(varDetails[0]+var+'_'+dthyp+'.dat'):
+            # station rows in the source .dat file (one line each)
+            with open(varDetails[0]+var+'_'+dthyp+'.dat','r') as src:
+                stageOutput(self,rowsIn=sum(1 for x in src))
             # move to batch folder for processing run<var> and batch job
             os.chdir(varDetails[1])
             # call subprocess to run '/g/data/rr9/fenner/prerelease/fenner/tmax_day_v2_0/alpha/runtmax YYYY MM DD'
@@ -129,9 +127,17 @@ class ANUClimate_model_run(object):
 if __name__ == '__main__':           
     # create object            
     anm = ANUClimate_model_run()
+    # node_exporter metrics of the runs (anuclimate_model_run.prom)
+    metrics = metricsFor('model_run',anm.logPath)
 
     # iterate over list of vars
     for var,varList in anm.varDict.iteritems():
+        # target date of the run, taken before runModel as it can run past midnight
+        dtNohyp = (dt.datetime.today()-relativedelta(days=2)).strftime('%Y%m%d')
         # process each var
         anm.runModel(var)
+        # wall and cpu time of the run (run<var> and batch submission) to the stage log
+        stageLogger(anm.logPath,'runModel '+var,dtNohyp,anm.stage)
+        # and to the node_exporter metrics
+        metrics.update(metrics.stageValues(anm.stage,{'stage':'runModel','variable':var})+[('anuclimate_run_timestamp_seconds',{'variable':var},time.time())])
 
@@ -2,7 +2,8 @@
 # import libraries
 import numpy as np
 import netCDF4 as nc
-import os
+import os, sys
+import time
 import requests
 import xml.etree.ElementTree as ET
 import gdal
@@ -12,6 +13,12 @@ import pandas as pd
 import decimal
 import subprocess
 
+# log helpers shared with the model run scripts (PyANUClimate_log.py)
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)),'..','model_prep'))
+from PyANUClimate_log import ANUClimateLog, metricsFor, instrumented, stageOutput, stageLogger, modelColumns
+# opt in stage profiling (ANUCLIMATE_PROFILE or --profile)
+from PyANUClimate_profile import profileHooks
+
 
 
 class ANUClimateAutoNetcdf(object):
@@ -30,6 +37,9 @@ class ANUClimateAutoNetcdf(object):
         # auth is a tupe of (username,password)
         self.auth = ('admin','admin')
         self.xmlStore = '/g/data/rr9/IM_PhD/data/Metadata/metadata_dump/'
+        # running instrumented stages (innermost last) and the last one to finish, see PyANUClimate_log.instrumented
+        self.stages = []
+        self.stage = None
         
         for var, varDetails in self.varDict.iteritems():
             try:
@@ -41,31 +51,19 @@ class ANUClimateAutoNetcdf(object):
     
     def logger(self,currDt,action,tarDt,jobID):
         '''
-        Logger function - creates/maintains a csv log file for all steps in ANUClimate class
+        Logger function - appends a row to the csv log file (PyANUClimate_log.ANUClimateLog) for all steps in ANUClimate class
     
         args:
-        * fHandle - str of BoM file identifier
-        * process - str of ANUClimate_auto step
-        * timing - str (rounded to 4 places) of time in secs for processing
-        * status - end state of process (0 = success, 1 = fail)
+        * currDt - str of date/time of the step
+        * action - str of step (eg the qsub command run)
+        * tarDt - str of target date of the step
+        * jobID - str of PBS job id (or qsub output)
         
         returns:
         nothing
         '''
-        # check if file exists, if not create it
-        if not os.path.isfile(self.logPath+'/ANUClimate_model_run_log.csv'):
-            # create df
-            df = pd.DataFrame({'datetime':[currDt],'process':[action],'target_date':[tarDt],'jobID':[jobID]})
-            # save df to csv
-            df.to_csv(self.logPath+'/ANUClimate_model_run_log.csv',columns=['datetime','process','target_date','jobID'],index=False)
-        # if file exists, open it
-        else:
-            df = pd.read_csv(self.logPath+'/ANUClimate_model_run_log.csv')
-            # create new df and append to existing
-            df1 = pd.DataFrame({'datetime':[currDt],'process':[action],'target_date':[tarDt],'jobID':[jobID]})
-            df = df.append(df1)
-            # save df back to csv
-            df.to_csv(self.logPath+'/ANUClimate_model_run_log.csv',columns=['datetime','process','target_date','jobID'],index=False)
+        # one appended row, the log is never read back or rewritten
+        ANUClimateLog(self.logPath+'/ANUClimate_model_run_log.csv',modelColumns).write({'datetime':currDt,'process':action,'target_date':tarDt,'jobID':jobID})
 
 
     def getMeta(self,dataset,uuid):
@@ -109,6 +107,7 @@ class ANUClimateAutoNetcdf(object):
 
         return xmlList;
     
+    @instrumented
     def make_nc(self,
                 outfile=None,
                 data=None,
@@ -205,6 +204,8 @@ class ANUClimateAutoNetcdf(object):
         # Close the file
         print 'Congratulations, your netCDF file is baked! See:', outfile
         ncds.close()
+        # grid rows (lat lines of each time step) read and written
+        stageOutput(self,rowsIn=data.size//loni.shape[0],rowsOut=data.size//loni.shape[0],files=[os.path.abspath(outfile)])
         # Report back
         
     def getLatLon(self,extents):
@@ -270,10 +271,16 @@ dtToday = dt.datetime.today().strftime('%Y%m%d%H%M')
 
 
 anc = ANUClimateAutoNetcdf()
+# node_exporter metrics of the netcdf output (anuclimate_nc.prom)
+metrics = metricsFor('nc',anc.logPath)
+# profile the stages named by ANUCLIMATE_PROFILE or --profile (eg 'make_nc,getSpatialExtents'), off by default
+profileHooks([ANUClimateAutoNetcdf],anc.logPath,'PyANUClimate_nc')
 dtYr = dt.datetime.today().isoformat()[:4]
 for var, varDetails in anc.varDict.iteritems():
     targetDir = anc.baseDir+'/'+varDetails[0]+'/alpha/'+dtYr+'/'
     os.chdir(targetDir)
+    # netcdf files, bytes and make_nc secs of the variable for the node_exporter metrics
+    ncFiles,ncBytes,ncSecs = 0,0,0.
     # check processed files to see if output array nc file already generated
     doneDtBit = [x.split('_')[-1][:-3] for x in os.listdir(anc.baseDir+'prerelease/ANUClimate_auto/script/nc_output/'+varDetails[1])]
     for fname in os.listdir('.'):
@@ -336,11 +343,19 @@ for var, varDetails in anc.varDict.iteritems():
                 os.chdir(anc.baseDir+'/prerelease/ANUClimate_auto/script/nc_output/'+varDetails[1])
                 # call the make_nc function to create the netcdf file
                 anc.make_nc(outfile=correctName,data=data,lati=lat,loni=lon,timei=fileTime,header=head,nodata=-999.,metadata=metadata)
+                # wall and cpu time, rows and bytes of the netcdf file to the stage log
+                stageLogger(anc.logPath,'make_nc '+correctName,dtBit,anc.stage)
+                ncFiles += 1
+                ncBytes += anc.stage.bytesWritten
+                ncSecs += anc.stage.wallSecs
             else:
                 pass
+    metrics.update([('anuclimate_nc_files_written',{'variable':var},ncFiles),('anuclimate_nc_bytes_written',{'variable':var},ncBytes),
+                      ('anuclimate_nc_seconds',{'variable':var},ncSecs)])
 
 # add log entry for today's model nc output
 anc.logger(dtToday,'completed ANUClimate_nc_output.sh','na','na')                
+metrics.update([('anuclimate_run_timestamp_seconds',{},time.time())])
 # call subprocess for next day resubmission
 os.chdir(anc.baseDir+'/prerelease/ANUClimate_auto/script/nc_output/')
 p = subprocess.Popen(['qsub -a '+dtNextday+' ANUClimate_nc_output.sh'],shell=True,stdout=subprocess.PIPE,stderr=subprocess.STDOUT)
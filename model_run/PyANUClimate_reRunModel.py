@@ -1,6 +1,5 @@
 # final rerun script
 # import libraries
-import pandas as pd
 import numpy as np
 import os,sys
 import time
@@ -9,11 +8,18 @@ import subprocess
 from dateutil.relativedelta import relativedelta
 import fnmatch as fn
 
+# same log helpers as PyANUClimate_model_run.py
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)),'..','model_prep'))
+from PyANUClimate_log import ANUClimateLog, metricsFor, instrumented, stageOutput, stageLogger, modelColumns
+
 class ANUClimate_reRunModel(object):
     def __init__(self):
         self.baseDir = '/g/data/rr9/fenner'
         self.scriptPath = self.baseDir+'/prerelease/ANUClimate_auto/script'
         self.logPath = self.baseDir+'/prerelease/ANUClimate_auto/log'
+        # running instrumented stages (innermost last) and the last one to finish, see PyANUClimate_log.instrumented
+        self.stages = []
+        self.stage = None
         # varDict definition = {variable:[.dat source file location, batch file location, output array location]}
         self.varDict = {'tmax':[self.baseDir+'/prerelease/fenner/tmax_day_v2_0/alpha/dat/bomdat/',self.baseDir+'/prerelease/fenner/tmax_day_v2_0/alpha/batch/',self.baseDir+'/aus_tmax_day_v2_0/alpha/']}#,
                         #'tmin':[self.baseDir+'/prerelease/fenner/tmin_day_v2_0/alpha/dat/bomdat/',self.baseDir+'/prerelease/fenner/tmin_day_v2_0/alpha/batch/',self.baseDir+'aus_tmin_day_v2_0/alpha/'],
@@ -26,31 +32,19 @@ class ANUClimate_reRunModel(object):
 
     def logger(self,currDt,action,tarDt,jobID):
         '''
-        Logger function - creates/maintains a csv log file for all steps in ANUClimate class
+        Logger function - appends a row to the csv log file (PyANUClimate_log.ANUClimateLog) for all steps in ANUClimate class
     
         args:
-        * fHandle - str of BoM file identifier
-        * process - str of ANUClimate_auto step
-        * timing - str (rounded to 4 places) of time in secs for processing
-        * status - end state of process (0 = success, 1 = fail)
+        * currDt - str of date/time of the step
+        * action - str of step (eg the qsub command run)
+        * tarDt - str of target date of the step
+        * jobID - str of PBS job id (or qsub output)
         
         returns:
         nothing
         '''
-        # check if file exists, if not create it
-        if not os.path.isfile(self.logPath+'/ANUClimate_model_run_log.csv'):
-            # create df
-            df = pd.DataFrame({'datetime':[currDt],'process':[action],'target_date':[tarDt],'jobID':[jobID]})
-            # save df to csv
-            df.to_csv(self.logPath+'/ANUClimate_model_run_log.csv',columns=['datetime','process','target_date','jobID'],index=False)
-        # if file exists, open it
-        else:
-            df = pd.read_csv(self.logPath+'/ANUClimate_model_run_log.csv')
-            # create new df and append to existing
-            df1 = pd.DataFrame({'datetime':[currDt],'process':[action],'target_date':[tarDt],'jobID':[jobID]})
-            df = df.append(df1)
-            # save df back to csv
-            df.to_csv(self.logPath+'/ANUClimate_model_run_log.csv',columns=['datetime','process','target_date','jobID'],index=False)
+        # one appended row, the log is never read back or rewritten
+        ANUClimateLog(self.logPath+'/ANUClimate_model_run_log.csv',modelColumns).write({'datetime':currDt,'process':action,'target_date':tarDt,'jobID':jobID})
 
 
     # function
@@ -69,6 +63,7 @@ class ANUClimate_reRunModel(object):
         missing = sorted(date_set - set(dateL))
         return missing;
 
+    @instrumented
     def reRun(self,var):
         '''
         Function to check if any output arrays are missing, then checking if these missing dates have source files,
@@ -109,6 +104,9 @@ class ANUClimate_reRunModel(object):
                 srcFileDate = dt.datetime(int(srcFile.split('_')[1]),int(srcFile.split('_')[2]),int(srcFile.split('_')[-1][:-4]))
                 # check if in missingList
                 if srcFileDate in missingList:
+                    # station rows in the source .dat file (one line each)
+                    with open(varDetails[0]+srcFile,'r') as src:
+                        stageOutput(self,rowsIn=sum(1 for x in src))
                     # create datevars from identified srcFiles
                     srcYr,srcMt,srcDy = srcFileDate.isoformat().split('T')[0].split('-')[0],srcFileDate.isoformat().split('T')[0].split('-')[1],srcFileDate.isoformat().split('T')[0].split('-')[-1]
                     # call subprocess to run '/g/data/rr9/fenner/prerelease/fenner/tmax_day_v2_0/alpha/runtmax YYYY MM DD'
@@ -145,7 +143,13 @@ class ANUClimate_reRunModel(object):
 if __name__ == '__main__':
     # create object
     anm = ANUClimate_reRunModel()
+    # node_exporter metrics of the reruns (anuclimate_model_rerun.prom)
+    metrics = metricsFor('model_rerun',anm.logPath)
     # iterate over varDict to process each var
     for var in anm.varDict:
         # call reRun function for each var
         anm.reRun(var)
+        # wall and cpu time of the rerun to the stage log
+        stageLogger(anm.logPath,'reRun '+var,'na',anm.stage)
+        # and to the node_exporter metrics
+        metrics.update(metrics.stageValues(anm.stage,{'stage':'reRun','variable':var})+[('anuclimate_run_timestamp_seconds',{'variable':var},time.time())])